@@ -0,0 +1,94 @@
+# End-to-end check of the Taco Bell spider against the local stand-in.
+#
+#     python benchmarks/crawl_check.py
+#     python benchmarks/crawl_check.py -s SELENIUM_HTTP_FIRST=False -s SELENIUM_DRIVER_PATH=/usr/bin/chromedriver
+#
+# Starts the stand-in (benchmarks/standin.py) on a free port, runs
+# `scrapy crawl tacobell_spider` against it with every output file in a
+# temporary directory, and fails (exit status 1) when the crawl errors out or
+# yields fewer category items than the stand-in has categories. A crawl that
+# yields nothing is a failure, whatever the exit status of scrapy.
+#
+# The check turns on SELENIUM_HTTP_FIRST, whose pages the stand-in's embedded
+# data satisfies without a browser; -s settings are passed on to scrapy after
+# it, e.g. to force renders with a real chromedriver.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+PROJECT_DIR = os.path.join(ROOT, 'tacobellpy')
+sys.path.insert(0, HERE)
+
+from standin import StandInSite, make_server  # noqa: E402
+
+
+def crawl(base_url, workdir, extra_settings=(), timeout=600):
+    # Runs the crawl, returns (exit status, items, log)
+    out = os.path.join(workdir, 'items.jsonl')
+    settings = {
+        'TACOBELL_BASE_URL': base_url,
+        'TACOBELL_CATALOG_PATH': os.path.join(workdir, 'catalog.jsonl'),
+        'TACOBELL_SNAPSHOT_PATH': os.path.join(workdir, 'snapshot.sqlite'),
+        'TACOBELL_CHANGES_PATH': os.path.join(workdir, 'changes.jsonl'),
+        'TIMING_PROMETHEUS_FILE': os.path.join(workdir, 'metrics.prom'),
+        'SELENIUM_HTTP_FIRST': 'True',
+        'SELENIUM_CACHE_ENABLED': 'False',
+        'SELENIUM_CACHE_DIR': os.path.join(workdir, 'pagecache'),
+        'SELENIUM_PROFILES_DIR': os.path.join(workdir, 'profiles'),
+        # The driver is only started by a render; any existing file passes the check at start
+        'SELENIUM_DRIVER_PATH': sys.executable,
+        'LOG_LEVEL': 'INFO',
+    }
+    command = [sys.executable, '-m', 'scrapy', 'crawl', 'tacobell_spider', '-O', f'{out}:jsonlines']
+    for name, value in settings.items():
+        command += ['-s', f'{name}={value}']
+    for setting in extra_settings:
+        command += ['-s', setting]
+    result = subprocess.run(command, cwd=PROJECT_DIR, capture_output=True, text=True, timeout=timeout)
+    items = []
+    if os.path.exists(out):
+        with open(out, encoding='utf-8') as f:
+            items = [json.loads(line) for line in f if line.strip()]
+    return result.returncode, items, result.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl the local stand-in and check the spider yields its menu')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='scrapy setting for the crawl (repeatable)')
+    parser.add_argument('--categories', type=int, default=4)
+    parser.add_argument('--products', type=int, default=6, help='products per category')
+    parser.add_argument('--timeout', type=int, default=600, help='seconds the crawl may take')
+    args = parser.parse_args(argv)
+
+    site = StandInSite(categories=args.categories, products=args.products)
+    server = make_server(site, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        with tempfile.TemporaryDirectory(prefix='tacobell-check-') as workdir:
+            status, items, log = crawl(base_url, workdir, args.settings, args.timeout)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    products = sum(len(item.get('Menu') or ()) for item in items)
+    errors = [line for line in log.splitlines() if ' ERROR: ' in line or line.startswith('Traceback')]
+    print(f'{len(items)} category items, {products} products, {len(errors)} error lines, exit status {status}')
+    for line in errors[:20]:
+        print(f'  {line}')
+    if status != 0 or errors or len(items) < len(site.categories):
+        print(f'FAILED: expected {len(site.categories)} category items from {base_url}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# Inputs for the benchmarks, built from the recorded fixtures of both projects.
+
+import copy
+import json
+import os
+
+from scrapy.http import HtmlResponse, Request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TACOBELL_DIR = os.path.join(ROOT, 'tacobellpy', 'tacobellpy')
+UBEREATS_DIR = os.path.join(ROOT, 'ubereats', 'ubereats')
+
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+
+def _load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def category_page_response():
+    # The recorded /food/new category page, as parse_item receives it
+    with open(os.path.join(TACOBELL_DIR, 'debug_page_source.html'), 'rb') as f:
+        body = f.read()
+    url = 'https://www.tacobell.com/food/new'
+    request = Request(url, meta={'name': 'new', 'item_name': 'New'})
+    return HtmlResponse(url=url, body=body, encoding='utf-8', request=request)
+
+
+def detail_page_body(options):
+    # No product page was recorded, so one is rebuilt from the options of a
+    # recorded product, with the markup parse_details reads and the same
+    # options in the page's embedded data (see embedded.map_details)
+    cards = []
+    sections = {}
+    for i, option in enumerate(options):
+        group = f'Group {i // 8 + 1}'
+        price = f'+{option["price"]}' if option.get('price') else ''
+        cards.append(
+            '<div class="styles_interactive__3pQZP styles_flex-card__-Gb6u">'
+            f'<h3 class="styles_customize-section-title__3Pb4I">{group}</h3>'
+            f'<img class="styles_image__3bMG2" src="{option.get("image_url") or ""}"/>'
+            f'<span class="styles_name__3-08P styles_text-shadow__OtfIt">{option["name"]}</span>'
+            '<span class="styles_price-and-calories__13gpI">'
+            f'<span>{price}</span><span>10 Cal</span></span>'
+            '</div>'
+        )
+        embedded = {'name': option['name'], 'images': [{'format': '269x269', 'url': option.get('image_url') or ''}]}
+        if price:
+            embedded['price'] = {'formattedValue': price}
+        sections.setdefault(group, []).append(embedded)
+    next_data = json.dumps({'props': {'pageProps': {'product': {
+        'customizations': [{'title': title, 'options': section} for title, section in sections.items()]}}}})
+    next_data = next_data.replace('</', '<\\/')
+    return (f'<html><body><main>{"".join(cards)}</main>'
+            f'<script id="__NEXT_DATA__" type="application/json">{next_data}</script>'
+            '</body></html>').encode('utf-8')
+
+
+def detail_page_response(category, param, options):
+    url = f'https://www.tacobell.com/food/{category}/{param}'
+    request = Request(url, meta={'product_url': url, 'item_name': category})
+    return HtmlResponse(url=url, body=detail_page_body(options), encoding='utf-8', request=request)
+
+
+def detail_page_responses():
+    # One product page per recorded Taco Bell product with options
+    responses = []
+    for category in _load_json(os.path.join(TACOBELL_DIR, 'tacobell.json')):
+        for product in category['products']:
+            if not product.get('details'):
+                continue
+            responses.append(detail_page_response(category['name'], len(responses), product['details']))
+    return responses
+
+
+def first_product_details():
+    # The options of the first recorded Taco Bell product that has some
+    for category in _load_json(os.path.join(TACOBELL_DIR, 'tacobell.json')):
+        for product in category['products']:
+            if product.get('details'):
+                return product['details']
+    return []
+
+
+def ubereats_restaurant():
+    return _load_json(os.path.join(UBEREATS_DIR, 'ubereats_data.json'))['data']
+
+
+def scaled_has_menu(restaurant, scale):
+    # The recorded menu as the JSON-LD hasMenu structure parse_menu reads,
+    # with every section repeated `scale` times under unique names
+    sections = []
+    for copy_number in range(scale):
+        suffix = f' #{copy_number}' if copy_number else ''
+        for category in restaurant['categories']:
+            sections.append({
+                '@type': 'MenuSection',
+                'name': category['title'] + suffix,
+                'hasMenuItem': [
+                    {
+                        '@type': item['type'],
+                        '@id': f"{item['name']}{suffix}",
+                        'name': item['name'] + suffix,
+                        'description': item['description'],
+                        'offers': {'@type': 'Offer', 'price': item['price'], 'priceCurrency': 'USD'},
+                    }
+                    for item in category['menu']
+                ],
+            })
+    return {'@type': 'Menu', 'hasMenuSection': sections}
+
+
+def scaled_item_details(restaurant, scale):
+    # What collect_item_details returns for the scaled menu, one entry per item
+    details = []
+    for copy_number in range(scale):
+        suffix = f' #{copy_number}' if copy_number else ''
+        for category in restaurant['categories']:
+            for item in category['menu']:
+                groups = item['ingredientsGroups'] or []
+                details.append({
+                    'item_name': item['name'] + suffix,
+                    'image_url': item['image_url'],
+                    'item_details': copy.deepcopy(groups),
+                })
+    return details
+
+
+def scaled_opening_hours(scale):
+    # 7 * scale openingHoursSpecification entries, as lists and single days
+    hours = []
+    for i in range(scale):
+        for j, day in enumerate(DAYS):
+            hours.append({
+                '@type': 'OpeningHoursSpecification',
+                'dayOfWeek': [day] if (i + j) % 2 else day,
+                'opens': f'{(i + j) % 12 + 6}:30',
+                'closes': '21' if j % 3 else '20:00',
+            })
+    return hours
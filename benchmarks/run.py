@@ -0,0 +1,373 @@
+# Offline benchmarks of the parse code of both spiders.
+#
+#     python benchmarks/run.py                  # run and compare to baselines.json
+#     python benchmarks/run.py --save           # store the results as the new baselines
+#     python benchmarks/run.py -k ubereats --scales 10,100
+#
+# Every benchmark reports throughput (units per second, best of --repeat runs)
+# and the peak memory allocated during one run (tracemalloc). A result whose
+# throughput dropped, or whose peak memory grew, by more than --threshold
+# against its baseline is flagged, and the exit status is 1.
+#
+# Before that, the parity checks make sure the faster code paths produce what
+# the ones they replaced did: the registry card extraction the per-field
+# Selector one, the HTTP-first embedded data the rendered markup, and the
+# exporters' ItemEncoder json.dumps() of to_dict().
+#
+# Baselines only mean something on the machine that recorded them, so record
+# them with --save on the machine that runs the comparisons.
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [HERE, os.path.join(ROOT, 'tacobellpy'), os.path.join(ROOT, 'ubereats')]
+
+import fixtures  # noqa: E402
+from tacobellpy.embedded import extract_payloads, map_details, map_products  # noqa: E402
+from tacobellpy.exporters import ItemEncoder as TacoBellEncoder  # noqa: E402
+from tacobellpy.items import Category, Option, Product  # noqa: E402
+from tacobellpy.spiders.tacobell_spider import TacoBellSpider  # noqa: E402
+from tacobellpy.xpaths import TACOBELL, Many  # noqa: E402
+from ubereats.exporters import ItemEncoder as UberEatsEncoder  # noqa: E402
+from ubereats.items import Restaurant  # noqa: E402
+from ubereats.spiders.ubereats_spider import UberEatsSpider  # noqa: E402
+
+BASELINES_PATH = os.path.join(HERE, 'baselines.json')
+# Peak memory growth below this is noise, whatever the relative change
+MEMORY_SLACK_KIB = 64
+
+
+def ubereats_spider():
+    # The browser is only launched when a store is opened, which never happens here
+    return UberEatsSpider()
+
+
+# Each benchmark returns (prepare, run, units): prepare() builds the arguments
+# of one run outside the timed section, run(*args) is what gets measured.
+
+def bench_tacobell_parse_item(scale):
+    spider = TacoBellSpider()
+    response = fixtures.category_page_response()
+    units = len(response.xpath('//div[contains(@class, "styles_card__1DpUa styles_product-card__1-cAT")]'))
+
+    def reset():
+        # Every pass parses the page as a first listing: no product of it seen yet
+        spider.processed_product_urls.clear()
+        spider.listed_categories.clear()
+        spider.emitted_categories.clear()
+        spider.pending_products.clear()
+        spider.products_by_dynamic_value['new'] = []
+        spider.pending_details['new'] = 0
+
+    def run():
+        for _ in range(scale):
+            reset()
+            list(spider.parse_item(response))
+
+    return (lambda: ()), run, units * scale
+
+
+def bench_tacobell_parse_details(scale):
+    spider = TacoBellSpider()
+    responses = fixtures.detail_page_responses()
+    options = sum(len(r.xpath('//div[contains(@class, "styles_flex-card__-Gb6u")]')) for r in responses)
+
+    def pending():
+        spider.pending_details['bench'] = len(responses)
+        for response in responses:
+            spider.pending_products[response.meta['product_url']] = ('bench', Product('bench'))
+
+    def run():
+        for _ in range(scale):
+            pending()
+            for response in responses:
+                list(spider.parse_details(response))
+
+    return (lambda: ()), run, options * scale
+
+
+# Card extraction, per-field Selector .xpath().get() against the compiled
+# registry. check_card_parity() makes sure both read the same values.
+
+CARD_PAGES = [
+    # record, list expression, pages
+    ('product_card', 'product_cards', lambda: [fixtures.category_page_response()]),
+    ('option_card', 'option_cards', fixtures.detail_page_responses),
+]
+
+
+def selector_record(record, item):
+    # The per-field extraction the spider did before the registry
+    return {field: item.xpath(expression).getall() if isinstance(expression, Many) else item.xpath(expression).get()
+            for field, expression in TACOBELL.record_expressions[record].items()}
+
+
+def selector_cards(record, cards, responses):
+    return [selector_record(record, item) for response in responses
+            for item in response.xpath(TACOBELL.expressions[cards])]
+
+
+def registry_cards(record, cards, responses):
+    return [TACOBELL.record(record, item) for response in responses
+            for item in TACOBELL.nodes(cards, TACOBELL.root(response))]
+
+
+def check_card_parity():
+    for record, cards, pages in CARD_PAGES:
+        responses = pages()
+        expected, actual = selector_cards(record, cards, responses), registry_cards(record, cards, responses)
+        if expected != actual:
+            raise AssertionError(f'Registry extraction of {record} differs from the Selector one')
+
+
+def embedded_product_cards(response):
+    # The cards the spider reads from the page's markup and from its embedded
+    # data, as parse_item uses them
+    spider = TacoBellSpider()
+
+    def fields(card):
+        return (card['name'], ''.join(card['price']).replace('$', '').strip(), card['description'],
+                card['image_url'], card['param'])
+
+    markup = [spider.extract_product_card(item) for item in TACOBELL.nodes('product_cards', TACOBELL.root(response))]
+    return list(map(fields, markup)), list(map(fields, map_products(extract_payloads(response)) or []))
+
+
+def check_embedded_parity():
+    # HTTP-first pages must give parse_item and parse_details what the
+    # rendered markup does: the recorded category page, and the product pages
+    # rebuilt from recorded options (no product page was recorded)
+    markup, embedded = embedded_product_cards(fixtures.category_page_response())
+    matching = sum(a == b for a, b in zip(markup, embedded))
+    if not markup or matching != len(markup) or len(embedded) != len(markup):
+        raise AssertionError(f'Embedded product cards match the markup for {matching}/{len(markup)} cards '
+                             f'({len(embedded)} mapped)')
+
+    spider = TacoBellSpider()
+    responses = fixtures.detail_page_responses()
+    # One product's options without prices, which the markup reads as ''
+    stripped = [{'name': option['name'], 'image_url': option.get('image_url')} for option in
+                fixtures.first_product_details()]
+    responses.append(fixtures.detail_page_response('bench', 'no-prices', stripped))
+    pages = 0
+    for response in responses:
+        embedded = [Option.from_dict(option) for option in map_details(extract_payloads(response)) or []]
+        pages += embedded == spider.extract_ingredient_details(response)
+    if pages != len(responses):
+        raise AssertionError(f'Embedded product details match the markup on {pages}/{len(responses)} pages')
+
+
+def check_encoder_parity():
+    # Items as the spiders build them from the recorded pages
+    spider = TacoBellSpider()
+    options = [option for response in fixtures.detail_page_responses()
+               for option in spider.extract_ingredient_details(response)]
+    products = []
+    for item in TACOBELL.nodes('product_cards', TACOBELL.root(fixtures.category_page_response())):
+        card = spider.extract_product_card(item)
+        products.append(Product.from_dict({
+            'name': card['name'], 'price': ''.join(card['price']).replace('$', '').strip(),
+            'description': card['description'], 'image_url': card['image_url'],
+            'Ingredients details': [option.to_dict() for option in options]}))
+    items = [Category('bench', products, 'store'), Category('bench', products[:1], streamed=True)]
+
+    ubereats = ubereats_spider()
+    restaurant = fixtures.ubereats_restaurant()
+    index = ubereats.new_menu_index()
+    menu = ubereats.parse_menu(fixtures.scaled_has_menu(restaurant, 1), index)
+    for details in fixtures.scaled_item_details(restaurant, 1):
+        if details:
+            menu = ubereats.append_item_details_to_menu(menu, details, index)
+    items.append(Restaurant('https://example.com/store', 'bench', menu))
+
+    for item in items:
+        encoder = TacoBellEncoder() if isinstance(item, Category) else UberEatsEncoder()
+        for ensure_ascii in (False, True):
+            encoder = type(encoder)(ensure_ascii=ensure_ascii)
+            if encoder.encode(item) != json.dumps(item.to_dict(), ensure_ascii=ensure_ascii):
+                raise AssertionError(f'ItemEncoder output of {type(item).__name__} differs from json.dumps()')
+
+
+def bench_card_extraction(extract):
+    def bench(scale):
+        pages = [(record, cards, pages()) for record, cards, pages in CARD_PAGES]
+        units = sum(len(TACOBELL.nodes(cards, TACOBELL.root(r))) for _, cards, responses in pages for r in responses)
+
+        def run():
+            for _ in range(scale):
+                for record, cards, responses in pages:
+                    extract(record, cards, responses)
+
+        return (lambda: ()), run, units * scale
+    return bench
+
+
+def bench_ubereats_parse_menu(scale):
+    spider = ubereats_spider()
+    has_menu = fixtures.scaled_has_menu(fixtures.ubereats_restaurant(), scale)
+    units = sum(len(section['hasMenuItem']) for section in has_menu['hasMenuSection'])
+
+    def run():
+        spider.parse_menu(has_menu, spider.new_menu_index())
+
+    return (lambda: ()), run, units
+
+
+def bench_ubereats_parse_opening_hours(scale):
+    spider = ubereats_spider()
+    hours = fixtures.scaled_opening_hours(scale)
+
+    def run():
+        spider.parse_opening_hours(hours)
+
+    return (lambda: ()), run, len(hours)
+
+
+def bench_ubereats_append_item_details(scale):
+    spider = ubereats_spider()
+    restaurant = fixtures.ubereats_restaurant()
+    has_menu = fixtures.scaled_has_menu(restaurant, scale)
+    item_details = fixtures.scaled_item_details(restaurant, scale)
+
+    def prepare():
+        index = spider.new_menu_index()
+        return spider.parse_menu(has_menu, index), index
+
+    def run(menu, index):
+        for details in item_details:
+            if details:
+                menu = spider.append_item_details_to_menu(menu, details, index)
+
+    return prepare, run, len(item_details)
+
+
+BENCHMARKS = [
+    # name, function, default scales
+    # (the Taco Bell scale is the number of passes over the recorded pages)
+    ('tacobell.parse_item', bench_tacobell_parse_item, [20]),
+    ('tacobell.parse_details', bench_tacobell_parse_details, [5]),
+    ('tacobell.cards.selector', bench_card_extraction(selector_cards), [5]),
+    ('tacobell.cards.registry', bench_card_extraction(registry_cards), [5]),
+    ('ubereats.parse_menu', bench_ubereats_parse_menu, [10, 100, 1000]),
+    ('ubereats.parse_opening_hours', bench_ubereats_parse_opening_hours, [10, 100, 1000]),
+    ('ubereats.append_item_details_to_menu', bench_ubereats_append_item_details, [10, 100, 1000]),
+]
+
+
+def measure(prepare, run, units, repeat):
+    run(*prepare())  # Warm-up: imports, lxml and regex caches
+    times = []
+    for _ in range(repeat):
+        args = prepare()
+        gc.collect()
+        gc.disable()  # As timeit does, collections land in random runs
+        try:
+            start = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    # Memory in a separate run, tracemalloc slows everything down
+    args = prepare()
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {'units': units, 'seconds': best, 'throughput': units / best if best else float('inf'),
+            'peak_kib': peak / 1024}
+
+
+def compare(result, baseline, threshold):
+    # Relative changes and whether either is a regression
+    throughput_change = result['throughput'] / baseline['throughput'] - 1
+    memory_change = result['peak_kib'] / baseline['peak_kib'] - 1 if baseline['peak_kib'] else 0.0
+    memory_growth = result['peak_kib'] - baseline['peak_kib']
+    regressed = throughput_change < -threshold or (memory_change > threshold and memory_growth > MEMORY_SLACK_KIB)
+    return throughput_change, memory_change, regressed
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('results', {})
+
+
+def save_baselines(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline parse benchmarks')
+    parser.add_argument('-k', dest='filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--scales', help='comma separated scales for the ubereats menus (default 10,100,1000)')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression (0.25 = 25%%)')
+    parser.add_argument('--baselines', default=BASELINES_PATH)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baselines')
+    args = parser.parse_args(argv)
+
+    # The callbacks log every product and option
+    logging.disable(logging.WARNING)
+
+    if 'tacobell' in args.filter or not args.filter:
+        check_card_parity()
+        check_embedded_parity()
+    check_encoder_parity()
+
+    baselines = load_baselines(args.baselines)
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<45} {'units/s':>12} {'seconds':>9} {'peak KiB':>10}  vs baseline")
+    for name, function, default_scales in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        scales = default_scales
+        if args.scales and name.startswith('ubereats.'):
+            scales = [int(scale) for scale in args.scales.split(',')]
+        for scale in scales:
+            key = f'{name}[{scale}x]'
+            result = measure(*function(scale), repeat=args.repeat)
+            results[key] = result
+
+            note = 'no baseline'
+            if key in baselines:
+                throughput_change, memory_change, regressed = compare(result, baselines[key], args.threshold)
+                note = f'throughput {throughput_change:+.0%}, memory {memory_change:+.0%}'
+                if regressed:
+                    note += '  REGRESSION'
+                    regressions.append(key)
+            print(f"{key:<45} {result['throughput']:>12,.0f} {result['seconds']:>9.4f} "
+                  f"{result['peak_kib']:>10,.0f}  {note}")
+
+    if args.save:
+        merged = dict(baselines, **results)
+        save_baselines(args.baselines, merged)
+        print(f'Baselines saved to {args.baselines}')
+    elif regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
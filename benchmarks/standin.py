@@ -0,0 +1,435 @@
+# Local stand-in for tacobell.com and ubereats.com, for end-to-end crawls.
+#
+#     python benchmarks/standin.py --port 8800 --latency 0.2 --lazy-ms 150
+#     scrapy crawl tacobell_spider -s TACOBELL_BASE_URL=http://127.0.0.1:8800
+#     scrapy crawl ubereat_spider -s UBEREATS_BASE_URL=http://127.0.0.1:8800 \
+#         -s UBEREATS_STORES_FILE=stores.txt
+#
+# Pages are generated from a seed and carry the markup and embedded data the
+# spiders read:
+#
+#     /food                          category cards + __NEXT_DATA__
+#     /food/{category}               product cards + __NEXT_DATA__
+#     /food/{category}/{product}     customization cards + __NEXT_DATA__
+#     (?store=<id> picks one of --menu-variants price lists)
+#     /store/{slug}/{uuid}           JSON-LD restaurant, items loaded from getStoreV1
+#     /store/{slug}/{uuid}/item/{id} item page with a dismissable dialog
+#     POST /_p/api/getStoreV1, POST /_p/api/getMenuItemV1
+#     /stores.txt                    every store URL, one per line
+#
+# Every response waits --latency seconds (plus up to --jitter). With --lazy-ms
+# the cards and store items are only added to the DOM by script, a batch at a
+# time, as on the real sites.
+
+import argparse
+import html
+import json
+import random
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GROUP_NAMES = ['Add', 'Remove', 'Sauces', 'Proteins', 'Toppings', 'Extras']
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+# Moves the children of <template id="lazy"> into #lazy-target, a batch every
+# `delay` ms
+LAZY_JS = """
+(function () {
+    var source = document.getElementById('lazy'), target = document.getElementById('lazy-target');
+    var nodes = Array.prototype.slice.call(source.content.children), delay = %d;
+    function step() {
+        nodes.splice(0, 4).forEach(function (node) { target.appendChild(node); });
+        if (nodes.length) { setTimeout(step, delay); }
+    }
+    setTimeout(step, delay);
+})();
+"""
+
+# Loads the catalog like the real store page does, so it shows up in the
+# performance log, then renders the items (lazily with a delay)
+STORE_JS = """
+(function () {
+    var storeUuid = %s, delay = %d, list = document.getElementById('store-items');
+    fetch('/_p/api/getStoreV1', {method: 'POST', headers: {'Content-Type': 'application/json'},
+                                 body: JSON.stringify({storeUuid: storeUuid})})
+        .then(function (r) { return r.json(); })
+        .then(function (body) {
+            var items = [];
+            Object.keys(body.data.catalogSectionsMap).forEach(function (key) {
+                body.data.catalogSectionsMap[key].forEach(function (section) {
+                    items = items.concat(section.payload.standardItemsPayload.catalogItems);
+                });
+            });
+            function step() {
+                items.splice(0, delay ? 6 : items.length).forEach(function (item) {
+                    var li = document.createElement('li');
+                    li.setAttribute('data-test', 'store-item-' + item.uuid);
+                    var a = document.createElement('a');
+                    a.href = location.pathname + '/item/' + item.uuid;
+                    a.textContent = item.title;
+                    li.appendChild(a);
+                    list.appendChild(li);
+                });
+                if (items.length) { setTimeout(step, delay); }
+            }
+            setTimeout(step, delay);
+        });
+})();
+"""
+
+
+def _e(text):
+    return html.escape(str(text), quote=True)
+
+
+def _script_json(data):
+    # Script content is raw text: only '</' has to be kept out of it
+    return json.dumps(data).replace('</', '<\\/')
+
+
+def _next_data(page_props):
+    data = {'props': {'pageProps': page_props}, 'page': '/food', 'query': {}}
+    return f'<script id="__NEXT_DATA__" type="application/json">{_script_json(data)}</script>'
+
+
+def _page(title, body, head='', script=''):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{_e(title)}</title>{head}</head>'
+            f'<body>{body}{f"<script>{script}</script>" if script else ""}</body></html>')
+
+
+class StandInSite:
+
+    def __init__(self, categories=8, products=12, options=16, stores=3, sections=10, items=12,
+                 item_options=8, latency=0.0, jitter=0.0, lazy_ms=0, seed=1, menu_variants=1):
+        self.latency = latency
+        self.menu_variants = max(1, menu_variants)
+        self.jitter = jitter
+        self.lazy_ms = lazy_ms
+        rng = random.Random(seed)
+
+        self.categories = {}
+        for c in range(categories):
+            slug = f'category-{c + 1}'
+            products_by_param = {}
+            for p in range(products):
+                param = f'product-{c + 1}-{p + 1}'
+                products_by_param[param] = {
+                    'name': f'Product {c + 1}-{p + 1}',
+                    'price': f'${rng.randint(100, 999) / 100:.2f}',
+                    'calories': rng.randint(10, 90) * 10,
+                    'image': f'/images/{param}_269x269.jpg',
+                    'options': [
+                        {'group': GROUP_NAMES[o // 4 % len(GROUP_NAMES)], 'name': f'Option {o + 1}',
+                         'price': f'${rng.randint(0, 250) / 100:.2f}', 'image': f'/images/option-{o + 1}_269x269.jpg'}
+                        for o in range(options)
+                    ],
+                }
+            self.categories[slug] = {'label': f'Category {c + 1}', 'products': products_by_param}
+
+        self.stores = {}
+        for s in range(stores):
+            uuid = f'store{s + 1:04d}'
+            menu = []
+            for sec in range(sections):
+                section_items = []
+                for i in range(items):
+                    item_uuid = f'{uuid}-item-{sec + 1}-{i + 1}'
+                    section_items.append({
+                        'uuid': item_uuid,
+                        'title': f'Item {s + 1}-{sec + 1}-{i + 1}',
+                        'description': f'Description of item {sec + 1}-{i + 1}',
+                        'price': rng.randint(300, 3500),
+                        'image': f'/images/{item_uuid}.jpeg',
+                        'groups': [
+                            {'title': f'{GROUP_NAMES[g]} ({item_uuid})', 'max': rng.randint(1, 5),
+                             'pick_many': g % 2 == 0,
+                             'options': [{'title': f'Choice {g + 1}-{o + 1}', 'price': rng.choice([0, 50, 100, 250])}
+                                         for o in range(item_options)]}
+                            for g in range(2)
+                        ] if i % 3 else [],
+                    })
+                menu.append({'uuid': f'{uuid}-section-{sec + 1}', 'title': f'Section {sec + 1}', 'items': section_items})
+            self.stores[uuid] = {'slug': f'stand-in-store-{s + 1}', 'title': f'Stand-in Store {s + 1}', 'menu': menu}
+        self.items = {item['uuid']: (uuid, item)
+                      for uuid, store in self.stores.items() for section in store['menu'] for item in section['items']}
+
+    def resolve_store(self, uuid):
+        # Store ids the site doesn't have (e.g. a spider's default start URL)
+        # are answered with one of its stores
+        if uuid not in self.stores:
+            uuids = sorted(self.stores)
+            uuid = uuids[sum(map(ord, uuid)) % len(uuids)] if uuids else None
+        return uuid, self.stores.get(uuid)
+
+    def store_urls(self, base_url):
+        return [f"{base_url}/store/{store['slug']}/{uuid}" for uuid, store in self.stores.items()]
+
+    # Taco Bell
+
+    def _variant_price(self, price, store):
+        # Taco Bell store menus come in menu_variants price lists; the store
+        # ID picks one, no store is list 0
+        variant = sum(map(ord, store)) % self.menu_variants if store else 0
+        return f'${float(price[1:]) + variant * 0.1:.2f}' if variant else price
+
+    def _lazy(self, content):
+        # Content as-is, or in a template the lazy loader moves into the page
+        if not self.lazy_ms:
+            return f'<div id="lazy-target">{content}</div>', ''
+        return f'<div id="lazy-target"></div><template id="lazy">{content}</template>', LAZY_JS % self.lazy_ms
+
+    def food_page(self):
+        cards = ''.join(
+            f'<article class="styles_card__1se34"><a href="/food/{slug}">'
+            f'<span class="styles_label__3Sj9r">{_e(category["label"])}</span></a></article>'
+            for slug, category in self.categories.items())
+        body, script = self._lazy(cards)
+        consent = ('<div id="onetrust-banner-sdk"><button id="onetrust-accept-btn-handler" '
+                   'onclick="this.parentNode.remove()">Accept</button></div>')
+        page_props = {'productCategories': [
+            {'slug': f'/food/{slug}', 'label': category['label']} for slug, category in self.categories.items()]}
+        return _page('Menu', consent + body + _next_data(page_props), script=script)
+
+    def category_page(self, slug, store=None):
+        category = self.categories.get(slug)
+        if category is None:
+            return None
+        cards = []
+        for param, product in category['products'].items():
+            product = dict(product, price=self._variant_price(product['price'], store))
+            cards.append(
+                '<div class="styles_card__1DpUa styles_product-card__1-cAT">'
+                f'<img class="styles_image__3bMG2 styles_product-image__p-OZn" src="{product["image"]}"/>'
+                f'<a class="styles_product-title__6KCyw" href="/food/{slug}/{param}"><h4>{_e(product["name"])}</h4></a>'
+                f'<p class="styles_product-details__2VdYf"><span>{product["price"]}</span>'
+                f'<span>{product["calories"]} Cal</span></p></div>')
+        body, script = self._lazy(''.join(cards))
+        page_props = {'products': [
+            {'name': product['name'], 'url': f'/food/{slug}/{param}',
+             'price': {'formattedValue': self._variant_price(product['price'], store)},
+             'calories': product['calories'], 'caloriesDisplayText': 'Cal',
+             'images': [{'format': '269x269', 'url': product['image']}]}
+            for param, product in category['products'].items()]}
+        return _page(category['label'], body + _next_data(page_props), script=script)
+
+    def product_page(self, slug, param, store=None):
+        product = self.categories.get(slug, {}).get('products', {}).get(param)
+        if product is None:
+            return None
+        product = dict(product, options=[dict(option, price=self._variant_price(option['price'], store))
+                                         for option in product['options']])
+        cards = ''.join(
+            '<div class="styles_interactive__3pQZP styles_flex-card__-Gb6u">'
+            f'<h3 class="styles_customize-section-title__3Pb4I">{_e(option["group"])}</h3>'
+            f'<img class="styles_image__3bMG2" src="{option["image"]}"/>'
+            f'<span class="styles_name__3-08P styles_text-shadow__OtfIt">{_e(option["name"])}</span>'
+            f'<span class="styles_price-and-calories__13gpI"><span>+{option["price"]}</span><span>10 Cal</span></span>'
+            '</div>'
+            for option in product['options'])
+        body, script = self._lazy(cards)
+        groups = {}
+        for option in product['options']:
+            groups.setdefault(option['group'], []).append(
+                {'name': option['name'], 'price': {'formattedValue': f'+{option["price"]}'},
+                 'images': [{'format': '269x269', 'url': option['image']}]})
+        page_props = {'product': {
+            'name': product['name'],
+            'customizations': [{'title': group, 'options': options} for group, options in groups.items()]}}
+        return _page(product['name'], f'<h1>{_e(product["name"])}</h1>' + body + _next_data(page_props),
+                     script=script)
+
+    # UberEats
+
+    def store_page(self, uuid, url):
+        uuid, store = self.resolve_store(uuid)
+        if store is None:
+            return None
+        json_ld = {
+            '@context': 'https://schema.org',
+            '@type': 'Restaurant',
+            '@id': url,
+            'name': store['title'],
+            'image': [f'/images/{uuid}.jpeg'],
+            'address': {'@type': 'PostalAddress', 'streetAddress': '1 Stand-in Way', 'addressLocality': 'Localhost',
+                        'addressRegion': 'CA', 'postalCode': '90000', 'addressCountry': 'US'},
+            'openingHoursSpecification': [
+                {'@type': 'OpeningHoursSpecification', 'dayOfWeek': DAYS, 'opens': '10:30', 'closes': '20:00'}],
+            'priceRange': '$$',
+            'telephone': '+10000000000',
+            'aggregateRating': {'@type': 'AggregateRating', 'ratingValue': 4.5, 'reviewCount': 100},
+            'geo': {'@type': 'GeoCoordinates', 'latitude': 34.0, 'longitude': -118.0},
+            'servesCuisine': ['Stand-in'],
+            'hasMenu': {'@type': 'Menu', 'hasMenuSection': [
+                {'@type': 'MenuSection', 'name': section['title'], 'hasMenuItem': [
+                    {'@type': 'MenuItem', '@id': item['uuid'], 'name': item['title'],
+                     'description': item['description'],
+                     'offers': {'@type': 'Offer', 'price': f'{item["price"] / 100:.2f}', 'priceCurrency': 'USD'}}
+                    for item in section['items']]}
+                for section in store['menu']]},
+        }
+        head = f'<script type="application/ld+json">{_script_json(json_ld)}</script>'
+        body = f'<h1>{_e(store["title"])}</h1><ul id="store-items"></ul>'
+        return _page(store['title'], body, head=head, script=STORE_JS % (json.dumps(uuid), self.lazy_ms))
+
+    def item_page(self, uuid, item_uuid):
+        store_uuid, item = self.items.get(item_uuid, (None, None))
+        if store_uuid is None or store_uuid != self.resolve_store(uuid)[0]:
+            return None
+        blocks = []
+        for group in item['groups']:
+            options = ''.join(
+                f'<label><div class="be bf bg bh g3 os">{_e(option["title"])}</div>'
+                f'<div class="be bf g1 dj g3 bn">+${option["price"] / 100:.2f}</div></label>'
+                for option in group['options'])
+            kind = 'pick-many' if group['pick_many'] else 'pick-one'
+            blocks.append(
+                f'<div data-testid="customization-{kind}"><div class="fs hy fu hz g4">{_e(group["title"])}</div>'
+                f'<div class="be bf g1 dj g4">Choose up to {group["max"]}</div>{options}</div>')
+        dialog = ('<div role="dialog"><p>Stand-in promotion</p>'
+                  '<button data-testid="close-button" onclick="this.parentNode.remove()">Close</button></div>')
+        body = (f'{dialog}<h1 class="ft fv fu fs al cg">{_e(item["title"])}</h1>'
+                f'<div class="cj ae bl kx"><img src="{item["image"]}"/></div>{"".join(blocks)}')
+        return _page(item['title'], body)
+
+    def api_store(self, request):
+        store = self.stores.get(request.get('storeUuid'))
+        if store is None:
+            return None
+        sections = {}
+        for section in store['menu']:
+            sections[section['uuid']] = [{'payload': {'standardItemsPayload': {'catalogItems': [
+                {'uuid': item['uuid'], 'title': item['title'], 'sectionUuid': section['uuid'],
+                 'subsectionUuid': section['uuid'], 'hasCustomizations': bool(item['groups']),
+                 'imageUrl': item['image'], 'price': item['price']}
+                for item in section['items']]}}}]
+        return {'status': 'success', 'data': {'uuid': request['storeUuid'], 'title': store['title'],
+                                              'catalogSectionsMap': sections}}
+
+    def api_item(self, request):
+        store_uuid, item = self.items.get(request.get('menuItemUuid'), (None, None))
+        if item is None or store_uuid != request.get('storeUuid'):
+            return None
+        return {'status': 'success', 'data': {
+            'uuid': item['uuid'], 'title': item['title'], 'imageUrl': item['image'],
+            'customizationsList': [
+                {'title': group['title'], 'maxPermitted': group['max'],
+                 'options': [{'title': option['title'], 'price': option['price']} for option in group['options']]}
+                for group in item['groups']]}}
+
+
+ROUTES = [
+    (re.compile(r'^/food/?$'), lambda site, m, url, store: site.food_page()),
+    (re.compile(r'^/food/([^/]+)/?$'), lambda site, m, url, store: site.category_page(m.group(1), store)),
+    (re.compile(r'^/food/([^/]+)/([^/]+)/?$'),
+     lambda site, m, url, store: site.product_page(m.group(1), m.group(2), store)),
+    (re.compile(r'^/store/[^/]+/([^/]+)/?$'), lambda site, m, url, store: site.store_page(m.group(1), url)),
+    (re.compile(r'^/store/[^/]+/([^/]+)/item/([^/]+)/?$'),
+     lambda site, m, url, store: site.item_page(m.group(1), m.group(2))),
+]
+API_ROUTES = {
+    '/_p/api/getStoreV1': StandInSite.api_store,
+    '/_p/api/getMenuItemV1': StandInSite.api_item,
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    site = None  # Set by make_server
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a throughput run
+
+    def _delay(self):
+        site = self.site
+        if site.latency or site.jitter:
+            time.sleep(site.latency + random.uniform(0, site.jitter))
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8'):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._delay()
+        parsed = urlparse(self.path)
+        path = parsed.path
+        store = parse_qs(parsed.query).get('store', [None])[0]
+        if path == '/stores.txt':
+            base_url = f'http://{self.headers.get("Host")}'
+            return self._send(200, '\n'.join(self.site.store_urls(base_url)) + '\n', 'text/plain; charset=utf-8')
+        for pattern, view in ROUTES:
+            match = pattern.match(path)
+            if match:
+                page = view(self.site, match, f'http://{self.headers.get("Host")}{path}', store)
+                if page is not None:
+                    return self._send(200, page)
+                break
+        self._send(404, _page('Not found', '<h1>Not found</h1>'))
+
+    def do_POST(self):
+        self._delay()
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            request = {}
+        api = API_ROUTES.get(urlparse(self.path).path)
+        payload = api(self.site, request) if api else None
+        if payload is None:
+            return self._send(404, json.dumps({'status': 'failure', 'data': None}), 'application/json')
+        self._send(200, json.dumps(payload), 'application/json')
+
+
+def make_server(site, host='127.0.0.1', port=8800):
+    handler = type('Handler', (StandInHandler,), {'site': site})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for tacobell.com and ubereats.com')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, random')
+    parser.add_argument('--lazy-ms', type=int, default=0, help='load page content by script in batches this far apart')
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--products', type=int, default=12, help='products per category')
+    parser.add_argument('--options', type=int, default=16, help='customization options per product')
+    parser.add_argument('--stores', type=int, default=3)
+    parser.add_argument('--sections', type=int, default=10, help='menu sections per store')
+    parser.add_argument('--items', type=int, default=12, help='items per menu section')
+    parser.add_argument('--item-options', type=int, default=8, help='options per customization group')
+    parser.add_argument('--menu-variants', type=int, default=1,
+                        help='distinct Taco Bell price lists the ?store= menus are spread over')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stores-file', help='also write the store URLs to this file')
+    args = parser.parse_args(argv)
+
+    site = StandInSite(
+        categories=args.categories, products=args.products, options=args.options, stores=args.stores,
+        sections=args.sections, items=args.items, item_options=args.item_options,
+        latency=args.latency, jitter=args.jitter, lazy_ms=args.lazy_ms, seed=args.seed,
+        menu_variants=args.menu_variants)
+    server = make_server(site, args.host, args.port)
+    base_url = f'http://{args.host}:{server.server_address[1]}'
+    if args.stores_file:
+        with open(args.stores_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(site.store_urls(base_url)) + '\n')
+    print(f'Stand-in site on {base_url} ({len(site.categories)} categories, {len(site.stores)} stores)', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
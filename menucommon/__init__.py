@@ -0,0 +1,7 @@
+# Code the tacobellpy and ubereats Scrapy projects share: price parsing
+# (prices.py), the snapshot index of the change feeds (snapshots.py), phase
+# timing (timing.py), the option catalog (catalog.py), the JSON feed
+# exporters (exporters.py) and the browser helpers (browser.py).
+#
+# Each project's package puts the directory holding this one on sys.path when
+# it is imported, so `scrapy crawl` finds it from either project directory.
@@ -0,0 +1,104 @@
+# Chrome helpers both projects' browser management builds on: the blocked URL
+# patterns, the remembered chromedriver path, recognizing a dead session and
+# measuring the memory of a browser's process tree.
+#
+# selenium isn't imported here; errors are recognized by class name.
+
+import json
+import os
+
+# Errors (by class name) and messages of commands sent to a browser that is gone
+DEAD_SESSION_ERRORS = ('InvalidSessionIdException', 'NoSuchWindowException')
+DEAD_SESSION_MESSAGES = (
+    'invalid session id', 'session deleted', 'disconnected', 'chrome not reachable',
+    'no such window', 'target window already closed', 'tab crashed', 'Max retries exceeded',
+)
+
+# File extensions (matched as Network.setBlockedURLs patterns) for each
+# blockable resource type. Images are also switched off through the content
+# settings so they are never even requested.
+RESOURCE_EXTENSIONS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'ogg', 'mp3', 'wav', 'm3u8'],
+}
+# A pattern has to match the whole URL, so each extension is blocked both at
+# the end of the URL and before a query string (font.woff2?v=3)
+RESOURCE_PATTERNS = {
+    resource: [pattern for extension in extensions for pattern in (f'*.{extension}', f'*.{extension}?*')]
+    for resource, extensions in RESOURCE_EXTENSIONS.items()
+}
+
+
+def blocked_url_patterns(block_resources=(), blocked_domains=()):
+    patterns = []
+    for resource in block_resources:
+        patterns.extend(RESOURCE_PATTERNS.get(resource, []))
+    for domain in blocked_domains:
+        patterns.append(f'*://{domain}/*')
+        patterns.append(f'*.{domain}/*')
+    return patterns
+
+
+def read_driver_cache(cache_path):
+    # The chromedriver path remembered at cache_path, None without one
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f).get('path')
+    except (OSError, ValueError):
+        return None
+
+
+def write_driver_cache(cache_path, path):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': path}, f)
+    except OSError:
+        pass  # Resolved again next time
+
+
+class BrowserCrashed(Exception):
+    # The browser's session died while it was in use
+    pass
+
+
+def browser_alive(driver):
+    # False once the chromedriver process has exited
+    process = getattr(getattr(driver, 'service', None), 'process', None)
+    return process is None or process.poll() is None
+
+
+def is_dead_session(driver, error):
+    # Whether `error`, raised by a command, means the browser is gone rather
+    # than that the page misbehaved
+    if type(error).__name__ in DEAD_SESSION_ERRORS or isinstance(error, ConnectionError):
+        return True
+    message = str(error)
+    if any(marker in message for marker in DEAD_SESSION_MESSAGES):
+        return True
+    return not browser_alive(driver)
+
+
+def process_tree_rss(driver):
+    # Resident memory of chromedriver and every Chrome process under it, in
+    # bytes (shared pages counted once per process). None without psutil.
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = getattr(getattr(driver, 'service', None), 'process', None)
+    if process is None:
+        return None
+    try:
+        root = psutil.Process(process.pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return None
+    rss = 0
+    for child in processes:
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass  # Exited meanwhile
+    return rss
@@ -0,0 +1,44 @@
+# Records shared by many menu items, interned under IDs derived from their
+# content for both projects' OptionCatalogPipeline. Each distinct record is
+# written once to the catalog file, as
+#
+#     {"id": "o5c1f0e2d9a7b3c48", "kind": "option", "data": {...}}
+#
+# and only its ID is left on the items.
+
+import hashlib
+import json
+import sys
+
+# First letter of the ID, by kind of record
+ID_PREFIXES = {'option': 'o', 'ingredient': 'i', 'group': 'g'}
+
+
+def record_id(kind, record):
+    # Same content, same ID, in every run. Interned so items share the strings.
+    canonical = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    digest = hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+    return sys.intern(ID_PREFIXES[kind] + digest)
+
+
+class Catalog:
+    # Records interned by content. A record is written out the first time it
+    # is seen; after that only its ID is kept.
+
+    def __init__(self, writer, ids=()):
+        self.writer = writer
+        self.ids = set(ids)
+        self.references = 0
+
+    def intern(self, kind, record):
+        key = record_id(kind, record)
+        self.references += 1
+        if key not in self.ids:
+            self.ids.add(key)
+            self.writer.write({'id': key, 'kind': kind, 'data': record})
+        return key
+
+    def reference(self, key):
+        # Another reference to a record interned before
+        self.references += 1
+        return key
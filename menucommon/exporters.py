@@ -0,0 +1,95 @@
+# JSON feed exporters both projects derive theirs from.
+#
+# A project's JsonItemExporter and JsonLinesItemExporter name its item class
+# and the ItemEncoder that writes that class's JSON text straight from the
+# fields; other items, and feeds whose options (fields, indent, sort_keys)
+# the encoder doesn't reproduce, go through Scrapy's encoder as before.
+
+from scrapy import exporters
+from scrapy.exporters import BaseItemExporter
+from scrapy.utils.python import to_bytes
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+
+def item_encoder(exporter):
+    # An ItemEncoder when it writes what the exporter's own encoder would
+    encoder = exporter.encoder
+    if exporter.fields_to_export or encoder.indent is not None or encoder.sort_keys:
+        return None
+    return exporter.item_encoder_class(ensure_ascii=encoder.ensure_ascii)
+
+
+def encode_item(exporter, item):
+    # JSON text of a project item (None: anything else, left to Scrapy)
+    if not isinstance(item, exporter.item_class):
+        return None
+    if exporter.item_encoder is not None:
+        return exporter.item_encoder.encode(item)
+    data = item.to_dict()
+    if exporter.fields_to_export:
+        data = {field: data[field] for field in exporter.fields_to_export if field in data}
+    return exporter.encoder.encode(data)
+
+
+class JsonItemExporter(BaseItemExporter):
+    # Writes the JSON array Scrapy's JsonItemExporter does ('[', the items
+    # separated by ',', ']', with a newline after '[', between items and
+    # before ']' when FEED_EXPORT_INDENT is set), framing it here rather than
+    # through that exporter's private helpers
+    item_class = None
+    item_encoder_class = None
+
+    def __init__(self, file, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        # FEED_EXPORT_INDENT 0 means one item per line, not an indent of 0
+        self._kwargs.setdefault('indent', self.indent if self.indent is not None and self.indent > 0 else None)
+        self._kwargs.setdefault('ensure_ascii', not self.encoding)
+        self.encoder = ScrapyJSONEncoder(**self._kwargs)
+        self.item_encoder = item_encoder(self)
+        self.separator = b',\n' if self.indent is not None else b','
+        self.first_item = True
+
+    def start_exporting(self):
+        self.file.write(b'[\n' if self.indent is not None else b'[')
+
+    def finish_exporting(self):
+        self.file.write(b'\n]' if self.indent is not None else b']')
+
+    def export_item(self, item):
+        data = encode_item(self, item)
+        if data is None:
+            data = self.encoder.encode(dict(self._get_serialized_fields(item)))
+        data = to_bytes(data, self.encoding)
+        if self.first_item:
+            self.first_item = False
+        else:
+            self.file.write(self.separator)
+        self.file.write(data)
+
+
+class JsonLinesItemExporter(exporters.JsonLinesItemExporter):
+    item_class = None
+    item_encoder_class = None
+
+    def __init__(self, file, **kwargs):
+        super().__init__(file, **kwargs)
+        self.item_encoder = item_encoder(self)
+
+    def export_item(self, item):
+        data = encode_item(self, item)
+        if data is None:
+            return super().export_item(item)
+        self.file.write(to_bytes(data + '\n', self.encoding))
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        'timestamp': pa.timestamp('s', tz='UTC'),
+        'string': pa.dictionary(pa.int32(), pa.string()),
+        'cents': pa.int32(),
+        'int': pa.int32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
@@ -0,0 +1,38 @@
+# Prices of both menus as integer cents.
+#
+# Prices are parsed once, when a spider builds its items, for the pipelines
+# and the Parquet feeds; the feeds write them back as the text the page had,
+# or formatted from the cents for items built without it.
+
+import functools
+import re
+
+PRICE_RE = re.compile(r'-?\d[\d,]*(?:\.\d+)?')
+
+
+@functools.lru_cache(maxsize=4096, typed=True)  # Menus repeat the same few prices
+def to_cents(price):
+    # '$1.00', '+$0.80', '30.00', 7.2 -> integer cents; None without a price
+    if price is None:
+        return None
+    if not isinstance(price, str):
+        price = repr(price)
+    match = PRICE_RE.search(price)
+    if match is None:
+        return None
+    whole, _, fraction = match.group().replace(',', '').partition('.')
+    negative = whole.startswith('-')
+    cents = abs(int(whole)) * 100 + int((fraction + '00')[:2]) + (fraction[2:3] >= '5')
+    return -cents if negative else cents
+
+
+def format_price(cents):
+    # 80 -> '0.80'
+    if cents is None:
+        return None
+    return f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def feed_price(raw_price, cents):
+    # The price as scraped, or formatted from the cents of items built without it
+    return raw_price if raw_price is not None else format_price(cents)
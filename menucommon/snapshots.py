@@ -0,0 +1,190 @@
+# Index of the menus of the previous crawls, for the change feeds of both
+# projects' MenuDiffPipeline.
+#
+# One SQLite row per menu item (store, category, name) holds its price in
+# cents and two 8 byte hashes: one of its own fields and one of its option
+# groups. Each option group has a row of its own with its hash and its
+# options' [name, cents] pairs in page order. An item that didn't change costs
+# one lookup and two hash comparisons; only a group whose hash differs is
+# loaded to find the options that were added, removed or repriced. An option
+# listed more than once in a group is matched by its occurrence (the second
+# "Beans" with the second "Beans"), and its changes carry that occurrence.
+# Nothing is kept in memory between items, so memory only grows with the
+# changes being written out.
+
+import hashlib
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    store TEXT NOT NULL,
+    category TEXT NOT NULL,
+    item TEXT NOT NULL,
+    price_cents INTEGER,
+    item_hash BLOB NOT NULL,
+    groups_hash BLOB,
+    crawl INTEGER NOT NULL,
+    PRIMARY KEY (store, category, item)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS option_groups (
+    store TEXT NOT NULL,
+    category TEXT NOT NULL,
+    item TEXT NOT NULL,
+    option_group TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    options TEXT NOT NULL,
+    PRIMARY KEY (store, category, item, option_group)
+) WITHOUT ROWID;
+"""
+
+
+def digest(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).digest()
+
+
+def keyed_options(options):
+    # [(name, cents), ...] -> {(name, occurrence): cents}
+    keyed = {}
+    seen = {}
+    for name, cents in options:
+        seen[name] = occurrence = seen.get(name, 0) + 1
+        keyed[(name, occurrence)] = cents
+    return keyed
+
+
+def load_options(text):
+    # Stored options; rows written before repeated options were kept hold a {name: cents} map
+    options = json.loads(text)
+    return list(options.items()) if isinstance(options, dict) else options
+
+
+def option_change(change, group, key, **prices):
+    name, occurrence = key
+    change = {'change': change, 'option_group': group, 'option': name}
+    if occurrence > 1:
+        change['occurrence'] = occurrence
+    change.update(prices)
+    return change
+
+
+class SnapshotIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        # Without a finished crawl to compare with, this crawl only fills the index
+        self.baseline = self.db.execute('SELECT COUNT(*) FROM crawls WHERE finished IS NOT NULL').fetchone()[0] == 0
+        with self.db:
+            self.crawl = self.db.execute('INSERT INTO crawls (started) VALUES (?)', (time.time(),)).lastrowid
+
+    def diff(self, store, category, item, price_cents, fields, groups):
+        # Records an item as seen in this crawl and returns its changes since
+        # it was last seen. groups is {group: ([(option, cents), ...], content)},
+        # or None when the options are unknown (their details failed): the
+        # stored groups are kept then. An item listed again in the same crawl
+        # (the same name twice in a category) is compared with the first
+        # listing's row only once: later listings are skipped.
+        key = (store or '', category, item)
+        item_hash = digest(fields)
+        group_hashes = groups_hash = None
+        if groups is not None:
+            group_hashes = {name: digest(content) for name, (_, content) in groups.items()}
+            groups_hash = digest(sorted((name, value.hex()) for name, value in group_hashes.items()))
+
+        changes = []
+        with self.db:
+            row = self.db.execute(
+                'SELECT price_cents, item_hash, groups_hash, crawl FROM items '
+                'WHERE store = ? AND category = ? AND item = ?', key).fetchone()
+            if row is not None and row[3] == self.crawl:
+                return changes
+            if row is None:
+                if not self.baseline:
+                    changes.append({'change': 'added', 'price_cents': price_cents})
+            else:
+                old_price, old_item_hash, old_groups_hash, _ = row
+                if old_price != price_cents:
+                    changes.append({'change': 'price', 'old_price_cents': old_price, 'price_cents': price_cents})
+                elif old_item_hash != item_hash:
+                    changes.append({'change': 'changed'})
+                if groups is None:
+                    groups_hash = old_groups_hash
+            self.db.execute(
+                'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)',
+                key + (price_cents, item_hash, groups_hash, self.crawl))
+            if row is not None and row[2] is not None and groups_hash != row[2]:
+                changes.extend(self._diff_groups(key, groups, group_hashes))
+            elif groups and (row is None or row[2] is None):
+                # First time the options are known: nothing to compare with
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO option_groups VALUES (?, ?, ?, ?, ?, ?)',
+                    [key + (name, group_hashes[name], json.dumps(options, ensure_ascii=False))
+                     for name, (options, _) in groups.items()])
+
+        for change in changes:
+            change.update(store=store, category=category, item=item)
+        return changes
+
+    def _diff_groups(self, key, groups, group_hashes):
+        # Option changes of the groups whose hash differs, stored as they are now
+        old_groups = {name: (value, options) for name, value, options in self.db.execute(
+            'SELECT option_group, hash, options FROM option_groups WHERE store = ? AND category = ? AND item = ?',
+            key)}
+        changes = []
+        for name, (options, _) in groups.items():
+            old_hash, old_options = old_groups.pop(name, (None, '[]'))
+            if old_hash == group_hashes[name]:
+                continue
+            new = keyed_options(options)
+            old = keyed_options(load_options(old_options))
+            for option, cents in new.items():
+                if option not in old:
+                    changes.append(option_change('option_added', name, option, price_cents=cents))
+                elif old[option] != cents:
+                    changes.append(option_change('option_price', name, option, old_price_cents=old[option],
+                                                 price_cents=cents))
+            for option, cents in old.items():
+                if option not in new:
+                    changes.append(option_change('option_removed', name, option, old_price_cents=cents))
+            self.db.execute(
+                'INSERT OR REPLACE INTO option_groups VALUES (?, ?, ?, ?, ?, ?)',
+                key + (name, group_hashes[name], json.dumps(options, ensure_ascii=False)))
+        for name, (_, old_options) in old_groups.items():
+            for option, cents in keyed_options(load_options(old_options)).items():
+                changes.append(option_change('option_removed', name, option, old_price_cents=cents))
+            self.db.execute(
+                'DELETE FROM option_groups WHERE store = ? AND category = ? AND item = ? AND option_group = ?',
+                key + (name,))
+        return changes
+
+    def removed(self, store):
+        # Items of a store that this crawl didn't see, dropped from the index
+        # once they have all been yielded
+        store = store or ''
+        for category, item, price_cents in self.db.execute(
+                'SELECT category, item, price_cents FROM items WHERE store = ? AND crawl < ?', (store, self.crawl)):
+            yield {'change': 'removed', 'old_price_cents': price_cents,
+                   'store': store or None, 'category': category, 'item': item}
+        with self.db:
+            self.db.execute(
+                'DELETE FROM option_groups WHERE (store, category, item) IN '
+                '(SELECT store, category, item FROM items WHERE store = ? AND crawl < ?)', (store, self.crawl))
+            self.db.execute('DELETE FROM items WHERE store = ? AND crawl < ?', (store, self.crawl))
+
+    def finish(self):
+        with self.db:
+            self.db.execute('UPDATE crawls SET finished = ? WHERE id = ?', (time.time(), self.crawl))
+
+    def close(self):
+        self.db.close()
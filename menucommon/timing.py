@@ -0,0 +1,182 @@
+# Per-phase timing of page rendering and parsing.
+#
+# span() appends (phase, seconds) samples to a plain list, so it can be used
+# from render threads and worker processes (which send their samples back
+# with their results). The samples are recorded from the reactor thread into
+# the stats collector as histograms:
+#
+#     timing/<phase>/count, timing/<phase>/sum, timing/<phase>/max
+#     timing/<phase>/le_<bound>   (cumulative buckets, see BUCKETS)
+#
+# @timed(phase) wraps a spider callback, adds its own time to the response's
+# samples and logs the page when all its phases together exceed the
+# TIMING_SLOW_PAGES threshold of its URL pattern. PhaseTimingExporter writes
+# the histograms to a Prometheus textfile (for node_exporter's textfile
+# collector) every TIMING_PROMETHEUS_INTERVAL seconds.
+
+import functools
+import inspect
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = 'timing/'
+
+
+@contextmanager
+def span(samples, phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append((phase, time.perf_counter() - start))
+
+
+def record_timings(stats, samples, spider=None):
+    for phase, seconds in samples:
+        stats.inc_value(f'{PREFIX}{phase}/count', spider=spider)
+        stats.inc_value(f'{PREFIX}{phase}/sum', seconds, spider=spider)
+        stats.max_value(f'{PREFIX}{phase}/max', seconds, spider=spider)
+        for bound in BUCKETS:
+            if seconds <= bound:
+                stats.inc_value(f'{PREFIX}{phase}/le_{bound:g}', spider=spider)
+
+
+def slow_page_threshold(settings, url):
+    # URL regex -> seconds, first match wins
+    for pattern, seconds in settings.getdict('TIMING_SLOW_PAGES').items():
+        if re.search(pattern, url):
+            return seconds
+    return None
+
+
+def check_slow_page(spider, url, samples):
+    threshold = slow_page_threshold(spider.crawler.settings, url)
+    total = sum(seconds for _, seconds in samples)
+    if threshold is None or total < threshold:
+        return
+    phases = ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in samples)
+    spider.logger.warning(f'Slow page {url}: {total:.2f}s over {threshold}s ({phases})')
+    spider.crawler.stats.inc_value(f'{PREFIX}slow_pages', spider=spider)
+
+
+def timed(phase):
+    # Times a spider callback. For a generator callback only the time spent
+    # producing results counts, not the time the engine spends consuming them.
+    def decorator(callback):
+        @functools.wraps(callback)
+        def wrapper(spider, response, *args, **kwargs):
+            start = time.perf_counter()
+            result = callback(spider, response, *args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if inspect.isgenerator(result):
+                return _timed_results(spider, response, phase, result, elapsed)
+            _callback_done(spider, response, phase, elapsed)
+            return result
+        return wrapper
+    return decorator
+
+
+def _timed_results(spider, response, phase, results, elapsed):
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(results)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield value
+    finally:
+        _callback_done(spider, response, phase, elapsed)
+
+
+def _callback_done(spider, response, phase, elapsed):
+    crawler = getattr(spider, 'crawler', None)
+    if crawler is None:
+        return
+    samples = response.meta.setdefault('timings', [])
+    samples.append((phase, elapsed))
+    record_timings(crawler.stats, [(phase, elapsed)], spider)
+    check_slow_page(spider, response.url, samples)
+
+
+class PhaseTimingExporter:
+
+    def __init__(self, stats, path, interval=15.0, namespace='scrapy'):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.namespace = namespace
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('TIMING_PROMETHEUS_FILE')
+        if not path:
+            raise NotConfigured
+        exporter = cls(
+            crawler.stats,
+            path,
+            interval=crawler.settings.getfloat('TIMING_PROMETHEUS_INTERVAL', 15.0),
+            namespace=crawler.settings.get('BOT_NAME', 'scrapy'),
+        )
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        return exporter
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.write)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.write()
+
+    def histograms(self):
+        # phase -> {'count': ..., 'sum': ..., 'max': ..., 'le_<bound>': ...}
+        histograms = {}
+        for key, value in self.stats.get_stats().items():
+            if key.startswith(PREFIX) and key.count('/') >= 2:
+                phase, field = key[len(PREFIX):].rsplit('/', 1)
+                histograms.setdefault(phase, {})[field] = value
+        return histograms
+
+    def render(self):
+        metric = f'{self.namespace}_phase_seconds'
+        histograms = self.histograms()
+        lines = [
+            f'# HELP {metric} Time spent per render and parse phase.',
+            f'# TYPE {metric} histogram',
+        ]
+        for phase in sorted(histograms):
+            fields = histograms[phase]
+            for bound in BUCKETS:
+                lines.append(f'{metric}_bucket{{phase="{phase}",le="{bound:g}"}} {fields.get(f"le_{bound:g}", 0)}')
+            lines.append(f'{metric}_bucket{{phase="{phase}",le="+Inf"}} {fields.get("count", 0)}')
+            lines.append(f'{metric}_sum{{phase="{phase}"}} {fields.get("sum", 0.0)}')
+            lines.append(f'{metric}_count{{phase="{phase}"}} {fields.get("count", 0)}')
+
+        lines.append(f'# TYPE {self.namespace}_phase_max_seconds gauge')
+        for phase in sorted(histograms):
+            lines.append(f'{self.namespace}_phase_max_seconds{{phase="{phase}"}} {histograms[phase].get("max", 0.0)}')
+        lines.append(f'# TYPE {self.namespace}_slow_pages_total counter')
+        lines.append(f'{self.namespace}_slow_pages_total {self.stats.get_value(f"{PREFIX}slow_pages", 0)}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.path)  # The collector never reads a partial file
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# menucommon, the code shared with the ubereats project, sits next to the
+# project directory
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
@@ -0,0 +1,347 @@
+# Chrome driver creation and the pool of browsers shared by the render workers
+# of SeleniumMiddleware.
+#
+# selenium is only imported when the first browser is launched, and the pool
+# launches browsers on demand, so crawls that never render (HTTP-first pages,
+# cache replay) and CLI commands don't pay for either. With several tabs per
+# browser, concurrent renders share a browser through BrowserTabs.
+
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from menucommon.browser import (BrowserCrashed, blocked_url_patterns, browser_alive, is_dead_session,
+                                process_tree_rss, read_driver_cache, write_driver_cache)
+
+# Where the chromedriver found on an earlier run is remembered, per machine
+DRIVER_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'tacobellpy', 'chromedriver.json')
+
+
+def resolve_driver_path(driver_path=None, cache_path=DRIVER_CACHE_PATH):
+    # The configured chromedriver, else the one found on an earlier run, else
+    # chromedriver on PATH. No network round trip in any case.
+    if driver_path and os.path.isfile(driver_path):
+        return driver_path
+    cached = read_driver_cache(cache_path)
+    if cached and os.path.isfile(cached):
+        return cached
+    found = shutil.which('chromedriver')
+    if found is None:
+        raise FileNotFoundError(f"ChromeDriver not found at path: {driver_path}")
+    write_driver_cache(cache_path, found)
+    return found
+
+
+# True once the document navigated to has finished loading
+LOADED_JS = "return !window.__tabLeaving && document.readyState === 'complete';"
+
+
+def block_urls(driver, patterns):
+    # Blocked at the network layer, so the requests never leave the browser.
+    # Applies to the window the session is switched to.
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+
+def create_driver(driver_path, block_resources=(), blocked_domains=(), multiplexed=False, profile_dir=None):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    service = Service(executable_path=driver_path)
+    chrome_options = Options()
+    chrome_options.add_argument('--disable-gpu')
+    if profile_dir:
+        # A warm profile (see profiles.py): cookies, localStorage and HTTP cache
+        chrome_options.add_argument(f'--user-data-dir={os.path.abspath(profile_dir)}')
+        chrome_options.add_argument('--no-first-run')
+        chrome_options.add_argument('--no-default-browser-check')
+        chrome_options.add_argument('--hide-crash-restore-bubble')
+    if 'image' in block_resources:
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2})
+    if multiplexed:
+        # driver.get() returns at once and BrowserTab waits for the load
+        # itself, so other windows can be driven meanwhile. Windows that
+        # aren't in front keep running their timers and rendering.
+        chrome_options.page_load_strategy = 'none'
+        chrome_options.add_argument('--disable-background-timer-throttling')
+        chrome_options.add_argument('--disable-backgrounding-occluded-windows')
+        chrome_options.add_argument('--disable-renderer-backgrounding')
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+
+    patterns = blocked_url_patterns(block_resources, blocked_domains)
+    if patterns:
+        block_urls(driver, patterns)
+    return driver
+
+
+class SharedBrowser:
+    # A browser driven by several BrowserTabs. The WebDriver session has one
+    # current window, so every command goes through `lock` and switches to
+    # its tab's window first.
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.lock = threading.Lock()
+        self.current = driver.current_window_handle
+
+    def call(self, handle, function, *args, **kwargs):
+        with self.lock:
+            if self.current != handle:
+                self.driver.switch_to.window(handle)
+                self.current = handle
+            return function(*args, **kwargs)
+
+    def open_window(self, patterns=(), isolated=True):
+        # A new window in its own browser context (cookies, storage and cache
+        # of its own, like an incognito window), or a plain new window sharing
+        # the browser's state where the context can't be created or isolated
+        # is False
+        with self.lock:
+            driver = self.driver
+            try:
+                if not isolated:
+                    raise LookupError('shared window')
+                context = driver.execute_cdp_cmd('Target.createBrowserContext', {'disposeOnDetach': True})
+                target = driver.execute_cdp_cmd('Target.createTarget', {
+                    'url': 'about:blank',
+                    'browserContextId': context['browserContextId'],
+                    'newWindow': True,
+                })
+                handle = target['targetId']
+                if handle not in driver.window_handles:
+                    raise LookupError(handle)
+                driver.switch_to.window(handle)
+            except Exception:
+                driver.switch_to.new_window('window')
+                handle = driver.current_window_handle
+            self.current = handle
+            if patterns:
+                block_urls(driver, patterns)
+            return handle
+
+
+class BrowserTab:
+    # One window of a SharedBrowser, used by one render at a time in place of
+    # a whole driver. Attribute access is forwarded to the driver with the
+    # session switched to this window; WebElements it hands out must be used
+    # straight away, before another tab's command switches the window.
+
+    def __init__(self, browser, handle, load_timeout=30.0, poll_interval=0.1):
+        self.browser = browser
+        self.handle = handle
+        self.load_timeout = load_timeout
+        self.poll_interval = poll_interval
+
+    def get(self, url):
+        # Loads url without keeping the other tabs waiting: the browser lock
+        # is only held for the navigation command and each readyState poll
+        driver = self.browser.driver
+        # Marks the current document, so its readyState isn't taken for the new one's
+        self.browser.call(self.handle, driver.execute_script, 'window.__tabLeaving = true')
+        self.browser.call(self.handle, driver.get, url)
+        deadline = time.monotonic() + self.load_timeout
+        while time.monotonic() < deadline:
+            if self.browser.call(self.handle, driver.execute_script, LOADED_JS):
+                return
+            time.sleep(self.poll_interval)
+
+    def __getattr__(self, name):
+        driver = self.browser.driver
+        value = self.browser.call(self.handle, getattr, driver, name)
+        if not callable(value):
+            return value  # A property such as page_source, read in this window
+
+        def command(*args, **kwargs):
+            return self.browser.call(self.handle, value, *args, **kwargs)
+        return command
+
+
+class PooledBrowser:
+    # A launched browser with its render slots and what recycling looks at
+
+    def __init__(self, driver, slots=1, profile=None):
+        self.driver = driver
+        self.slots = slots
+        self.profile = profile  # Its seat's profile directory, if any
+        self.pages = 0
+        self.busy = 0
+        self.retiring = None  # Why, once it's being recycled
+
+
+class BrowserPool:
+    # Up to `size` render slots. A render checks one out for the whole page
+    # load, so two worker threads never drive the same slot at the same time.
+    # With tabs_per_browser = 1 a slot is a whole browser; above that each
+    # browser serves up to that many slots as BrowserTabs, one window each,
+    # which takes far less memory than a browser per render. A browser that
+    # can't open all its windows leaves the remaining slots to extra browsers.
+    # Browsers are launched when a checkout finds no idle slot, so the pool
+    # only grows as far as the renders actually overlap.
+    #
+    # Browsers are recycled: past max_pages renders, past max_rss_mb of
+    # process-tree memory, or as soon as their session dies. A recycled
+    # browser takes no new renders and is quit when its last one finishes;
+    # its slots are then launched afresh on demand. A render whose session
+    # died raises BrowserCrashed, for the caller to retry.
+    #
+    # With `profiles` (a ProfileSeats) every browser runs on a warm profile
+    # directory of its own. Its windows then share that profile rather than
+    # getting isolated contexts, which would start cold.
+
+    def __init__(self, driver_path, size=1, block_resources=(), blocked_domains=(), tabs_per_browser=1,
+                 max_pages=0, max_rss_mb=0, profiles=None):
+        self.driver_path = driver_path
+        self.size = max(1, size)
+        self.tabs_per_browser = max(1, tabs_per_browser)
+        self.block_resources = tuple(block_resources)
+        self.blocked_domains = tuple(blocked_domains)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.profiles = profiles
+        self.browsers = []
+        self.slots = 0  # Slots launched, or being launched
+        # (browser, slot), or (None, None) for a slot freed by a recycled browser
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.events = []  # Stat keys to increment, see flush_stats
+        self.rss_max = 0
+
+    def _launch(self):
+        # (browser, slot) for the caller, or None once the pool is full. The
+        # other windows of a new browser go to the idle queue.
+        with self.lock:
+            wanted = min(self.tabs_per_browser, self.size - self.slots)
+            if wanted <= 0:
+                return None
+            self.slots += wanted  # Reserved while Chrome starts
+        profile = None
+        try:
+            if self.profiles is not None:
+                profile = self.profiles.acquire()
+            driver = create_driver(self.driver_path, self.block_resources, self.blocked_domains,
+                                   multiplexed=self.tabs_per_browser > 1, profile_dir=profile)
+        except Exception:
+            if profile is not None:
+                self.profiles.release(profile)
+            with self.lock:
+                self.slots -= wanted
+            raise
+
+        if self.tabs_per_browser == 1:
+            slots = [driver]
+        else:
+            shared = SharedBrowser(driver)
+            slots = [BrowserTab(shared, shared.current)]
+            patterns = blocked_url_patterns(self.block_resources, self.blocked_domains)
+            try:
+                while len(slots) < wanted:
+                    slots.append(BrowserTab(shared, shared.open_window(patterns, isolated=profile is None)))
+            except Exception:
+                shared.current = None  # Unknown after the failure, switch on the next command
+        browser = PooledBrowser(driver, len(slots), profile)
+        with self.lock:
+            self.slots -= wanted - len(slots)
+            self.browsers.append(browser)
+            self.events.append('browser/launched')
+        for slot in slots[1:]:
+            self.idle.put((browser, slot))
+        return browser, slots[0]
+
+    def _acquire(self):
+        while True:
+            try:
+                browser, slot = self.idle.get_nowait()
+            except queue.Empty:
+                browser, slot = self._launch() or self.idle.get()
+            if browser is None:
+                continue  # A slot was freed, launch a browser for it
+            if browser.retiring is None and not browser_alive(browser.driver):
+                self._retire(browser, 'crashed')  # Died while idle
+            with self.lock:
+                if browser.retiring is None:
+                    browser.busy += 1
+                    return browser, slot
+            # A slot of a browser being recycled: dropped
+
+    def _release(self, browser, slot, crashed=False):
+        reason = 'crashed' if crashed else None
+        with self.lock:
+            browser.pages += 1
+            if reason is None and self.max_pages and browser.pages >= self.max_pages:
+                reason = 'pages'
+        if reason is None and self.max_rss_mb:
+            rss = process_tree_rss(browser.driver)
+            if rss is not None:
+                with self.lock:
+                    self.rss_max = max(self.rss_max, rss)
+                if rss > self.max_rss_mb * 1024 * 1024:
+                    reason = 'rss'
+        with self.lock:
+            browser.busy -= 1
+        if reason is not None:
+            self._retire(browser, reason)
+        elif browser.retiring is None:
+            self.idle.put((browser, slot))
+            return
+        self._quit_if_done(browser)
+
+    def _retire(self, browser, reason):
+        with self.lock:
+            if browser.retiring is None:
+                browser.retiring = reason
+                self.events.append('browser/crashed' if reason == 'crashed' else f'browser/recycled/{reason}')
+        self._quit_if_done(browser)
+
+    def _quit_if_done(self, browser):
+        # Quits a recycled browser once no render uses it any more
+        with self.lock:
+            if browser.busy or browser not in self.browsers:
+                return
+            self.browsers.remove(browser)
+            self.slots -= browser.slots
+        self._quit(browser)
+        for _ in range(browser.slots):
+            self.idle.put((None, None))
+
+    @contextmanager
+    def checkout(self):
+        browser, slot = self._acquire()
+        try:
+            yield slot
+        except Exception as e:
+            if is_dead_session(browser.driver, e):
+                self._release(browser, slot, crashed=True)
+                raise BrowserCrashed(f'Browser session died: {e}') from e
+            self._release(browser, slot)
+            raise
+        self._release(browser, slot)
+
+    def flush_stats(self, stats, spider):
+        # Moves the lifecycle events to the stats; call from the reactor thread
+        with self.lock:
+            events, self.events = self.events, []
+            rss_max = self.rss_max
+        for key in events:
+            stats.inc_value(key, spider=spider)
+        if rss_max:
+            stats.max_value('browser/rss_max_mb', rss_max // (1024 * 1024), spider=spider)
+
+    def close(self):
+        with self.lock:
+            browsers, self.browsers = self.browsers, []
+        for browser in browsers:
+            self._quit(browser)
+
+    def _quit(self, browser):
+        try:
+            browser.driver.quit()
+        except Exception:
+            pass
+        if browser.profile is not None:
+            self.profiles.release(browser.profile)  # Only once Chrome has let go of it
@@ -0,0 +1,67 @@
+# Catalog of the ingredient options products share.
+#
+# The same option ("Tomatoes", "$0.80", same image) shows up on nearly every
+# product, and on every store's copy of it. OptionCatalogPipeline interns each
+# option under an ID derived from its content and leaves only the IDs on the
+# products; every distinct option is written once to a separate JSON Lines
+# catalog:
+#
+#     {"id": "o5c1f0e2d9a7b3c48", "kind": "option", "data": {"category_name": ..., "name": ..., ...}}
+
+import json
+import os
+
+
+class CatalogWriter:
+    # Appends catalog records to a JSON Lines file
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open(path, 'ab' if append else 'wb')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_catalog(path):
+    # {id: record} of a catalog file; a truncated last line is skipped
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            records[entry['id']] = entry['data']
+    return records
+
+
+class CatalogReader:
+    # Records of a catalog file still being written, read again whenever an
+    # unknown ID shows up (they are flushed before the items referencing them)
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+
+    def get(self, ids):
+        if any(key not in self.records for key in ids):
+            self.records.update(read_catalog(self.path))
+        return [self.records[key] for key in ids]
+
+
+def expand_product(product, records):
+    # The product with its option IDs replaced by the options again
+    product = dict(product)
+    ids = product.pop('Ingredient ids', None)
+    if ids is not None:
+        product['Ingredients details'] = [dict(records[key]) for key in ids]
+    return product
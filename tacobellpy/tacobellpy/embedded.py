@@ -0,0 +1,156 @@
+# Structured data embedded in server-rendered pages.
+#
+# Used by the HTTP-first mode of SeleniumMiddleware: a page fetched with the
+# normal downloader is searched for JSON payloads (JSON-LD, Next.js
+# __NEXT_DATA__, window.__*__ hydration blobs) and, when they contain what the
+# spider needs, mapped into the same shapes the spider's XPath code builds.
+# A mapper returns None when the payloads aren't enough, and the page is then
+# rendered with Selenium instead.
+
+import json
+import re
+from urllib.parse import urlparse
+
+from tacobellpy.xpaths import TACOBELL
+
+HYDRATION_RE = re.compile(r'window\.(__[A-Za-z0-9_]+__)\s*=\s*')
+
+_decoder = json.JSONDecoder()
+
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _hydration_blobs(root):
+    # window.__APOLLO_STATE__ = {...}; style assignments in inline scripts
+    blobs = {}
+    for script in TACOBELL.all('inline_scripts', root):
+        for match in HYDRATION_RE.finditer(script):
+            try:
+                blobs[match.group(1)], _ = _decoder.raw_decode(script, match.end())
+            except ValueError:
+                continue
+    return blobs
+
+
+def extract_payloads(response):
+    root = TACOBELL.root(response)
+    json_ld = [data for data in map(_loads, TACOBELL.all('json_ld', root)) if data is not None]
+    return {
+        'json_ld': json_ld,
+        'next_data': _loads(TACOBELL.first('next_data', root)),
+        'hydration': _hydration_blobs(root),
+    }
+
+
+def _page_props(payloads):
+    next_data = payloads.get('next_data') or {}
+    return next_data.get('props', {}).get('pageProps') or {}
+
+
+def _formatted_price(price):
+    if isinstance(price, dict):
+        return price.get('formattedValue') or ''
+    return str(price) if price is not None else ''
+
+
+def _image_url(images, image_format='269x269'):
+    for image in images or []:
+        if image.get('format') == image_format:
+            return image.get('url')
+    return images[0].get('url') if images else None
+
+
+def map_categories(payloads):
+    # /food -> [(dynamic_value, item_name)], as TacoBellSpider.parse reads them
+    # from the category cards
+    categories = _page_props(payloads).get('productCategories')
+    if not categories:
+        return None
+    return [
+        (category['slug'].rstrip('/').split('/')[-1], category.get('label'))
+        for category in categories
+        if category.get('slug') and not category.get('hideFromMenu')
+    ]
+
+
+def map_products(payloads):
+    # /food/{category} -> product cards, as TacoBellSpider.parse_item reads them
+    products = _page_props(payloads).get('products')
+    if not products:
+        return None
+    cards = []
+    for product in products:
+        if not product.get('name') or not product.get('url'):
+            continue
+        # Sized products (drinks) show the calories of their default variant
+        calories = product.get('calories')
+        for variant in product.get('variantOptions') or []:
+            if variant.get('groupDefaultItem'):
+                calories = variant.get('calories') or calories
+        cards.append({
+            'name': product['name'],
+            'price': _formatted_price(product.get('price')),
+            'description': f"{calories} {product.get('caloriesDisplayText', 'Cal')}" if calories else None,
+            'image_url': _image_url(product.get('images')),
+            'param': product['url'].rstrip('/').split('/')[-1],
+        })
+    return cards or None
+
+
+def _option_price(price):
+    # '+$0.80' -> '0.80' and a missing price -> '', as parse_details reads the
+    # price of an option card
+    return _formatted_price(price).replace('+', '').replace('$', '').strip()
+
+
+def _text(value):
+    # As the card's text is cleaned up: None when missing
+    return value.strip() if isinstance(value, str) and value else None
+
+
+def map_details(payloads):
+    # /food/{category}/{product} -> ingredient details, as
+    # TacoBellSpider.parse_details reads them from the customization cards.
+    # pageProps.product lists the customization sections in page order, each
+    # with its options:
+    #
+    #     {"customizations": [{"title": "Add", "options": [{"name": "Beans",
+    #         "price": {"formattedValue": "+$0.80"}, "images": [{"format": "269x269", "url": ...}]}]}]}
+    #
+    # Any other shape is left to the browser rather than guessed at.
+    product = _page_props(payloads).get('product')
+    if not isinstance(product, dict) or not isinstance(product.get('customizations'), list):
+        return None
+    details = []
+    for section in product['customizations']:
+        if not isinstance(section, dict) or not isinstance(section.get('options'), list):
+            return None
+        for option in section['options']:
+            if not isinstance(option, dict) or not _text(option.get('name')):
+                return None
+            details.append({
+                'category_name': _text(section.get('title')),
+                'name': _text(option['name']),
+                'price': _option_price(option.get('price')),
+                'image_url': _text(_image_url(option.get('images'))),
+            })
+    # A product page without customizations looks the same as one whose
+    # options we couldn't find, so let the browser decide
+    return details or None
+
+
+def map_tacobell_page(response):
+    path = [part for part in urlparse(response.url).path.split('/') if part]
+    if not path or path[0] != 'food':
+        return None
+    payloads = extract_payloads(response)
+    if len(path) == 1:
+        return map_categories(payloads)
+    if len(path) == 2:
+        return map_products(payloads)
+    return map_details(payloads)
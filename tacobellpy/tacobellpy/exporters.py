@@ -0,0 +1,230 @@
+# Feed exporters of the Taco Bell menus.
+#
+# JsonItemExporter and JsonLinesItemExporter write the Category items in the
+# feeds' usual shape with ItemEncoder: the JSON text comes straight from the
+# items' fields instead of from an adapted copy of every product and option,
+# and an option repeated across products and stores is encoded only once.
+#
+#     scrapy crawl tacobell -O menus.parquet
+#
+# ParquetItemExporter flattens every category item into one typed table with
+# a row per ingredient option (store, category, product, option), and one
+# row with empty option columns for a product without options. Prices are
+# integer cents, the repeated strings are dictionary encoded, and rows are
+# written as a Parquet row group every TACOBELL_PARQUET_ROW_GROUP_SIZE rows
+# while the crawl runs instead of all at once at the end. Products carrying
+# catalog IDs (OptionCatalogPipeline) get their options back from
+# TACOBELL_CATALOG_PATH.
+#
+# Existing JSON feeds convert with
+#
+#     python -m tacobellpy.exporters tacobellspider.json menus.parquet
+
+import argparse
+import datetime
+import json
+import os
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from scrapy.exporters import BaseItemExporter
+
+from menucommon import exporters
+from menucommon.exporters import arrow_schema
+from menucommon.prices import format_price
+
+from tacobellpy.catalog import CatalogReader
+from tacobellpy.items import Category, Option
+
+# name, kind: 'string' columns are dictionary encoded, 'cents' are int32
+COLUMNS = [
+    ('crawled_at', 'timestamp'),
+    ('store', 'string'),
+    ('category', 'string'),
+    ('product', 'string'),
+    ('product_description', 'string'),
+    ('product_image_url', 'string'),
+    ('product_price_cents', 'cents'),
+    ('option_group', 'string'),
+    ('option', 'string'),
+    ('option_price_cents', 'cents'),
+    ('option_image_url', 'string'),
+]
+
+
+class ItemEncoder:
+    # The JSON text json.dumps() would write for item.to_dict(), with the
+    # default separators, built from the fields directly. The text of an
+    # option is kept and reused for the same option further on.
+
+    def __init__(self, ensure_ascii=False, max_options=100000):
+        self.string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self.other = json.JSONEncoder(ensure_ascii=ensure_ascii).encode
+        self.max_options = max_options
+        self.options = {}
+        self.prices = {None: 'null'}
+
+    def value(self, value):
+        if value is None:
+            return 'null'
+        if value.__class__ is str:
+            return self.string(value)
+        return self.other(value)
+
+    def price(self, raw_price, cents):
+        if raw_price is not None:
+            return self.string(raw_price)
+        text = self.prices.get(cents)
+        if text is None:
+            text = self.prices[cents] = f'"{format_price(cents)}"'
+        return text
+
+    def option(self, option):
+        key = (option.group, option.name, option.price_cents, option.image_url, option.raw_price)
+        text = self.options.get(key)
+        if text is None:
+            if len(self.options) >= self.max_options:
+                self.options.clear()
+            value = self.value
+            text = self.options[key] = (
+                f'{{"category_name": {value(option.group)}, "name": {value(option.name)}, '
+                f'"price": {self.price(option.raw_price, option.price_cents)}, '
+                f'"image_url": {value(option.image_url)}}}')
+        return text
+
+    def product(self, product):
+        if product.option_ids is not None:
+            # Catalog IDs are a letter and hex digits, nothing to escape
+            ids = product.option_ids
+            options = '"Ingredient ids": ["' + '", "'.join(ids) + '"]' if ids else '"Ingredient ids": []'
+        else:
+            options = '"Ingredients details": [' + ', '.join(map(self.option, product.options or ())) + ']'
+        value = self.value
+        return (f'{{"name": {value(product.name)}, '
+                f'"price": {self.price(product.raw_price, product.price_cents)}, '
+                f'"description": {value(product.description)}, "image_url": {value(product.image_url)}, '
+                f'{options}}}')
+
+    def encode(self, item):
+        text = '{"Title": ' + self.value(item.title)
+        if item.store:
+            text += ', "Store": ' + self.value(item.store)
+        if item.streamed:
+            return text + ', "Product": ' + self.product(item.products[0]) + '}'
+        return text + ', "Menu": [' + ', '.join(map(self.product, item.products)) + ']}'
+
+
+class JsonItemExporter(exporters.JsonItemExporter):
+    item_class = Category
+    item_encoder_class = ItemEncoder
+
+
+class JsonLinesItemExporter(exporters.JsonLinesItemExporter):
+    item_class = Category
+    item_encoder_class = ItemEncoder
+
+
+class ParquetItemExporter(BaseItemExporter):
+
+    def __init__(self, file, row_group_size=10000, compression='zstd', catalog_path=None, crawled_at=None,
+                 **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet feeds need the 'pyarrow' package")
+        self.parquet = pyarrow.parquet
+        try:
+            appending = file.tell() > 0
+        except (OSError, ValueError):
+            appending = False  # A pipe
+        if appending:
+            raise ValueError('Parquet feeds cannot be appended to, overwrite them (-O or overwrite: true)')
+        self.file = file
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.catalog = CatalogReader(catalog_path) if catalog_path else None
+        self.schema = arrow_schema(COLUMNS)
+        self.writer = None
+        self.crawled_at = crawled_at
+        self.rows = []
+        self.rows_written = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        settings = crawler.settings
+        pipelines = settings.getdict('ITEM_PIPELINES')
+        kwargs.setdefault('row_group_size', settings.getint('TACOBELL_PARQUET_ROW_GROUP_SIZE', 10000))
+        kwargs.setdefault('compression', settings.get('TACOBELL_PARQUET_COMPRESSION', 'zstd'))
+        if 'tacobellpy.pipelines.OptionCatalogPipeline' in pipelines:
+            kwargs.setdefault('catalog_path', settings.get('TACOBELL_CATALOG_PATH'))
+        return cls(file, **kwargs)
+
+    def start_exporting(self):
+        if self.crawled_at is None:
+            self.crawled_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.writer = self.parquet.ParquetWriter(self.file, self.schema, compression=self.compression)
+
+    def export_item(self, item):
+        if not isinstance(item, Category):
+            item = Category.from_dict(dict(self._get_serialized_fields(item)))
+        self.rows.extend(self.rows_for(item))
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    def rows_for(self, item):
+        head = (self.crawled_at, item.store, item.title)
+        for product in item.products:
+            product_columns = head + (product.name, product.description, product.image_url, product.price_cents)
+            options = self.product_options(product)
+            if not options:
+                yield product_columns + (None, None, None, None)
+            for option in options:
+                yield product_columns + (option.group, option.name, option.price_cents, option.image_url)
+
+    def product_options(self, product):
+        if product.option_ids is None:
+            return product.options or []
+        return [Option.from_dict(option) for option in self.catalog.get(product.option_ids)]
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        import pyarrow as pa
+
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*self.rows), self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def finish_exporting(self):
+        self.write_row_group()
+        self.writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a Taco Bell JSON or JSON Lines feed to Parquet')
+    parser.add_argument('feed')
+    parser.add_argument('out')
+    parser.add_argument('--catalog', help='catalog of the options, for products with Ingredient ids')
+    parser.add_argument('--row-group-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    with open(args.feed, encoding='utf-8') as f:
+        if args.feed.endswith('.json'):
+            items = json.load(f)
+        else:
+            items = [json.loads(line) for line in f if line.strip()]
+    # The feed was written when the crawl ended
+    crawled_at = datetime.datetime.fromtimestamp(int(os.path.getmtime(args.feed)), datetime.timezone.utc)
+    with open(args.out, 'wb') as out:
+        exporter = ParquetItemExporter(out, row_group_size=args.row_group_size, catalog_path=args.catalog,
+                                       crawled_at=crawled_at)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+    print(f'{exporter.rows_written} rows written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
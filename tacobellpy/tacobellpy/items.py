@@ -1,12 +1,87 @@
-# Define here the models for your scraped items
+# Items of the Taco Bell spider.
 #
-# See documentation in:
-# https://docs.scrapy.org/en/latest/topics/items.html
+# A category of one store's menu holds its products, a product its ingredient
+# options (grouped by the option's category, "Add", "Sauces", ...). Prices are
+# parsed into integer cents once, when the spider builds the item, for the
+# pipelines and the Parquet feed; the price text as scraped ('1', '') is kept
+# next to them in raw_price. to_dict() renders the shape the feeds have always
+# had ('Title', 'Store', 'Menu' or 'Product', 'Ingredients details', prices as
+# the scraped strings), from_dict() reads it back.
 
-import scrapy
+from dataclasses import dataclass, field
 
+from menucommon.prices import feed_price, to_cents
 
-class TacobellpyItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+
+@dataclass(slots=True)
+class Option:
+    group: str | None
+    name: str | None
+    price_cents: int | None = None
+    image_url: str | None = None
+    raw_price: str | None = None
+
+    @classmethod
+    def from_dict(cls, option):
+        price = option.get('price')
+        return cls(option.get('category_name'), option.get('name'), to_cents(price), option.get('image_url'),
+                   price if isinstance(price, str) else None)
+
+    def to_dict(self):
+        return {'category_name': self.group, 'name': self.name,
+                'price': feed_price(self.raw_price, self.price_cents), 'image_url': self.image_url}
+
+
+@dataclass(slots=True)
+class Product:
+    name: str
+    price_cents: int | None = None
+    description: str | None = None
+    image_url: str | None = None
+    options: list | None = field(default_factory=list)  # Option, filled in by parse_details
+    option_ids: list | None = None  # Catalog IDs replacing options (OptionCatalogPipeline)
+    raw_price: str | None = None
+
+    @classmethod
+    def from_dict(cls, product):
+        options = product.get('Ingredients details')
+        price = product.get('price')
+        return cls(product.get('name'), to_cents(price), product.get('description'),
+                   product.get('image_url'),
+                   [Option.from_dict(option) for option in options] if options is not None else None,
+                   product.get('Ingredient ids'), price if isinstance(price, str) else None)
+
+    def to_dict(self):
+        product = {'name': self.name, 'price': feed_price(self.raw_price, self.price_cents),
+                   'description': self.description, 'image_url': self.image_url}
+        if self.option_ids is not None:
+            product['Ingredient ids'] = self.option_ids
+        else:
+            product['Ingredients details'] = [option.to_dict() for option in self.options or ()]
+        return product
+
+
+@dataclass(slots=True)
+class Category:
+    title: str | None
+    products: list  # Product
+    store: str | None = None
+    streamed: bool = False  # A single product as soon as its details are in ('Product')
+    key: str | None = None  # The spider's key of the category, not exported
+
+    @classmethod
+    def from_dict(cls, item):
+        if item.get('Product') is not None:
+            return cls(item.get('Title'), [Product.from_dict(item['Product'])], item.get('Store'), streamed=True)
+        return cls(item.get('Title'), [Product.from_dict(product) for product in item.get('Menu') or ()],
+                   item.get('Store'))
+
+    def to_dict(self):
+        item = {'Title': self.title}
+        if self.store:
+            item['Store'] = self.store
+        if self.streamed:
+            item['Product'] = self.products[0].to_dict()
+        else:
+            item['Menu'] = [product.to_dict() for product in self.products]
+        return item
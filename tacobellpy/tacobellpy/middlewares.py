@@ -3,60 +3,311 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import time
+
 from scrapy import signals
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
+from scrapy.exceptions import IgnoreRequest
 from scrapy.http import HtmlResponse
-import os
-import time
+from scrapy.utils.project import data_path
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+from urllib.parse import urlparse
+
+from menucommon.timing import record_timings, span
+
+from tacobellpy.browser import BrowserCrashed, BrowserPool, resolve_driver_path
+from tacobellpy.embedded import map_tacobell_page
+from tacobellpy.pagecache import RenderedPageCache
+from tacobellpy.profiles import ProfileSeats
+from tacobellpy.settle import PageSettler
+
+DEFAULT_DRIVER_PATH = 'C:/Users/user/Downloads/chromedriver-win64/chromedriver-win64/chromedriver.exe'
+
+# OneTrust sets this cookie once its banner has been dismissed
+CONSENT_GIVEN_JS = "return document.cookie.indexOf('OptanonAlertBoxClosed=') !== -1;"
+
+# Finds OneTrust's accept button and clicks it once it is visible and enabled,
+# in one script: with shared browsers another tab may take the window between
+# two driver commands, so a located element must not outlive the call
+ACCEPT_CONSENT_JS = """
+var button = document.getElementById('onetrust-accept-btn-handler');
+if (!button || button.disabled || !button.getClientRects().length) return false;
+button.click();
+return true;
+"""
+CONSENT_TIMEOUT = 10
+CONSENT_POLL = 0.25
+
 
 class SeleniumMiddleware:
-    def __init__(self):
-        path = 'C:/Users/user/Downloads/chromedriver-win64/chromedriver-win64/chromedriver.exe'
-        if not os.path.isfile(path):
-            raise FileNotFoundError(f"ChromeDriver not found at path: {path}")
+    # With SELENIUM_WORKERS = 0 pages are rendered synchronously inside the
+    # reactor thread, which blocks the whole crawl for every page load. With
+    # SELENIUM_WORKERS = N each request is handed to one of N browser workers on
+    # a thread pool and a Deferred is returned, so N pages render in parallel.
+    # SELENIUM_TABS_PER_BROWSER > 1 renders them in windows of shared browsers
+    # (see BrowserPool) instead of one browser each.
+    #
+    # Browsers are recycled after SELENIUM_BROWSER_MAX_PAGES pages or past
+    # SELENIUM_BROWSER_MAX_RSS_MB of memory, and replaced when they crash. A
+    # request whose browser died under it is scheduled again, up to
+    # SELENIUM_BROWSER_RETRIES times.
+    #
+    # With SELENIUM_PROFILES_ENABLED = True browsers run on warm profile
+    # directories kept between runs (see profiles.py).
+    #
+    # Requests with meta['consent'] = True get the OneTrust banner accepted
+    # before the page settles, while their browser is checked out; with
+    # SELENIUM_SKIP_CONSENT = True not when its consent cookie is already set.
+    # Browsers never leave the render, callbacks only get the page source.
+    #
+    # With SELENIUM_HTTP_FIRST = True pages are first fetched with the normal
+    # downloader. If the structured data embedded in the page is enough, the
+    # mapped result is attached as meta['embedded'] and no browser is
+    # used. Otherwise the request is sent back through the middleware with
+    # meta['render'] = True and rendered with Selenium.
+    #
+    # With SELENIUM_CACHE_ENABLED = True every page served here is kept in a
+    # RenderedPageCache and later requests for it are answered from disk until
+    # its TTL runs out. SELENIUM_CACHE_REPLAY = True serves cached pages only
+    # (ignoring TTLs) and drops everything else, without starting a browser.
+    #
+    # Only the /food pages of TACOBELL_BASE_URL (a local stand-in site in
+    # throughput runs) go through here.
+
+    def __init__(self, driver_path=DEFAULT_DRIVER_PATH, workers=0, settler=None, stats=None,
+                 block_resources=(), blocked_domains=(), http_first=False, cache=None,
+                 fingerprint=None, replay=False, base_url='https://www.tacobell.com', tabs_per_browser=1,
+                 max_pages=0, max_rss_mb=0, browser_retries=2, profiles=None, skip_consent=False):
+        netloc = urlparse(base_url).netloc
+        self.url_marker = f"{netloc[4:] if netloc.startswith('www.') else netloc}/food"
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self.replay = replay
+        if replay and cache is None:
+            raise ValueError("SELENIUM_CACHE_REPLAY needs SELENIUM_CACHE_ENABLED")
+
+        self.settler = settler or PageSettler()
+        self.stats = stats
+        self.http_first = http_first
+        self.workers = workers
+        self.browser_retries = browser_retries
+        self.skip_consent = skip_consent
+        # Image loading is switched off in the browser, so there is nothing to wait for
+        self.wait_for_images = 'image' not in block_resources
+        self.pool = None
+        self.threadpool = None
+        if replay:
+            return
+
+        # Resolved (cheaply) up front so a missing driver fails the crawl at
+        # start; the browsers themselves are launched by the first renders
+        driver_path = resolve_driver_path(driver_path)
+        self.pool = BrowserPool(driver_path, size=workers or 1, block_resources=block_resources,
+                                blocked_domains=blocked_domains, tabs_per_browser=tabs_per_browser,
+                                max_pages=max_pages, max_rss_mb=max_rss_mb, profiles=profiles)
+        if workers > 0:
+            self.threadpool = ThreadPool(minthreads=workers, maxthreads=workers, name='selenium')
+            self.threadpool.start()
 
-        service = Service(executable_path=path)
-        chrome_options = Options()
-        chrome_options.add_argument('--disable-gpu')
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        cache = None
+        if settings.getbool('SELENIUM_CACHE_ENABLED'):
+            cache = RenderedPageCache(
+                data_path(settings.get('SELENIUM_CACHE_DIR', 'pagecache'), createdir=True),
+                ttl=settings.getint('SELENIUM_CACHE_TTL', 0),
+                ttls=settings.getdict('SELENIUM_CACHE_TTLS'),
+                max_bytes=settings.getint('SELENIUM_CACHE_MAX_BYTES', 0),
+            )
+        profiles = None
+        if settings.getbool('SELENIUM_PROFILES_ENABLED'):
+            profiles = ProfileSeats(
+                data_path(settings.get('SELENIUM_PROFILES_DIR', 'profiles'), createdir=True),
+                template=settings.get('SELENIUM_PROFILE_TEMPLATE'),
+            )
+        s = cls(
+            driver_path=crawler.settings.get('SELENIUM_DRIVER_PATH', DEFAULT_DRIVER_PATH),
+            workers=crawler.settings.getint('SELENIUM_WORKERS', 0),
+            settler=PageSettler.from_settings(crawler.settings),
+            stats=crawler.stats,
+            block_resources=crawler.settings.getlist('SELENIUM_BLOCK_RESOURCES'),
+            blocked_domains=crawler.settings.getlist('SELENIUM_BLOCKED_DOMAINS'),
+            http_first=crawler.settings.getbool('SELENIUM_HTTP_FIRST'),
+            cache=cache,
+            fingerprint=lambda request: crawler.request_fingerprinter.fingerprint(request).hex(),
+            replay=crawler.settings.getbool('SELENIUM_CACHE_REPLAY'),
+            base_url=crawler.settings.get('TACOBELL_BASE_URL') or 'https://www.tacobell.com',
+            tabs_per_browser=crawler.settings.getint('SELENIUM_TABS_PER_BROWSER', 1),
+            max_pages=crawler.settings.getint('SELENIUM_BROWSER_MAX_PAGES', 0),
+            max_rss_mb=crawler.settings.getint('SELENIUM_BROWSER_MAX_RSS_MB', 0),
+            browser_retries=crawler.settings.getint('SELENIUM_BROWSER_RETRIES', 2),
+            profiles=profiles,
+            skip_consent=crawler.settings.getbool('SELENIUM_SKIP_CONSENT'),
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
 
     def process_request(self, request, spider):
         # Adjusted to apply to all product detail URLs
-        if "tacobell.com/food" in request.url:
-            self.driver.get(request.url)
-            self._scroll_to_load_content()
-            self._wait_for_images()
-            body = self.driver.page_source
-            response = HtmlResponse(url=request.url, body=body, encoding='utf-8', request=request)
-            response.meta['driver'] = self.driver  # Attach driver to the response meta
+        if self.url_marker in request.url:
+            if self.cache is not None:
+                response = self._from_cache(request, spider)
+                if response is not None:
+                    return response
+                if self.replay:
+                    raise IgnoreRequest(f"Not in the page cache (replay mode): {request.url}")
+            if self.http_first and not request.meta.get('render'):
+                return None  # Plain download first, see process_response
+            if self.threadpool is None:
+                try:
+                    response = self._render(request)
+                except BrowserCrashed as e:
+                    return self._requeue(request, e, spider)
+                return self._settled(response, spider)
+            from twisted.internet import reactor
+            d = threads.deferToThreadPool(reactor, self.threadpool, self._render, request)
+            d.addCallbacks(self._settled, self._crashed, callbackArgs=(spider,), errbackArgs=(request, spider))
+            return d
+
+    def process_response(self, request, response, spider):
+        if not self.http_first or request.meta.get('render') or self.url_marker not in request.url:
             return response
+        # The response isn't tied to its request until it leaves the
+        # downloader, so results for the callback go to request.meta
+        if 'page_cache' in response.flags:
+            # Either an HTTP page whose embedded data mapped, or a rendered
+            # page; both can be parsed as they are
+            if request.meta.get('embedded') is None:
+                request.meta['embedded'] = map_tacobell_page(response)
+            return response
+
+        embedded = None
+        if response.status == 200 and isinstance(response, HtmlResponse):
+            embedded = map_tacobell_page(response)
+        if embedded is None:
+            spider.logger.debug(f"No usable embedded data in {response.url}, rendering with Selenium")
+            if self.stats is not None:
+                self.stats.inc_value('selenium/http_first/fallback', spider=spider)
+            return request.replace(meta=dict(request.meta, render=True), dont_filter=True)
+
+        if self.stats is not None:
+            self.stats.inc_value('selenium/http_first/embedded', spider=spider)
+        request.meta['embedded'] = embedded
+        self._to_cache(request, response.body, spider)
+        return response
+
+    def _from_cache(self, request, spider):
+        body = self.cache.get(self.fingerprint(request), request.url, ignore_ttl=self.replay)
+        if self.stats is not None:
+            self.stats.inc_value('selenium/cache/hit' if body is not None else 'selenium/cache/miss', spider=spider)
+        if body is None:
+            return None
+        return HtmlResponse(url=request.url, body=body, encoding='utf-8', request=request, flags=['page_cache'])
+
+    def _to_cache(self, request, body, spider, compressed=None):
+        if self.cache is None:
+            return
+        evicted = self.cache.store(self.fingerprint(request), body, compressed)
+        if self.stats is not None:
+            self.stats.inc_value('selenium/cache/stored', spider=spider)
+            if evicted:
+                self.stats.inc_value('selenium/cache/evicted', evicted, spider=spider)
+
+    def _render(self, request):
+        # Phase spans are collected in request.meta['timings'] and recorded to
+        # the stats by _settled, in the reactor thread
+        timings = request.meta.setdefault('timings', [])
+        with self.pool.checkout() as driver:
+            with span(timings, 'driver_get'):
+                driver.get(request.url)
+            if request.meta.get('consent'):
+                with span(timings, 'consent'):
+                    request.meta['consent_result'] = self._accept_consent(driver)
+            with span(timings, 'settle'):
+                request.meta['settle_time'], request.meta['settle_reason'] = \
+                    self._scroll_to_load_content(driver, request.url)
+            request.meta['images_time'], request.meta['images_pending'] = 0.0, 0
+            if self.wait_for_images:
+                with span(timings, 'images'):
+                    request.meta['images_time'], request.meta['images_pending'] = self._wait_for_images(driver)
+            with span(timings, 'page_source'):
+                body = driver.page_source
+        if self.cache is not None:
+            # Off the reactor thread, _settled only writes it
+            with span(timings, 'compress'):
+                request.meta['page_cache_gz'] = self.cache.compress(body.encode('utf-8'))
+        with span(timings, 'response'):
+            response = HtmlResponse(url=request.url, body=body, encoding='utf-8', request=request)
+        return response
+
+    def _accept_consent(self, driver):
+        # Runs in the render, before the page settles; returns what was done
+        # for the selenium/consent/* stats
+        # A warm browser profile already has OneTrust's consent cookie
+        if self.skip_consent and driver.execute_script(CONSENT_GIVEN_JS):
+            return 'skipped'
+        deadline = time.monotonic() + CONSENT_TIMEOUT
+        while not driver.execute_script(ACCEPT_CONSENT_JS):
+            if time.monotonic() >= deadline:
+                return 'no_banner'  # Accepted on an earlier store's menu in this browser
+            time.sleep(CONSENT_POLL)
+        return 'accepted'
+
+    def _crashed(self, failure, request, spider):
+        failure.trap(BrowserCrashed)
+        return self._requeue(request, failure.value, spider)
+
+    def _requeue(self, request, error, spider):
+        # The render's browser died; the pool has already replaced it
+        if self.stats is not None:
+            self.pool.flush_stats(self.stats, spider)
+        retries = request.meta.get('browser_retries', 0)
+        if retries >= self.browser_retries:
+            raise error
+        spider.logger.warning(f"{error}, rendering {request.url} again")
+        if self.stats is not None:
+            self.stats.inc_value('selenium/requeued', spider=spider)
+        meta = dict(request.meta, browser_retries=retries + 1)
+        meta.pop('timings', None)
+        return request.replace(meta=meta, dont_filter=True)
+
+    def _settled(self, response, spider):
+        # Runs in the reactor thread, so the stats collector is only touched from there
+        settle_time = response.meta['settle_time']
+        images_time = response.meta['images_time']
+        spider.logger.debug(
+            f"Settled {response.url} in {settle_time:.2f}s ({response.meta['settle_reason']}), "
+            f"images in {images_time:.2f}s ({response.meta['images_pending']} still loading)")
+        if self.stats is not None:
+            self.stats.inc_value('selenium/settle/count', spider=spider)
+            self.stats.inc_value(f"selenium/settle/reason/{response.meta['settle_reason']}", spider=spider)
+            self.stats.inc_value('selenium/settle/time_total', settle_time + images_time, spider=spider)
+            self.stats.max_value('selenium/settle/time_max', settle_time + images_time, spider=spider)
+            if response.meta['images_pending']:
+                self.stats.inc_value('selenium/settle/images_timeout', spider=spider)
+            if response.meta.get('consent_result'):
+                self.stats.inc_value(f"selenium/consent/{response.meta['consent_result']}", spider=spider)
+            record_timings(self.stats, response.meta['timings'], spider)
+            self.pool.flush_stats(self.stats, spider)
+        self._to_cache(response.request, response.body, spider, response.meta.pop('page_cache_gz', None))
+        return response
+
+    def _scroll_to_load_content(self, driver, url):
+        return self.settler.settle(driver, url)
 
-    def _scroll_to_load_content(self):
-        last_height = self.driver.execute_script("return document.body.scrollHeight")
-        while True:
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)  # Adjust as needed
-            new_height = self.driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-
-    def _wait_for_images(self):
-        images = self.driver.find_elements(By.TAG_NAME, 'img')
-        for img in images:
-            if not img.get_attribute('complete'):
-                self.driver.execute_script("arguments[0].scrollIntoView();", img)
-                time.sleep(1)  # Adjust wait time if needed
+    def _wait_for_images(self, driver):
+        return self.settler.wait_for_images(driver)
 
     def spider_closed(self, spider):
-        self.driver.quit()
+        if self.threadpool is not None:
+            self.threadpool.stop()
+        if self.pool is not None:
+            self.pool.close()
 
 
 
@@ -0,0 +1,104 @@
+# Disk-backed cache of rendered page sources for SeleniumMiddleware.
+#
+# Each page is stored gzipped under its request fingerprint. Entries expire
+# after a per-URL-pattern TTL, and the least recently used ones are evicted
+# once the cache grows past max_bytes. In replay mode the middleware serves
+# pages from here only and never opens a browser or touches the network.
+#
+# Entries are kept in least recently used order, so an eviction takes the
+# first one. compress() can run in a render thread, leaving store() only the
+# file write and the bookkeeping.
+
+import gzip
+import os
+import re
+import time
+from collections import OrderedDict
+
+SUFFIX = '.html.gz'
+
+
+class RenderedPageCache:
+
+    def __init__(self, cache_dir, ttl=0, ttls=None, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.ttl = ttl  # seconds, 0 never expires
+        # URL regex -> TTL in seconds, first match wins
+        self.ttls = [(re.compile(pattern), seconds) for pattern, seconds in (ttls or {}).items()]
+        self.max_bytes = max_bytes  # 0 means unbounded
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # fingerprint -> [stored at, size in bytes], least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        found = []
+        for name in os.listdir(cache_dir):
+            if name.endswith(SUFFIX):
+                stat = os.stat(os.path.join(cache_dir, name))
+                found.append((stat.st_mtime, name[:-len(SUFFIX)], stat.st_size))
+        for mtime, fingerprint, size in sorted(found):
+            self.entries[fingerprint] = [mtime, size]
+            self.total_bytes += size
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint + SUFFIX)
+
+    def ttl_for(self, url):
+        for pattern, seconds in self.ttls:
+            if pattern.search(url):
+                return seconds
+        return self.ttl
+
+    def get(self, fingerprint, url, ignore_ttl=False):
+        entry = self.entries.get(fingerprint)
+        if entry is None:
+            return None
+        ttl = self.ttl_for(url)
+        if not ignore_ttl and ttl and time.time() - entry[0] > ttl:
+            return None
+        try:
+            with gzip.open(self._path(fingerprint), 'rb') as f:
+                body = f.read()
+        except OSError:
+            self._remove(fingerprint)
+            return None
+        self.entries.move_to_end(fingerprint)
+        return body
+
+    @staticmethod
+    def compress(body):
+        return gzip.compress(body, compresslevel=5)
+
+    def store(self, fingerprint, body=None, compressed=None):
+        # Either the page source or compress() of it
+        if compressed is None:
+            compressed = self.compress(body)
+        path = self._path(fingerprint)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)  # Readers never see a half-written page
+
+        old = self.entries.pop(fingerprint, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        self.entries[fingerprint] = [time.time(), len(compressed)]
+        self.total_bytes += len(compressed)
+        return self._evict()
+
+    def _evict(self):
+        # The entry just stored is the last one and always stays
+        evicted = 0
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            evicted += 1
+        return evicted
+
+    def _remove(self, fingerprint):
+        entry = self.entries.pop(fingerprint, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+        try:
+            os.remove(self._path(fingerprint))
+        except OSError:
+            pass
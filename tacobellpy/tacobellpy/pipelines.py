@@ -4,10 +4,203 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
-# useful for handling different item types with a single interface
-from itemadapter import ItemAdapter
+import json
+from dataclasses import replace
+
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.job import job_dir
+
+from menucommon.catalog import Catalog
+from menucommon.snapshots import SnapshotIndex
+
+from tacobellpy.catalog import CatalogWriter, read_catalog
+from tacobellpy.items import Category
 
 
 class TacobellpyPipeline:
+    # Validates the category items before the other pipelines see them:
+    # products and options without a name are dropped, negative prices are
+    # cleared, and a category left without products is dropped. Changed
+    # products and options are copies: the spider may still hold the
+    # originals for another store's menu with the same listing.
+
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_item(self, item, spider):
+        if not isinstance(item, Category):
+            raise DropItem(f'Not a Category item: {type(item).__name__}')
+        products = []
+        for product in item.products:
+            if not product.name:
+                self.inc_stat('validation/products_dropped')
+                continue
+            if product.price_cents is not None and product.price_cents < 0:
+                spider.logger.warning(f'Negative price {product.price_cents} of {product.name!r} cleared')
+                product = replace(product, price_cents=None, raw_price=None)
+                self.inc_stat('validation/prices_cleared')
+            if product.options:
+                options = [option for option in product.options if option.name]
+                changed = len(options) < len(product.options)
+                if changed:
+                    self.inc_stat('validation/options_dropped', len(product.options) - len(options))
+                for i, option in enumerate(options):
+                    if option.price_cents is not None and option.price_cents < 0:
+                        options[i] = replace(option, price_cents=None, raw_price=None)
+                        self.inc_stat('validation/prices_cleared')
+                        changed = True
+                if changed:
+                    product = replace(product, options=options)
+            products.append(product)
+        if not products:
+            raise DropItem(f'No valid products in {item.title!r}')
+        return replace(item, products=products)
+
+    def inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+
+class OptionCatalogPipeline:
+    # Moves the ingredient options of every product into the catalog at
+    # TACOBELL_CATALOG_PATH (see catalog.py): a product's options are
+    # replaced by their catalog IDs, in the same order ('Ingredient ids' in
+    # the feeds). A crawl resumed from a JOBDIR adds to the catalog of its
+    # earlier runs. The IDs are remembered by the fields of the option, so
+    # only options not seen before are serialized and hashed. Slimmed
+    # products are copies, as in TacobellpyPipeline.
+
+    def __init__(self, path, append=False, stats=None, max_ids=100000):
+        self.path = path
+        self.append = append
+        self.stats = stats
+        self.max_ids = max_ids
+        self.ids = {}  # Catalog IDs by fields
+        self.writer = None
+        self.catalog = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('TACOBELL_CATALOG_PATH')
+        if not path:
+            raise NotConfigured('TACOBELL_CATALOG_PATH is not set')
+        return cls(path, append=bool(job_dir(crawler.settings)), stats=crawler.stats)
+
+    def open_spider(self, spider):
+        ids = read_catalog(self.path) if self.append else ()
+        self.writer = CatalogWriter(self.path, append=self.append)
+        self.catalog = Catalog(self.writer, ids)
+
     def process_item(self, item, spider):
+        written = len(self.catalog.ids)
+        products = []
+        for product in item.products:
+            if product.option_ids is None:
+                product = replace(product, options=None,
+                                  option_ids=[self.option_id(option) for option in product.options or ()])
+            products.append(product)
+        item = replace(item, products=products)
+        if len(self.catalog.ids) > written:
+            self.writer.flush()  # Options on disk before the items referencing them
+        if self.stats is not None:
+            self.stats.set_value('catalog/records', len(self.catalog.ids))
+            self.stats.set_value('catalog/references', self.catalog.references)
         return item
+
+    def option_id(self, option):
+        # The ID of the option as the feeds have always shown it
+        fields = (option.group, option.name, option.price_cents, option.image_url, option.raw_price)
+        key = self.ids.get(fields)
+        if key is not None:
+            return self.catalog.reference(key)
+        key = self.catalog.intern('option', option.to_dict())
+        if len(self.ids) >= self.max_ids:
+            self.ids.clear()
+        self.ids[fields] = key
+        return key
+
+    def close_spider(self, spider):
+        self.writer.close()
+        spider.logger.info(
+            f"Catalog {self.path}: {len(self.catalog.ids)} distinct options for "
+            f"{self.catalog.references} references")
+
+
+class MenuDiffPipeline:
+    # Compares every product with the one of the previous crawl in the index
+    # at TACOBELL_SNAPSHOT_PATH (see snapshots.py) and writes what changed to
+    # TACOBELL_CHANGES_PATH as JSON Lines while the crawl runs: added,
+    # price, changed (other fields), option_added, option_price and
+    # option_removed. Products gone from a store are written as removed when
+    # the crawl finishes; an interrupted crawl reports no removals.
+
+    def __init__(self, index_path, changes_path, stats=None):
+        self.index_path = index_path
+        self.changes_path = changes_path
+        self.stats = stats
+        self.index = None
+        self.file = None
+        self.stores = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        index_path = settings.get('TACOBELL_SNAPSHOT_PATH')
+        changes_path = settings.get('TACOBELL_CHANGES_PATH')
+        if not index_path or not changes_path:
+            raise NotConfigured('TACOBELL_SNAPSHOT_PATH or TACOBELL_CHANGES_PATH is not set')
+        pipeline = cls(index_path, changes_path, stats=crawler.stats)
+        # After close_spider, but with the close reason
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.index = SnapshotIndex(self.index_path)
+        self.file = open(self.changes_path, 'w', encoding='utf-8')
+        if self.index.baseline:
+            spider.logger.info(f'No finished crawl in {self.index_path} yet, this one is the baseline')
+
+    def process_item(self, item, spider):
+        self.stores.add(item.store)
+        for product in item.products:
+            fields = [product.name, product.description, product.image_url, product.price_cents]
+            changes = self.index.diff(
+                item.store, item.title, product.name, product.price_cents, fields, self.product_groups(product))
+            self.write(changes)
+        self.file.flush()
+        return item
+
+    def product_groups(self, product):
+        # {option group: ([(option, cents), ...], options)}, None without options
+        # (a failed detail page looks the same as a product without options)
+        if not product.options:
+            return None
+        groups = {}
+        for option in product.options:
+            prices, content = groups.setdefault(option.group or '', ([], []))
+            prices.append((option.name, option.price_cents))
+            content.append(option.to_dict())
+        return groups
+
+    def write(self, changes):
+        for change in changes:
+            change['crawl'] = self.index.crawl
+            self.file.write(json.dumps(change, ensure_ascii=False) + '\n')
+            if self.stats is not None:
+                self.stats.inc_value(f"changes/{change['change']}")
+
+    def spider_closed(self, spider, reason):
+        if reason == 'finished':
+            for store in self.stores:
+                self.write(self.index.removed(store))
+            self.index.finish()
+        else:
+            spider.logger.warning(f'Crawl ended with {reason!r}, removed products are not reported')
+        self.file.close()
+        self.index.close()
+        spider.logger.info(f'Changes since the previous crawl written to {self.changes_path}')
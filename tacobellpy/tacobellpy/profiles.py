@@ -0,0 +1,149 @@
+# Warm Chrome profile directories for the browsers of SeleniumMiddleware.
+#
+# Every running browser gets a profile directory of its own (Chrome can't
+# share one between processes), a "seat". Seats are kept between runs, so the
+# OneTrust consent cookie, localStorage and Chrome's HTTP cache of a seat are
+# still there the next time a browser starts on it, after a recycle or in the
+# next crawl. A new seat starts as a copy of the template profile when one is
+# configured, and empty otherwise.
+#
+# A seat is held with an OS lock on browser-<n>.lock next to its directory,
+# so crawls sharing the profiles directory skip each other's seats; Chrome's
+# own lock files in a seat are only cleared once its lock is ours.
+#
+# Build a template once with
+#
+#     python -m tacobellpy.profiles path/to/template [--base-url URL] [--driver-path PATH]
+#
+# which accepts the consent banner and loads a category page into its cache.
+
+import argparse
+import glob
+import heapq
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Left behind by a Chrome that didn't exit cleanly, or only valid for the
+# process that created them
+PROFILE_LOCK_FILES = ('Singleton*', 'lockfile', 'Crashpad')
+
+
+def lock_file(path):
+    # The open file holding an exclusive lock on `path`, or None when another
+    # process (or another seat of this one) holds it
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def unlock_file(f):
+    if fcntl is None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.close()  # Which also drops a flock
+
+
+class ProfileSeats:
+
+    def __init__(self, root, template=None):
+        self.root = root
+        self.template = template
+        self.free = []  # Seat numbers released by quit browsers (heap)
+        self.next_seat = 0
+        self.held = {}  # seat -> its locked file
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # The profile directory of the lowest free seat, ready to use
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock:
+            while True:
+                seat = heapq.heappop(self.free) if self.free else self.next_seat
+                if seat == self.next_seat:
+                    self.next_seat += 1
+                held = lock_file(os.path.join(self.root, f'browser-{seat}.lock'))
+                if held is not None:
+                    self.held[seat] = held
+                    break
+                # In use by another crawl; it's not offered again by this one
+        path = os.path.join(self.root, f'browser-{seat}')
+        if not os.path.isdir(path):
+            if self.template and os.path.isdir(self.template):
+                shutil.copytree(self.template, path, ignore=shutil.ignore_patterns(*PROFILE_LOCK_FILES))
+            else:
+                os.makedirs(path)
+        self._clear_locks(path)
+        return path
+
+    def release(self, path):
+        seat = int(os.path.basename(path).rsplit('-', 1)[1])
+        with self.lock:
+            unlock_file(self.held.pop(seat))
+            heapq.heappush(self.free, seat)
+
+    def _clear_locks(self, path):
+        # The seat's lock is ours, so any Chrome lock in it is stale
+        for pattern in PROFILE_LOCK_FILES:
+            for stale in glob.glob(os.path.join(path, pattern)):
+                if os.path.isdir(stale) and not os.path.islink(stale):
+                    shutil.rmtree(stale, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+
+
+def warm_template(path, base_url='https://www.tacobell.com', driver_path=None):
+    # Runs a browser on `path` through the consent banner and one category
+    # page, leaving cookies, localStorage and cache behind
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    from tacobellpy.browser import create_driver, resolve_driver_path
+
+    os.makedirs(path, exist_ok=True)
+    driver = create_driver(resolve_driver_path(driver_path), profile_dir=path)
+    try:
+        driver.get(f'{base_url}/food')
+        try:
+            WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.ID, 'onetrust-accept-btn-handler'))
+            ).click()
+        except Exception:
+            pass  # Already accepted in this profile, or no banner (stand-in site)
+        links = driver.find_elements(By.CSS_SELECTOR, 'article[class*="styles_card__"] a')
+        if links:
+            driver.get(links[0].get_attribute('href'))
+    finally:
+        driver.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a warm Chrome profile template')
+    parser.add_argument('path')
+    parser.add_argument('--base-url', default='https://www.tacobell.com')
+    parser.add_argument('--driver-path')
+    args = parser.parse_args(argv)
+    warm_template(args.path, args.base_url.rstrip('/'), args.driver_path)
+    print(f'Template profile written to {args.path}; set SELENIUM_PROFILE_TEMPLATE to it')
+
+
+if __name__ == '__main__':
+    main()
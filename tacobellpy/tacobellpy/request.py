@@ -0,0 +1,19 @@
+# The request type the spider sends to SeleniumMiddleware.
+#
+# Same arguments as scrapy_selenium.SeleniumRequest, which is all the spider
+# used that package for; importing it pulled selenium into every process that
+# loads the spider, `scrapy list` included.
+
+from scrapy import Request
+
+
+class SeleniumRequest(Request):
+
+    attributes = Request.attributes + ('wait_time', 'wait_until', 'screenshot', 'script')
+
+    def __init__(self, wait_time=None, wait_until=None, screenshot=False, script=None, *args, **kwargs):
+        self.wait_time = wait_time
+        self.wait_until = wait_until
+        self.screenshot = screenshot
+        self.script = script
+        super().__init__(*args, **kwargs)
@@ -61,6 +61,125 @@ DOWNLOADER_MIDDLEWARES = {
     # Add other middlewares here if necessary
 }
 
+# Site to crawl. Point it at the local stand-in (python benchmarks/standin.py)
+# to measure full-crawl throughput without touching tacobell.com; start_urls
+# and allowed_domains follow it.
+TACOBELL_BASE_URL = 'https://www.tacobell.com'
+
+# Store menus to crawl (/food?store=<id>), one store ID per line; the default
+# menu when unset. Stores whose category listings are identical share the
+# product details rendered for the first of them (tacobell/listings/* stats).
+TACOBELL_STORES_FILE = None
+
+# Selenium rendering
+SELENIUM_DRIVER_PATH = 'C:/Users/user/Downloads/chromedriver-win64/chromedriver-win64/chromedriver.exe'
+# Number of browser workers rendering pages in parallel on a thread pool.
+# 0 renders synchronously inside the reactor thread (blocks the crawl).
+# Keep CONCURRENT_REQUESTS_PER_DOMAIN (default 8) at or above this value.
+SELENIUM_WORKERS = 4
+# Renders served by one browser, each in its own window with its own cookies
+# and storage. Several per browser fit more in-flight pages in the same
+# memory; SELENIUM_WORKERS / SELENIUM_TABS_PER_BROWSER browsers are launched
+# (more if a browser can't open its windows). 1 is a browser per render.
+SELENIUM_TABS_PER_BROWSER = 1
+# Browser lifecycle: a browser is relaunched after this many pages, or once
+# chromedriver and its Chrome processes use more than this much resident
+# memory (needs psutil; 0 disables either check). Pages whose browser
+# crashed under them are rendered again up to SELENIUM_BROWSER_RETRIES times.
+# Recycles and crashes are counted in the browser/* stats.
+SELENIUM_BROWSER_MAX_PAGES = 200
+SELENIUM_BROWSER_MAX_RSS_MB = 1500
+SELENIUM_BROWSER_RETRIES = 2
+
+# Warm browser profiles (off by default), kept under
+# .scrapy/<SELENIUM_PROFILES_DIR>, one per concurrently running browser, so
+# the consent cookie, localStorage and Chrome's HTTP cache survive browser
+# recycles and runs. New ones start as a copy of SELENIUM_PROFILE_TEMPLATE
+# when set (build one with python -m tacobellpy.profiles <dir>). With
+# SELENIUM_SKIP_CONSENT (also off by default) the middleware doesn't wait for
+# the OneTrust banner once its consent cookie is set.
+SELENIUM_PROFILES_ENABLED = False
+SELENIUM_PROFILES_DIR = 'profiles'
+SELENIUM_PROFILE_TEMPLATE = None
+SELENIUM_SKIP_CONSENT = False
+
+# HTTP-first mode (off by default): fetch pages with the normal downloader and
+# use the JSON embedded in them (__NEXT_DATA__, JSON-LD, hydration blobs).
+# Only pages whose embedded data can't be mapped are rendered with Selenium.
+SELENIUM_HTTP_FIRST = False
+
+# Page settling: poll in-page signals instead of sleeping a fixed time.
+# A page is settled when its ready selector (if any) matches at least the given
+# number of elements and, like the count, the scroll height stopped changing
+# with no DOM mutation for SELENIUM_SETTLE_QUIET_TIME seconds; or, without a
+# ready match, when the scroll height is stable for
+# SELENIUM_SETTLE_STABLE_POLLS polls and the DOM was quiet as long. The
+# *_MAX_TIME values are upper bounds.
+SELENIUM_SETTLE_MAX_TIME = 15.0
+SELENIUM_SETTLE_IMAGES_MAX_TIME = 5.0
+SELENIUM_SETTLE_POLL_INTERVAL = 0.25
+SELENIUM_SETTLE_STABLE_POLLS = 3
+SELENIUM_SETTLE_QUIET_TIME = 0.5
+SELENIUM_SETTLE_READY_SELECTORS = {
+    r'/food/?(\?.*)?$': ('article[class*="styles_card__"]', 1),
+    r'/food/[^/?]+/?(\?.*)?$': ('div[class*="styles_product-card__"]', 1),
+}
+
+# Resource-blocking render profile. The spiders only read img/@src, so images,
+# fonts and media are never downloaded, and neither is anything from the
+# domains below. Leave the OneTrust (cookielaw.org) banner alone: the
+# middleware clicks it. Set SELENIUM_BLOCK_RESOURCES = [] for a full render.
+SELENIUM_BLOCK_RESOURCES = ['image', 'font', 'media']
+SELENIUM_BLOCKED_DOMAINS = [
+    'appsflyer.com',
+    'techlab-cdn.com',
+    'googletagmanager.com',
+    'google-analytics.com',
+    'doubleclick.net',
+    'facebook.net',
+    'tiktok.com',
+    'nutritionix.com',
+]
+
+# Rendered-page cache (off by default: it serves pages up to a TTL old),
+# stored under .scrapy/<SELENIUM_CACHE_DIR>. TTLs are in seconds (0 never
+# expires) and the first matching URL pattern wins. The least recently used
+# pages are evicted past SELENIUM_CACHE_MAX_BYTES. SELENIUM_CACHE_REPLAY =
+# True serves cached pages only, with no browser and no network, e.g. to
+# rerun parsing changes over a full crawl.
+SELENIUM_CACHE_ENABLED = False
+SELENIUM_CACHE_DIR = 'pagecache'
+SELENIUM_CACHE_TTL = 24 * 60 * 60
+SELENIUM_CACHE_TTLS = {
+    r'/food/?(\?.*)?$': 24 * 60 * 60,
+    r'/food/[^/?]+/?(\?.*)?$': 24 * 60 * 60,
+    r'/food/[^/?]+/[^/?]+': 7 * 24 * 60 * 60,
+}
+SELENIUM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SELENIUM_CACHE_REPLAY = False
+
+# Pause/resume: with a JOBDIR (e.g. scrapy crawl tacobell_spider -s
+# JOBDIR=crawls/tacobell-1) the spider also keeps its categories and captured
+# product details in JOBDIR/tacobell_state.sqlite. Restarting with the same
+# JOBDIR, even after a crash, skips product pages already captured.
+#JOBDIR = "crawls/tacobell-1"
+
+# Per-phase timing (driver.get, settle, images, page_source, response and the
+# spider callbacks) is kept in the stats as timing/<phase>/* histograms and
+# written to TIMING_PROMETHEUS_FILE every TIMING_PROMETHEUS_INTERVAL seconds,
+# for node_exporter's textfile collector. Pages slower in total than the
+# threshold of their URL pattern (seconds, first match wins) are logged.
+EXTENSIONS = {
+    "menucommon.timing.PhaseTimingExporter": 500,
+}
+TIMING_PROMETHEUS_FILE = "metrics/tacobellpy.prom"
+TIMING_PROMETHEUS_INTERVAL = 15
+TIMING_SLOW_PAGES = {
+    r'/food/?(\?.*)?$': 30,
+    r'/food/[^/?]+/?(\?.*)?$': 30,
+    r'/food/[^/?]+/[^/?]+': 20,
+}
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
@@ -72,6 +191,24 @@ DOWNLOADER_MIDDLEWARES = {
 #ITEM_PIPELINES = {
 #    "tacobellpy.pipelines.TacobellpyPipeline": 300,
 #}
+# TacobellpyPipeline validates the items before the others see them
+ITEM_PIPELINES = {
+    "tacobellpy.pipelines.TacobellpyPipeline": 300,
+    "tacobellpy.pipelines.MenuDiffPipeline": 600,
+}
+# With "tacobellpy.pipelines.OptionCatalogPipeline": 700 added to
+# ITEM_PIPELINES, ingredient options are written once each to
+# TACOBELL_CATALOG_PATH (JSON Lines, keyed by a hash of their content) and
+# products carry their catalog IDs in 'Ingredient ids' instead of the options
+# themselves. Without it the feeds' products are self-contained.
+TACOBELL_CATALOG_PATH = "tacobell_catalog.jsonl"
+
+# Products are compared with the previous crawl, kept in the SQLite index at
+# TACOBELL_SNAPSHOT_PATH, and only the changes are written to
+# TACOBELL_CHANGES_PATH (JSON Lines, rewritten by every crawl). The first
+# crawl only builds the index.
+TACOBELL_SNAPSHOT_PATH = "tacobell_snapshot.sqlite"
+TACOBELL_CHANGES_PATH = "tacobell_changes.jsonl"
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -99,5 +236,19 @@ REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
+# JSON and JSON Lines feeds write the Category items through their own
+# serializer. "-O menus.parquet" writes a flat Parquet table, one row per
+# ingredient option with prices in integer cents (see exporters.py), a row
+# group every TACOBELL_PARQUET_ROW_GROUP_SIZE rows. Needs the pyarrow package.
+FEED_EXPORTERS = {
+    "json": "tacobellpy.exporters.JsonItemExporter",
+    "jsonlines": "tacobellpy.exporters.JsonLinesItemExporter",
+    "jsonl": "tacobellpy.exporters.JsonLinesItemExporter",
+    "jl": "tacobellpy.exporters.JsonLinesItemExporter",
+    "parquet": "tacobellpy.exporters.ParquetItemExporter",
+}
+TACOBELL_PARQUET_ROW_GROUP_SIZE = 10000
+TACOBELL_PARQUET_COMPRESSION = "zstd"
+
 
 
@@ -0,0 +1,123 @@
+# Readiness-based page settling for SeleniumMiddleware.
+#
+# Instead of sleeping a fixed amount per scroll step and per image, the page
+# is polled at a short interval and considered settled as soon as one of the
+# in-page signals says so:
+#   - a "ready" selector configured for the URL matches at least N elements,
+#     the count and the scroll height stopped changing and the DOM has been
+#     quiet for the quiet period (content lazy loaded past the first N
+#     elements is still waited for), or
+#   - the scroll height stayed the same for a few polls and a MutationObserver
+#     saw no DOM changes for a quiet period.
+# Every wait is capped so a page that never settles costs at most max_time.
+
+import re
+import time
+
+# Installs a MutationObserver that records the time of the last DOM change.
+INSTALL_OBSERVER_JS = """
+if (!window.__settleObserver) {
+    window.__settleLastMutation = performance.now();
+    window.__settleObserver = new MutationObserver(function () {
+        window.__settleLastMutation = performance.now();
+    });
+    window.__settleObserver.observe(document, {childList: true, subtree: true, attributes: true});
+}
+"""
+
+# Scrolls to the bottom and reports everything a poll needs in one round trip.
+POLL_JS = """
+window.scrollTo(0, document.body.scrollHeight);
+var selector = arguments[0];
+return {
+    height: document.body.scrollHeight,
+    quiet: (performance.now() - (window.__settleLastMutation || 0)) / 1000,
+    ready: selector ? document.querySelectorAll(selector).length : -1
+};
+"""
+
+# Brings the first image that hasn't finished loading into view and returns
+# how many are still pending.
+PENDING_IMAGES_JS = """
+var pending = Array.prototype.filter.call(document.images, function (img) {
+    return !img.complete;
+});
+if (pending.length) {
+    pending[0].scrollIntoView();
+}
+return pending.length;
+"""
+
+
+class PageSettler:
+
+    def __init__(self, max_time=15.0, images_max_time=5.0, poll_interval=0.25,
+                 stable_polls=3, quiet_time=0.5, ready_selectors=None):
+        self.max_time = max_time
+        self.images_max_time = images_max_time
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.quiet_time = quiet_time
+        # URL regex -> (css selector, minimum count)
+        self.ready_selectors = [
+            (re.compile(pattern), selector, min_count)
+            for pattern, (selector, min_count) in (ready_selectors or {}).items()
+        ]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            max_time=settings.getfloat('SELENIUM_SETTLE_MAX_TIME', 15.0),
+            images_max_time=settings.getfloat('SELENIUM_SETTLE_IMAGES_MAX_TIME', 5.0),
+            poll_interval=settings.getfloat('SELENIUM_SETTLE_POLL_INTERVAL', 0.25),
+            stable_polls=settings.getint('SELENIUM_SETTLE_STABLE_POLLS', 3),
+            quiet_time=settings.getfloat('SELENIUM_SETTLE_QUIET_TIME', 0.5),
+            ready_selectors=settings.getdict('SELENIUM_SETTLE_READY_SELECTORS'),
+        )
+
+    def ready_selector_for(self, url):
+        for pattern, selector, min_count in self.ready_selectors:
+            if pattern.search(url):
+                return selector, min_count
+        return None, 0
+
+    def settle(self, driver, url):
+        # Returns (seconds spent, reason) once the page content has settled
+        start = time.monotonic()
+        deadline = start + self.max_time
+        selector, min_count = self.ready_selector_for(url)
+
+        driver.execute_script(INSTALL_OBSERVER_JS)
+        last_height = None
+        last_ready = None
+        stable = 0
+        reason = 'timeout'
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            state = driver.execute_script(POLL_JS, selector)
+
+            stable = stable + 1 if state['height'] == last_height else 0
+            last_height = state['height']
+            quiet = state['quiet'] >= self.quiet_time
+
+            if (selector and state['ready'] >= min_count and state['ready'] == last_ready
+                    and stable and quiet):
+                reason = 'ready'
+                break
+            last_ready = state['ready']
+
+            if stable >= self.stable_polls and quiet:
+                reason = 'stable'
+                break
+
+        return time.monotonic() - start, reason
+
+    def wait_for_images(self, driver):
+        # Returns (seconds spent, number of images still loading)
+        start = time.monotonic()
+        deadline = start + self.images_max_time
+        pending = driver.execute_script(PENDING_IMAGES_JS)
+        while pending and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            pending = driver.execute_script(PENDING_IMAGES_JS)
+        return time.monotonic() - start, pending
@@ -1,160 +1,485 @@
 import scrapy
-from scrapy_selenium import SeleniumRequest
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import logging
+from scrapy import signals
+from scrapy.utils.job import job_dir
+import copy
+import hashlib
+import json
+from urllib.parse import urlparse
+
+from menucommon.timing import timed
+
+from tacobellpy.items import Category, Option, Product, to_cents
+from tacobellpy.request import SeleniumRequest
+from tacobellpy.state import CrawlStateStore
+from tacobellpy.xpaths import TACOBELL
+
+
+def category_key(dynamic_value, store=None):
+    # Identifies a category of one store's menu in the spider's bookkeeping
+    # (and the JOBDIR store); it is also the category's path under /food/
+    return f'{dynamic_value}?store={store}' if store else dynamic_value
+
+
+def split_category_key(key):
+    dynamic_value, _, store = key.partition('?store=')
+    return dynamic_value, store or None
+
+
+def last_path_segment(href):
+    return urlparse(href).path.rstrip('/').split('/')[-1]
+
 
 class TacoBellSpider(scrapy.Spider):
     name = 'tacobell_spider'
     allowed_domains = ['tacobell.com']
     start_urls = ['https://www.tacobell.com/food']
+    base_url = 'https://www.tacobell.com'
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, stream_products=False, stores=None, stores_file=None, **kwargs):
         super(TacoBellSpider, self).__init__(*args, **kwargs)
         self.processed_product_urls = set()
         self.products_by_dynamic_value = {}  # Dictionary to store products by dynamic value
         self.product_count = {}  # Keep track of the number of products processed per dynamic value
+        self.pending_details = {}  # Detail requests still in flight per dynamic value, failures included
+        self.listed_categories = set()  # Dynamic values whose listing page has been fully parsed
+        self.emitted_categories = set()  # Dynamic values already yielded as a category item
+        self.category_titles = {}
+        self.pending_products = {}  # url -> (dynamic_value, product) for details still outstanding
+        self.crawl_state = None  # CrawlStateStore when running with JOBDIR
+        # Yield every product as soon as its details are in (-a stream_products=true)
+        # instead of one item per category
+        if isinstance(stream_products, str):
+            stream_products = stream_products.lower() in ('1', 'true', 'yes')
+        self.stream_products = stream_products
+
+        # Store menus to crawl: -a stores=028915,031234 and/or -a stores_file=
+        # stores.txt (one store ID per line); the default menu when neither
+        # is given. Stores mostly share their menus, so every category
+        # listing is fingerprinted and a listing seen before reuses the
+        # details of the first category that had it instead of rendering its
+        # product pages again.
+        self.stores = self.load_stores(stores, stores_file)
+        self.listing_leaders = {}  # fingerprint -> key of the first category with that listing
+        self.listing_products = {}  # fingerprint -> that category's products, details filled in place
+        self.listing_fingerprints = {}  # leader key -> fingerprint
+        self.listing_followers = {}  # leader key -> [(key, title)] waiting for its details
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        kwargs.setdefault('stores_file', crawler.settings.get('TACOBELL_STORES_FILE'))
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.get('TACOBELL_BASE_URL'):
+            spider.use_base_url(crawler.settings.get('TACOBELL_BASE_URL'))
+        jobdir = job_dir(crawler.settings)
+        if jobdir:
+            spider.crawl_state = CrawlStateStore.from_jobdir(jobdir)
+            spider.restore_state()
+            crawler.signals.connect(spider.category_written, signal=signals.item_scraped)
+            crawler.signals.connect(spider.category_written, signal=signals.item_dropped)
+        return spider
+
+    def load_stores(self, stores=None, stores_file=None):
+        ids = []
+        if isinstance(stores, str):
+            stores = stores.split(',')
+        ids.extend(store.strip() for store in stores or [] if store.strip())
+        if stores_file:
+            with open(stores_file, encoding='utf-8') as f:
+                ids.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        return list(dict.fromkeys(ids))  # Drop duplicates, keep order
+
+    def menu_url(self, store=None):
+        return f'{self.base_url}/food' + (f'?store={store}' if store else '')
+
+    def use_base_url(self, base_url):
+        # Crawl another copy of the site, e.g. the local stand-in in benchmarks/standin.py
+        self.base_url = base_url.rstrip('/')
+        self.start_urls = [f'{self.base_url}/food']
+        self.allowed_domains = [urlparse(self.base_url).hostname]
+
+    def restore_state(self):
+        # Rebuilds the in-memory bookkeeping from a previous run of this JOBDIR
+        for dynamic_value, title, listed, emitted in self.crawl_state.categories():
+            self.category_titles[dynamic_value] = title
+            if emitted:
+                self.emitted_categories.add(dynamic_value)
+                continue
+            self.products_by_dynamic_value[dynamic_value] = []
+            self.product_count[dynamic_value] = 0
+            self.pending_details[dynamic_value] = 0
+            if listed:
+                self.listed_categories.add(dynamic_value)
+
+        captured = 0
+        restored = {}  # dynamic_value -> its products, for the listings below
+        for url, dynamic_value, product, done in self.crawl_state.products():
+            self.processed_product_urls.add(url)
+            if dynamic_value in self.emitted_categories:
+                continue
+            restored.setdefault(dynamic_value, []).append(product)
+            if not self.stream_products:
+                self.products_by_dynamic_value[dynamic_value].append(product)
+            self.product_count[dynamic_value] += 1
+            if done:
+                captured += 1
+            else:
+                self.pending_products[url] = (dynamic_value, product)
+                self.pending_details[dynamic_value] += 1
+
+        # Listings of store menus; followers of an emitted leader are
+        # released by parse
+        for fingerprint, leader, products in self.crawl_state.listings():
+            self.listing_leaders[fingerprint] = leader
+            self.listing_products[fingerprint] = products if products is not None else restored.get(leader, [])
+            self.listing_fingerprints[leader] = fingerprint
+        for key, fingerprint in self.crawl_state.followers():
+            if key not in self.emitted_categories:
+                self.listing_followers.setdefault(self.listing_leaders[fingerprint], []).append(
+                    (key, self.category_titles.get(key)))
+
+        if self.category_titles:
+            self.logger.info(
+                f'Resuming: {len(self.emitted_categories)} categories emitted, {captured} product details '
+                f'captured, {len(self.pending_products)} outstanding')
 
     def start_requests(self):
-        yield SeleniumRequest(
-            url=self.start_urls[0],
-            callback=self.parse,
+        # Not filtered, so a resumed crawl re-reads the category lists
+        for store in self.stores or [None]:
+            yield SeleniumRequest(
+                url=self.menu_url(store) if store else self.start_urls[0],
+                callback=self.parse,
+                meta={'store': store, 'consent': True},  # Banner accepted by SeleniumMiddleware
+                wait_time=30,
+                dont_filter=True,
+            )
+
+        # Requests in flight when the previous run died are not in the JOBDIR
+        # queue; issue them again (duplicates are ignored by the callbacks)
+        following = {key for followers in self.listing_followers.values() for key, _ in followers}
+        for key in list(self.products_by_dynamic_value):
+            if key not in self.listed_categories and key not in following:
+                yield self.category_request(key, self.category_titles.get(key), dont_filter=True)
+        for url, (dynamic_value, product) in list(self.pending_products.items()):
+            yield self.details_request(
+                url, dynamic_value, self.category_titles.get(dynamic_value), product, dont_filter=True)
+
+    def category_request(self, key, item_name, dont_filter=False):
+        return SeleniumRequest(
+            url=f'{self.base_url}/food/{key}',
+            callback=self.parse_item,
+            meta={'name': key, 'item_name': item_name},
+            wait_time=30,
+            dont_filter=dont_filter,
+        )
+
+    def details_request(self, url, dynamic_value, item_name, product, total_products=None, dont_filter=False):
+        return SeleniumRequest(
+            url=url,
+            callback=self.parse_details,
+            errback=self.details_failed,
+            meta={
+                'name': dynamic_value,
+                'item_name': item_name,
+                'product': product,  # Passing the individual product
+                'product_url': url,
+                'dynamic_value': dynamic_value,
+                'total_products': total_products  # Total products in the current dynamic value
+            },
             wait_time=30,
+            dont_filter=dont_filter,
         )
 
+    @timed('parse')
     def parse(self, response):
-        driver = response.meta.get('driver')
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, 'onetrust-accept-btn-handler'))
-        ).click()
-        logging.info('Cookie consent accepted.')
-        self.logger.info('Parsing the main page')
-        items = response.xpath('//article[contains(@class, "styles_card__1se34")]')
-        self.logger.info(f'Found {len(items)} items on the page.')
+        store = response.meta.get('store')
+        self.logger.info(f'Parsing the main page{f" of store {store}" if store else ""}')
 
-        for item in items:
-            dynamic_value = item.xpath('.//a/@href').get().split('/')[-1]
+        # Categories mapped from the page's embedded data (HTTP-first mode)
+        categories = response.meta.get('embedded')
+        if categories is None:
+            categories = []
+            items = TACOBELL.nodes('category_cards', TACOBELL.root(response))
+            self.logger.info(f'Found {len(items)} items on the page.')
+            for item in items:
+                card = TACOBELL.record('category_card', item)
+                categories.append((last_path_segment(card['href']), card['label']))
+
+        for dynamic_value, item_name in categories:
             self.logger.info(f'Processing item with dynamic_value: {dynamic_value}')
-            item_name = item.xpath('.//span[contains(@class, "styles_label__3Sj9r")]/text()').get()
 
             if dynamic_value:
-                detail_url = f'https://www.tacobell.com/food/{dynamic_value}'
-                self.logger.info(f'Requesting detail URL: {detail_url}')
+                key = category_key(dynamic_value, store)
+                # Categories restored from JOBDIR are already being handled
+                if key in self.products_by_dynamic_value or key in self.emitted_categories:
+                    continue
+                self.logger.info(f'Requesting detail URL: {self.base_url}/food/{key}')
 
                 # Initialize the list for the current dynamic value
-                self.products_by_dynamic_value[dynamic_value] = []
-                self.product_count[dynamic_value] = 0
+                self.products_by_dynamic_value[key] = []
+                self.product_count[key] = 0
+                self.pending_details[key] = 0
+                self.category_titles[key] = item_name
+                if self.crawl_state:
+                    self.crawl_state.add_category(key, item_name)
+
+                yield self.category_request(key, item_name)
 
-                yield SeleniumRequest(
-                    url=detail_url,
-                    callback=self.parse_item,
-                    meta={'name': dynamic_value, 'item_name': item_name},
-                    wait_time=30,
-                )
+        # Restored categories whose last detail finished just before the
+        # previous run died
+        for dynamic_value in list(self.listed_categories):
+            yield from self.complete_category(dynamic_value, self.category_titles.get(dynamic_value))
+        # and followers whose leader was emitted before then
+        for leader in list(self.listing_followers):
+            if leader in self.emitted_categories:
+                yield from self.release_followers(leader)
 
+    @timed('parse_item')
     def parse_item(self, response):
         self.logger.info('Parsing item page')
-        items = response.xpath('//div[contains(@class, "styles_card__1DpUa styles_product-card__1-cAT")]')
+        items = TACOBELL.nodes('product_cards', TACOBELL.root(response))
 
         self.logger.info(f'Found {len(items)} products on the page.')
 
-        dynamic_value = response.meta['name']
+        key = response.meta['name']
+        if key in self.emitted_categories or key in self.listed_categories:
+            return  # Listing parsed before (resumed or duplicate request)
+        category, store = split_category_key(key)
 
-        for item in items:
-            product_name = item.xpath('.//a[contains(@class, "styles_product-title__6KCyw")]/h4/text()').get()
-            product_price = item.xpath('.//p[contains(@class, "styles_product-details__2VdYf")]/span[1]/text()').get()
-            product_price = ''.join(product_price).replace('$', '').strip()
-            product_description = item.xpath(
-                './/p[contains(@class, "styles_product-details__2VdYf")]/span[2]/text()').get()
-            product_image_url = item.xpath(
-                './/img[contains(@class, "styles_image__3bMG2 styles_product-image__p-OZn")]/@src').get()
-            product_param = item.xpath('.//a[contains(@class, "styles_product-title__6KCyw")]/@href').get().split('/')[
-                -1]
+        # Product cards mapped from the page's embedded data (HTTP-first mode)
+        cards = response.meta.get('embedded')
+        if cards is None:
+            cards = [self.extract_product_card(item) for item in items]
+
+        listing_products = None
+        if self.stores:
+            fingerprint = self.listing_fingerprint(cards)
+            leader = self.listing_leaders.get(fingerprint)
+            if leader is not None:
+                yield from self.follow_listing(key, response.meta['item_name'], leader, fingerprint)
+                return
+            self.inc_stat('tacobell/listings/distinct')
+            self.listing_leaders[fingerprint] = key
+            self.listing_fingerprints[key] = fingerprint
+            listing_products = self.listing_products[fingerprint] = []
+            if self.crawl_state:
+                self.crawl_state.add_listing(fingerprint, key)
+
+        for card in cards:
+            product_name = card['name']
+            product_price = ''.join(card['price']).replace('$', '').strip()
+            product_description = card['description']
+            product_image_url = card['image_url']
+            product_param = card['param']
             self.logger.info(f'Processing item with dynamic_value: {product_param}')
 
             if product_name:
-                item_name_encoded = response.meta['name']
-                detail_url_product = f'https://www.tacobell.com/food/{item_name_encoded}/{product_param}'
+                detail_url_product = f'{self.base_url}/food/{category}/{product_param}'
                 cleaned_url_product = detail_url_product.replace("®", "").replace("™", "").replace('~', '')
+                if store:
+                    cleaned_url_product += f'?store={store}'
 
                 if cleaned_url_product not in self.processed_product_urls:
                     self.processed_product_urls.add(cleaned_url_product)
                     self.logger.info(f'Processing URL: {cleaned_url_product}')
 
-                    product = {
-                        'name': product_name,
-                        'price': product_price,
-                        'description': product_description,
-                        'image_url': product_image_url,
-                        'Ingredients details': []  # Initialize an empty list to be filled in parse_details
-                    }
+                    # Its options are filled in by parse_details
+                    product = Product(product_name, to_cents(product_price), product_description,
+                                      product_image_url, raw_price=product_price)
 
                     # Add the product to the list for the current dynamic value
-                    self.products_by_dynamic_value[dynamic_value].append(product)
+                    if not self.stream_products:
+                        self.products_by_dynamic_value.setdefault(key, []).append(product)
+                    if listing_products is not None:
+                        listing_products.append(product)
+                    self.pending_products[cleaned_url_product] = (key, product)
+                    if self.crawl_state:
+                        self.crawl_state.add_product(cleaned_url_product, key, product)
 
                     # Increment the product count
-                    self.product_count[dynamic_value] += 1
+                    self.product_count[key] = self.product_count.get(key, 0) + 1
+                    self.pending_details[key] = self.pending_details.get(key, 0) + 1
 
                     # Pass the individual product to the next callback
-                    yield SeleniumRequest(
-                        url=cleaned_url_product,
-                        callback=self.parse_details,
-                        meta={
-                            'name': response.meta['name'],
-                            'item_name': response.meta['item_name'],
-                            'product': product,  # Passing the individual product
-                            'dynamic_value': dynamic_value,
-                            'total_products': len(items)  # Total products in the current dynamic value
-                        },
-                        wait_time=30,
-                    )
+                    yield self.details_request(
+                        cleaned_url_product, key, response.meta['item_name'], product, len(cards))
 
-    def parse_details(self, response):
-        product = response.meta.get('product', {})
-        dynamic_value = response.meta.get('dynamic_value')
+        # Every detail request of this category has been issued; it is
+        # complete once the last of them has finished
+        self.listed_categories.add(key)
+        if self.crawl_state:
+            self.crawl_state.category_listed(key)
+        yield from self.complete_category(key, response.meta['item_name'])
+
+    def extract_product_card(self, item):
+        # All fields of a product card (an lxml element) in one registry call
+        card = TACOBELL.record('product_card', item)
+        card['param'] = last_path_segment(card.pop('href'))
+        return card
+
+    def listing_fingerprint(self, cards):
+        # The same products, at the same prices, in the same order
+        digest = hashlib.sha1()
+        for card in cards:
+            digest.update(json.dumps(
+                [card['name'], card['price'], card['description'], card['param']]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def follow_listing(self, key, title, leader, fingerprint):
+        # A category whose listing another category (usually of another
+        # store) already has: it gets that category's products and details,
+        # now or once they are all in
+        self.inc_stat('tacobell/listings/reused')
+        self.logger.info(f'Listing of {key} is the same as {leader}, reusing its details')
+        if leader in self.emitted_categories:
+            yield from self.emit_reused(key, title, self.listing_products[fingerprint])
+        else:
+            self.listing_followers.setdefault(leader, []).append((key, title))
+            if self.crawl_state:
+                self.crawl_state.add_follower(key, fingerprint)
+
+    def emit_reused(self, key, title, products):
+        products = copy.deepcopy(products)
+        self.emitted_categories.add(key)
+        self.products_by_dynamic_value.pop(key, None)
+        self.product_count.pop(key, None)
+        self.pending_details.pop(key, None)
+        if self.crawl_state and (self.stream_products or not products):
+            self.crawl_state.category_emitted(key)  # No category item to wait for
+        self.inc_stat('tacobell/details_reused', len(products))
+        if self.stream_products:
+            for product in products:
+                yield self.category_item(key, title, [product], streamed=True)
+        elif products:
+            yield self.category_item(key, title, products)
+
+    def category_item(self, key, title, products, streamed=False):
+        # The category's products (or one of them when streamed), with the
+        # store ID of store menus
+        return Category(title, products, split_category_key(key)[1], streamed, key)
 
-        items = response.xpath('//div[contains(@class, "styles_interactive__3pQZP styles_flex-card__-Gb6u")]')
+    def category_written(self, item, **kwargs):
+        # A category is only emitted for the JOBDIR store once its item got
+        # through the pipelines (or was dropped by one); one the previous run
+        # yielded but never wrote out is emitted again from its stored
+        # products, which costs a duplicate rather than a missing category
+        if isinstance(item, Category) and item.key and not item.streamed:
+            self.crawl_state.category_emitted(item.key)
+
+    def inc_stat(self, key, count=1):
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            crawler.stats.inc_value(key, count, spider=self)
+
+    def extract_ingredient_details(self, response):
+        items = TACOBELL.nodes('option_cards', TACOBELL.root(response))
 
         if not items:
             self.logger.info("No items found with the provided XPath")
 
         details = []
         for item in items:
-            category_name = item.xpath(
-                './/h3[contains(@class, "styles_customize-section-title__3Pb4I")]/text()').get()
-            name = item.xpath(
-                './/span[contains(@class, "styles_name__3-08P styles_text-shadow__OtfIt")]/text()').get()
-            price = item.xpath('.//span[contains(@class, "styles_price-and-calories__13gpI")]/span[1]/text()').getall()
+            card = TACOBELL.record('option_card', item)
+            category_name = card['category_name']
+            name = card['name']
             # Join the extracted text content and clean it up
-            price = ''.join(price).replace('+', '').replace('$', '').strip()
+            price = ''.join(card['price']).replace('+', '').replace('$', '').strip()
 
-            image_url = item.xpath('.//img[contains(@class, "styles_image__3bMG2")]/@src').get()
+            image_url = card['image_url']
 
             self.logger.info(f"Extracted name: {name}")
             self.logger.info(f"Extracted price: {price}")
             self.logger.info(f"Extracted image_url: {image_url}")
 
-            details.append({
-                'category_name': category_name.strip() if category_name else None,
-                'name': name.strip() if name else None,
-                'price': price.strip() if price else None,
-                'image_url': image_url.strip() if image_url else None,
-            })
+            details.append(Option(
+                category_name.strip() if category_name else None,
+                name.strip() if name else None,
+                to_cents(price),
+                image_url.strip() if image_url else None,
+                price,
+            ))
+
+        return details
 
-        # Ensure the details belong to the correct product
-        if 'Ingredients details' in product:
-            product['Ingredients details'].extend(details)
+    @timed('parse_details')
+    def parse_details(self, response):
+        # The product is looked up by URL: after a resume the request meta
+        # holds a copy restored from the JOBDIR queue
+        url = response.meta.get('product_url', response.url)
+        if url not in self.pending_products:
+            return  # Details already captured (resumed or duplicate request)
+        dynamic_value, product = self.pending_products.pop(url)
+
+        # Ingredient details mapped from the page's embedded data (HTTP-first mode)
+        details = response.meta.get('embedded')
+        try:
+            if details is None:
+                details = self.extract_ingredient_details(response)
+            else:
+                details = [Option.from_dict(option) for option in details]
+        except Exception as e:
+            # Handled like a failed request: the product keeps no options and
+            # stays outstanding in the JOBDIR store, its category is completed
+            self.logger.error(f'Failed to map details of {response.url}: {e!r}')
+            self.crawler.stats.inc_value('tacobell/details_failed', spider=self)
         else:
-            product['Ingredients details'] = details
+            product.options.extend(details)
+            if self.crawl_state:
+                self.crawl_state.product_done(url, product)
+
+        self.pending_details[dynamic_value] -= 1
+        if self.stream_products:
+            yield self.category_item(dynamic_value, response.meta.get('item_name', 'N/A'), [product], streamed=True)
+        yield from self.complete_category(dynamic_value, response.meta.get('item_name', 'N/A'))
 
-        # After processing the details, check if this is the last product for the current dynamic value
-        dynamic_value_products = self.products_by_dynamic_value.get(dynamic_value, [])
-        last_product = dynamic_value_products[-1] if dynamic_value_products else None
+    def details_failed(self, failure):
+        # The product keeps an empty list of options, but its
+        # category must still be completed. It stays outstanding in the JOBDIR
+        # store, so a resumed crawl requests it again if the category is not
+        # emitted by then.
+        meta = failure.request.meta
+        url = meta.get('product_url', failure.request.url)
+        if url not in self.pending_products:
+            return
+        dynamic_value, product = self.pending_products.pop(url)
+        self.logger.error(f'Failed to fetch details for {failure.request.url}: {failure.value!r}')
+        self.crawler.stats.inc_value('tacobell/details_failed', spider=self)
 
-        if product == last_product:
+        self.pending_details[dynamic_value] -= 1
+        if self.stream_products:
+            yield self.category_item(dynamic_value, meta.get('item_name', 'N/A'), [product], streamed=True)
+        yield from self.complete_category(dynamic_value, meta.get('item_name', 'N/A'))
+
+    def complete_category(self, dynamic_value, title):
+        # Emits the category once its listing is parsed and none of its detail
+        # requests are outstanding, then releases its products
+        if dynamic_value not in self.listed_categories or self.pending_details.get(dynamic_value):
+            return
+        self.listed_categories.discard(dynamic_value)
+        self.emitted_categories.add(dynamic_value)
+        self.pending_details.pop(dynamic_value, None)
+        self.product_count.pop(dynamic_value, None)
+        if self.crawl_state:
+            # The listing's details first: a leader emitted without them
+            # would leave its followers nothing to reuse after a resume
+            fingerprint = self.listing_fingerprints.get(dynamic_value)
+            if fingerprint is not None:
+                self.crawl_state.listing_done(fingerprint, self.listing_products[fingerprint])
+        dynamic_value_products = self.products_by_dynamic_value.pop(dynamic_value, [])
+
+        if dynamic_value_products:
             # Yield the accumulated products as a list
-            yield {
-                'Title': response.meta.get('item_name', 'N/A'),
-                'Menu': dynamic_value_products
-            }
\ No newline at end of file
+            yield self.category_item(dynamic_value, title, dynamic_value_products)
+        elif self.crawl_state:
+            self.crawl_state.category_emitted(dynamic_value)  # No category item to wait for
+
+        # Categories with the same listing were waiting for these details
+        yield from self.release_followers(dynamic_value)
+
+    def release_followers(self, leader):
+        fingerprint = self.listing_fingerprints.pop(leader, None)
+        for follower, follower_title in self.listing_followers.pop(leader, []):
+            yield from self.emit_reused(follower, follower_title, self.listing_products[fingerprint])
+
+    def closed(self, reason):
+        if self.crawl_state:
+            self.crawl_state.close()
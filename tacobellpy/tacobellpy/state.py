@@ -0,0 +1,133 @@
+# Crawl state of TacoBellSpider, persisted under JOBDIR.
+#
+# Every category and product the spider sees is written to a small SQLite
+# database as it happens (WAL journal, one short transaction per change), so
+# a crawl killed at any point can be resumed with the same JOBDIR: products
+# whose details were captured are not requested again, and categories are
+# still emitted with all their products. A category counts as emitted once
+# its item got through the pipelines, so one that was yielded but not written
+# out when the crawl died is emitted again (a duplicate, never a gap). The
+# products of an emitted category are dropped from the store; only their
+# URLs are kept.
+#
+# Listing fingerprints of store menus are kept too: the category that first
+# had a listing (its leader), the leader's products once their details are
+# in, and the categories waiting to reuse them, so a resumed crawl doesn't
+# render those details again.
+
+import json
+import os
+import sqlite3
+
+from tacobellpy.items import Product
+
+FILENAME = 'tacobell_state.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    dynamic_value TEXT PRIMARY KEY,
+    title TEXT,
+    listed INTEGER NOT NULL DEFAULT 0,
+    emitted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS products (
+    url TEXT PRIMARY KEY,
+    dynamic_value TEXT NOT NULL,
+    product TEXT,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS products_by_category ON products (dynamic_value);
+CREATE TABLE IF NOT EXISTS listings (
+    fingerprint TEXT PRIMARY KEY,
+    leader TEXT NOT NULL,
+    products TEXT
+);
+CREATE TABLE IF NOT EXISTS followers (
+    dynamic_value TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+"""
+
+
+class CrawlStateStore:
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def from_jobdir(cls, jobdir):
+        os.makedirs(jobdir, exist_ok=True)
+        return cls(os.path.join(jobdir, FILENAME))
+
+    def add_category(self, dynamic_value, title):
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO categories (dynamic_value, title) VALUES (?, ?)', (dynamic_value, title))
+
+    def category_listed(self, dynamic_value):
+        with self.db:
+            self.db.execute('UPDATE categories SET listed = 1 WHERE dynamic_value = ?', (dynamic_value,))
+
+    def category_emitted(self, dynamic_value):
+        with self.db:
+            self.db.execute('UPDATE categories SET emitted = 1 WHERE dynamic_value = ?', (dynamic_value,))
+            self.db.execute('UPDATE products SET product = NULL WHERE dynamic_value = ?', (dynamic_value,))
+
+    def add_product(self, url, dynamic_value, product):
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO products (url, dynamic_value, product) VALUES (?, ?, ?)',
+                (url, dynamic_value, json.dumps(product.to_dict(), ensure_ascii=False)))
+
+    def product_done(self, url, product):
+        with self.db:
+            self.db.execute(
+                'UPDATE products SET product = ?, done = 1 WHERE url = ?',
+                (json.dumps(product.to_dict(), ensure_ascii=False), url))
+
+    def add_listing(self, fingerprint, leader):
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO listings (fingerprint, leader) VALUES (?, ?)', (fingerprint, leader))
+
+    def listing_done(self, fingerprint, products):
+        with self.db:
+            self.db.execute(
+                'UPDATE listings SET products = ? WHERE fingerprint = ?',
+                (json.dumps([product.to_dict() for product in products], ensure_ascii=False), fingerprint))
+
+    def add_follower(self, dynamic_value, fingerprint):
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO followers (dynamic_value, fingerprint) VALUES (?, ?)',
+                (dynamic_value, fingerprint))
+
+    def categories(self):
+        # (dynamic_value, title, listed, emitted) in discovery order
+        return self.db.execute(
+            'SELECT dynamic_value, title, listed, emitted FROM categories ORDER BY rowid').fetchall()
+
+    def products(self):
+        # (url, dynamic_value, product or None, done) in discovery order
+        for url, dynamic_value, product, done in self.db.execute(
+                'SELECT url, dynamic_value, product, done FROM products ORDER BY rowid'):
+            yield url, dynamic_value, Product.from_dict(json.loads(product)) if product else None, bool(done)
+
+    def listings(self):
+        # (fingerprint, leader, products or None until the leader was emitted)
+        for fingerprint, leader, products in self.db.execute(
+                'SELECT fingerprint, leader, products FROM listings ORDER BY rowid'):
+            if products is not None:
+                products = [Product.from_dict(product) for product in json.loads(products)]
+            yield fingerprint, leader, products
+
+    def followers(self):
+        # (dynamic_value, fingerprint) of categories reusing a leader's details
+        return self.db.execute('SELECT dynamic_value, fingerprint FROM followers ORDER BY rowid').fetchall()
+
+    def close(self):
+        self.db.close()
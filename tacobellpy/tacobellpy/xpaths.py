@@ -0,0 +1,86 @@
+# Compiled XPath expressions of the Taco Bell pages.
+#
+# response.xpath() compiles its expression on every call and wraps every
+# result in a Selector, once per field of every card. The registry compiles
+# each expression once and evaluates it straight on the lxml tree Scrapy has
+# already parsed for the response, returning plain strings. first() gives the
+# value .xpath(expression).get() would for text and attribute expressions,
+# all() what .getall() would, and record() reads every field of a card in one
+# call.
+
+from lxml import etree
+
+
+class Many(str):
+    # A record field that keeps every result (.getall()) instead of the first
+    pass
+
+
+class SelectorRegistry:
+
+    def __init__(self, expressions, records=None):
+        self.expressions = dict(expressions)
+        self.compiled = {name: self._compile(expression) for name, expression in self.expressions.items()}
+        self.record_expressions = {name: dict(fields) for name, fields in (records or {}).items()}
+        # record name -> [(field, compiled expression, keeps every result)]
+        self.records = {
+            name: [(field, self._compile(expression), isinstance(expression, Many))
+                   for field, expression in fields.items()]
+            for name, fields in (records or {}).items()
+        }
+
+    def _compile(self, expression):
+        # Plain str results: no back reference to the tree for every string
+        return etree.XPath(expression, smart_strings=False)
+
+    def root(self, response):
+        return response.selector.root
+
+    def nodes(self, name, node):
+        return self.compiled[name](node)
+
+    def first(self, name, node):
+        results = self.compiled[name](node)
+        return results[0] if results else None
+
+    def all(self, name, node):
+        return self.compiled[name](node)
+
+    def record(self, name, node):
+        fields = {}
+        for field, xpath, many in self.records[name]:
+            results = xpath(node)
+            fields[field] = results if many else (results[0] if results else None)
+        return fields
+
+
+TACOBELL = SelectorRegistry(
+    expressions={
+        'category_cards': '//article[contains(@class, "styles_card__1se34")]',
+        'product_cards': '//div[contains(@class, "styles_card__1DpUa styles_product-card__1-cAT")]',
+        'option_cards': '//div[contains(@class, "styles_interactive__3pQZP styles_flex-card__-Gb6u")]',
+        # Embedded data, see embedded.py
+        'next_data': '//script[@id="__NEXT_DATA__"]/text()',
+        'json_ld': '//script[@type="application/ld+json"]/text()',
+        'inline_scripts': '//script[not(@src)]/text()',
+    },
+    records={
+        'category_card': {
+            'href': './/a/@href',
+            'label': './/span[contains(@class, "styles_label__3Sj9r")]/text()',
+        },
+        'product_card': {
+            'name': './/a[contains(@class, "styles_product-title__6KCyw")]/h4/text()',
+            'price': './/p[contains(@class, "styles_product-details__2VdYf")]/span[1]/text()',
+            'description': './/p[contains(@class, "styles_product-details__2VdYf")]/span[2]/text()',
+            'image_url': './/img[contains(@class, "styles_image__3bMG2 styles_product-image__p-OZn")]/@src',
+            'href': './/a[contains(@class, "styles_product-title__6KCyw")]/@href',
+        },
+        'option_card': {
+            'category_name': './/h3[contains(@class, "styles_customize-section-title__3Pb4I")]/text()',
+            'name': './/span[contains(@class, "styles_name__3-08P styles_text-shadow__OtfIt")]/text()',
+            'price': Many('.//span[contains(@class, "styles_price-and-calories__13gpI")]/span[1]/text()'),
+            'image_url': './/img[contains(@class, "styles_image__3bMG2")]/@src',
+        },
+    },
+)
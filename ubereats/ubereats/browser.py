@@ -0,0 +1,130 @@
+# Chrome driver creation and lifecycle for UberEatsSpider.
+#
+# selenium and webdriver_manager are only imported when a browser is launched.
+# The chromedriver webdriver_manager resolves (a network round trip to check
+# the latest release) is remembered per machine, so later runs and every
+# worker process start Chrome straight away.
+
+import os
+import shutil
+
+from menucommon.browser import (BrowserCrashed, blocked_url_patterns, browser_alive, is_dead_session,
+                                process_tree_rss, read_driver_cache, write_driver_cache)
+
+# Where the resolved chromedriver is remembered
+DRIVER_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'ubereats', 'chromedriver.json')
+
+
+def resolve_driver_path(driver_path=None, cache_path=DRIVER_CACHE_PATH, refresh=False):
+    # The configured chromedriver, else the one resolved on an earlier run,
+    # else chromedriver on PATH, else whatever webdriver_manager downloads.
+    # refresh=True skips straight to webdriver_manager (the cached driver no
+    # longer matches the installed Chrome).
+    if driver_path and os.path.isfile(driver_path):
+        return driver_path
+    path = None
+    if not refresh:
+        path = read_driver_cache(cache_path)
+        if not (path and os.path.isfile(path)):
+            path = shutil.which('chromedriver')
+    if path is None:
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+    write_driver_cache(cache_path, path)
+    return path
+
+
+def create_driver(block_resources=(), blocked_domains=(), capture_network=False, driver_path=None):
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service as ChromeService
+
+    chrome_options = Options()
+    # chrome_options.add_argument("--headless")  # Uncomment to run in headless mode
+    chrome_options.add_argument("--disable-gpu")
+    if 'image' in block_resources:
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option(
+            'prefs', {'profile.managed_default_content_settings.images': 2})
+    if capture_network:
+        # Network events (and with them the API responses) go to the performance log
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    path = resolve_driver_path(driver_path)
+    try:
+        driver = webdriver.Chrome(service=ChromeService(path), options=chrome_options)
+    except SessionNotCreatedException:
+        if path == driver_path:
+            raise
+        # Chrome was updated since the driver was resolved
+        path = resolve_driver_path(refresh=True)
+        driver = webdriver.Chrome(service=ChromeService(path), options=chrome_options)
+
+    patterns = blocked_url_patterns(block_resources, blocked_domains)
+    if patterns:
+        # Blocked at the network layer, so the requests never leave the browser
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    return driver
+
+
+class ManagedDriver:
+    # The browser of one spider (or worker process). It is launched on first
+    # use and relaunched after max_pages stores, past max_rss_mb of
+    # process-tree memory, or once its session has died. Launches and
+    # recycles are kept in `events` (stat keys) until drained.
+
+    def __init__(self, launch, max_pages=0, max_rss_mb=0):
+        self.launch = launch
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.pages = 0
+        self.events = []
+        self.rss_max = 0
+        self._driver = None
+
+    @property
+    def driver(self):
+        if self._driver is not None and not browser_alive(self._driver):
+            self.quit()  # Died between stores
+        if self._driver is None:
+            self._driver = self.launch()
+            self.pages = 0
+            self.events.append('browser/launched')
+        return self._driver
+
+    def page_done(self):
+        # Counts a store and recycles the browser if it is due
+        self.pages += 1
+        reason = None
+        if self.max_pages and self.pages >= self.max_pages:
+            reason = 'pages'
+        elif self.max_rss_mb and self._driver is not None:
+            rss = process_tree_rss(self._driver)
+            if rss is not None:
+                self.rss_max = max(self.rss_max, rss)
+                if rss > self.max_rss_mb * 1024 * 1024:
+                    reason = 'rss'
+        if reason is not None:
+            self.events.append(f'browser/recycled/{reason}')
+            self.quit()
+
+    def check_error(self, error):
+        # Raises BrowserCrashed (and drops the browser) when `error` means the
+        # session is dead; otherwise returns
+        if self._driver is not None and is_dead_session(self._driver, error):
+            self.quit()
+            raise BrowserCrashed(f'Browser session died: {error}') from error
+
+    def drain_events(self):
+        # (stat keys, highest process-tree RSS in bytes) since the last call
+        events, self.events = self.events, []
+        return events, self.rss_max
+
+    def quit(self):
+        if self._driver is not None:
+            try:
+                self._driver.quit()
+            except Exception:
+                pass
+            self._driver = None
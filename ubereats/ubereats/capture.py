@@ -0,0 +1,124 @@
+# Building item details from the UberEats web APIs instead of clicking.
+#
+# The store page loads its catalog from /_p/api/getStoreV1 and every item
+# modal from /_p/api/getMenuItemV1. With Chrome performance logging enabled
+# the store payload is read back from the browser's network log, and the item
+# payloads are fetched in parallel from inside the page (same origin, same
+# cookies), so no item ever has to be opened. The item payloads are mapped to
+# the structure UberEatsSpider.extract_item_details returns.
+
+import base64
+import json
+
+STORE_ENDPOINT = '/_p/api/getStoreV1'
+ITEM_ENDPOINT = '/_p/api/getMenuItemV1'
+
+# Fetches getMenuItemV1 for every item, at most `concurrency` at a time, and
+# calls back with {uuid: data or null}.
+FETCH_ITEMS_JS = """
+var endpoint = arguments[0], storeUuid = arguments[1], items = arguments[2],
+    concurrency = arguments[3], done = arguments[arguments.length - 1];
+var results = {}, next = 0;
+function fetchItem(item) {
+    return fetch(endpoint, {
+        method: 'POST',
+        credentials: 'include',
+        headers: {'Content-Type': 'application/json', 'x-csrf-token': 'x'},
+        body: JSON.stringify({
+            itemRequestType: 'ITEM',
+            storeUuid: storeUuid,
+            sectionUuid: item.sectionUuid,
+            subsectionUuid: item.subsectionUuid,
+            menuItemUuid: item.uuid
+        })
+    }).then(function (r) { return r.json(); })
+      .then(function (body) { results[item.uuid] = body.data || null; })
+      .catch(function () { results[item.uuid] = null; });
+}
+function worker() {
+    if (next >= items.length) { return Promise.resolve(); }
+    return fetchItem(items[next++]).then(worker);
+}
+var workers = [];
+for (var i = 0; i < Math.min(concurrency, items.length); i++) { workers.push(worker()); }
+Promise.all(workers).then(function () { done(results); });
+"""
+
+
+def captured_payloads(driver, endpoints):
+    # Response bodies of every request to each of `endpoints` in the
+    # performance log, {endpoint: [data, ...]}. Reading the log drains it, so
+    # every endpoint of a page is read in one call.
+    payloads = {endpoint: [] for endpoint in endpoints}
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if message.get('method') != 'Network.responseReceived':
+            continue
+        url = message['params']['response']['url']
+        endpoint = next((endpoint for endpoint in endpoints if endpoint in url), None)
+        if endpoint is None:
+            continue
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+        except Exception:
+            continue  # Body already evicted from the browser
+        text = base64.b64decode(body['body']) if body.get('base64Encoded') else body['body']
+        try:
+            data = json.loads(text).get('data')
+        except ValueError:
+            continue
+        if data:
+            payloads[endpoint].append(data)
+    return payloads
+
+
+def catalog_items(store):
+    # Every item of a getStoreV1 payload with the ids getMenuItemV1 needs
+    items = {}
+    for section_items in (store.get('catalogSectionsMap') or {}).values():
+        for catalog_section in section_items:
+            standard = (catalog_section.get('payload') or {}).get('standardItemsPayload') or {}
+            for item in standard.get('catalogItems') or []:
+                if item.get('uuid'):
+                    items[item['uuid']] = {
+                        'uuid': item['uuid'],
+                        'title': item.get('title'),
+                        'sectionUuid': item.get('sectionUuid'),
+                        'subsectionUuid': item.get('subsectionUuid'),
+                        'hasCustomizations': item.get('hasCustomizations', True),
+                        'imageUrl': item.get('imageUrl'),
+                    }
+    return list(items.values())
+
+
+def fetch_item_payloads(driver, store_uuid, items, concurrency=8, timeout=120):
+    driver.set_script_timeout(timeout)
+    return driver.execute_async_script(FETCH_ITEMS_JS, ITEM_ENDPOINT, store_uuid, items, concurrency)
+
+
+def _dollars(cents):
+    return round((cents or 0) / 100.0, 2)
+
+
+def item_details_from_payload(item, image_url='', item_id=None):
+    # getMenuItemV1 data -> {'item_id', 'item_name', 'image_url', 'item_details'},
+    # in the same shape (and with the same left/right half price arithmetic)
+    # as the details read from the item modal. item_id is the item's uuid,
+    # which the store's JSON-LD has as the menu item's @id
+    details = []
+    for group in item.get('customizationsList') or []:
+        option_details = []
+        for option in group.get('options') or []:
+            left_half_price = right_half_price = _dollars(option.get('price'))
+            option_details.append(
+                {'name': (option.get('title') or '').strip(), 'possibleToAdd': 1,
+                 'price': left_half_price + right_half_price,
+                 'leftHalfPrice': left_half_price, 'rightHalfPrice': right_half_price})
+        details.append(
+            {'type': "general", 'name': (group.get('title') or '').strip(), 'requiresSelectionMin': 0,
+             'requiresSelectionMax': group.get('maxPermitted') or '', 'ingredients': option_details})
+
+    item_name = (item.get('title') or '').strip()
+    return {'item_id': item_id or item.get('uuid'), 'item_name': item_name,
+            'image_url': item.get('imageUrl') or image_url or '',
+            'item_details': details} if details or item_name else ''
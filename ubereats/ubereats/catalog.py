@@ -0,0 +1,42 @@
+# Catalog of the ingredients and option groups menu items share.
+#
+# A store repeats the same topping list on every pizza, and most toppings
+# appear in several lists. OptionCatalogPipeline interns every ingredient and
+# every group under an ID derived from its content: a group's 'ingredients'
+# become ingredient IDs and a menu item's 'ingredientsGroups' become group
+# IDs. Each distinct record is written once to a separate record file next to
+# the restaurants:
+#
+#     {"id": "i2b7d...", "kind": "ingredient", "data": {"name": "Bacon", "price": 7.2, ...}}
+#     {"id": "g90c4...", "kind": "group", "data": {"name": "Toppings", ..., "ingredients": ["i2b7d...", ...]}}
+
+import os
+
+from ubereats.export import iter_records
+
+
+def read_catalog(path, compression=None):
+    # {id: record} of a catalog file
+    if not os.path.exists(path):
+        return {}
+    return {entry['id']: entry['data'] for entry in iter_records(path, compression)}
+
+
+def expand_groups(ids, records):
+    groups = []
+    for key in ids:
+        group = dict(records[key])
+        group['ingredients'] = [dict(records[ingredient]) for ingredient in group['ingredients']]
+        groups.append(group)
+    return groups
+
+
+def expand_restaurant(restaurant, records):
+    # The restaurant with the catalog IDs of its menu items replaced by the
+    # groups and ingredients again
+    for section in restaurant['data'].get('categories', []):
+        for menu_item in section['menu']:
+            groups = menu_item.get('ingredientsGroups')
+            if isinstance(groups, list) and groups and isinstance(groups[0], str):
+                menu_item['ingredientsGroups'] = expand_groups(groups, records)
+    return restaurant
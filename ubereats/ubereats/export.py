@@ -0,0 +1,141 @@
+# JSON Lines record files written incrementally by StreamingExportPipeline.
+#
+# Records are appended one per line, optionally through gzip or zstd, and
+# every checkpoint() flushes the compressor and fsyncs the file, so a crash
+# loses at most the records written since the last checkpoint. Readers stop
+# quietly at a truncated tail.
+
+import gzip
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def records_path(path, compression=None):
+    suffix = COMPRESSION_SUFFIXES[compression]
+    return path if path.endswith(suffix) else path + suffix
+
+
+class RecordWriter:
+
+    def __init__(self, path, compression=None, append=False):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compression!r}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the 'zstandard' package")
+
+        self.path = path
+        self.compression = compression
+        self.raw = open(path, 'ab' if append else 'wb')
+        if compression == 'gzip':
+            # Appending starts a new gzip member, which readers concatenate
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.records = 0
+
+    def write(self, record):
+        self.write_json(json.dumps(record, ensure_ascii=False))
+
+    def write_json(self, text):
+        # A record already encoded as JSON text
+        self.stream.write(text.encode('utf-8') + b'\n')
+        self.records += 1
+
+    def checkpoint(self):
+        # Everything written so far becomes readable and durable
+        if self.compression == 'gzip':
+            self.stream.flush(zlib.Z_SYNC_FLUSH)
+        elif self.compression == 'zstd':
+            self.stream.flush(zstandard.FLUSH_FRAME)
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        self.checkpoint()
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+
+def _open_for_reading(path, compression=None):
+    raw = open(path, 'rb')
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    return raw
+
+
+def iter_records(path, compression=None):
+    # Yields the records of a record file, stopping at a truncated tail (an
+    # unfinished line or compressed block after a crash)
+    with _open_for_reading(path, compression) as f:
+        # read1: GzipFile.read() drops what it decompressed when it then hits
+        # the truncated tail of a file still being written
+        read = getattr(f, 'read1', f.read)
+        buffer = b''
+        while True:
+            try:
+                chunk = read(1 << 16)
+            except (EOFError, zlib.error):
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            lines = buffer.split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+        if buffer:
+            try:
+                yield json.loads(buffer)
+            except ValueError:
+                pass
+
+
+def iter_restaurants(path, compression=None):
+    # Rebuilds {'data': {...}} restaurant items from restaurant records or from
+    # per-item records (one 'restaurant' header followed by its 'item' records)
+    restaurant = None
+    for record in iter_records(path, compression):
+        kind = record.pop('record', 'restaurant')
+        if kind == 'item':
+            section_title = record.pop('section')
+            record.pop('store', None)
+            categories = restaurant['data']['categories']
+            if not categories or categories[-1]['title'] != section_title:
+                categories.append({'title': section_title, 'menu': []})
+            categories[-1]['menu'].append(record)
+            continue
+        if restaurant is not None:
+            yield restaurant
+        restaurant = record if 'data' in record else {'data': record}
+        restaurant['data'].setdefault('categories', [])
+    if restaurant is not None:
+        yield restaurant
+
+
+def write_json_view(path, out_path, compression=None, transform=None):
+    # Renders a record file as a JSON array of restaurants, one restaurant in
+    # memory at a time, each passed through transform() first if given
+    with open(out_path, 'w', encoding='utf-8') as out:
+        out.write('[')
+        for i, restaurant in enumerate(iter_restaurants(path, compression)):
+            if transform is not None:
+                restaurant = transform(restaurant)
+            out.write(',\n' if i else '\n')
+            json.dump(restaurant, out, ensure_ascii=False)
+        out.write('\n]\n')
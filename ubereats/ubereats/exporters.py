@@ -0,0 +1,267 @@
+# Feed exporters of the UberEats menus.
+#
+# JsonItemExporter and JsonLinesItemExporter write the Restaurant items in the
+# exports' usual {'data': {...}} shape with ItemEncoder, which
+# StreamingExportPipeline uses as well: the JSON text comes straight from the
+# items' fields instead of from an adapted copy of the whole menu, and an
+# option repeated across groups, items and stores is encoded only once.
+#
+#     scrapy crawl ubereat_spider -O menus.parquet
+#
+# ParquetItemExporter flattens every restaurant into one typed table with a row per option
+# (store, section, menu item, customization group, option), and one row with
+# empty group and option columns for an item without customizations. Prices
+# are integer cents, the repeated strings are dictionary encoded, and rows
+# are written as a Parquet row group every UBEREATS_PARQUET_ROW_GROUP_SIZE
+# rows while the crawl runs instead of all at once at the end. Items carrying
+# catalog IDs (OptionCatalogPipeline) get their groups back from
+# UBEREATS_CATALOG_PATH.
+#
+# Record files of earlier crawls convert with
+#
+#     python -m ubereats.exporters ubereats_data.jsonl menus.parquet --catalog ubereats_catalog.jsonl
+
+import argparse
+import datetime
+import json
+import os
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from scrapy.exporters import BaseItemExporter
+
+from menucommon import exporters
+from menucommon.exporters import arrow_schema
+from menucommon.prices import format_price
+
+from ubereats.catalog import expand_groups, read_catalog
+from ubereats.export import COMPRESSION_SUFFIXES, iter_restaurants, records_path
+from ubereats.items import OptionGroup, Restaurant, dollars
+
+# name, kind: 'string' columns are dictionary encoded, 'cents' are int32
+COLUMNS = [
+    ('crawled_at', 'timestamp'),
+    ('store_url', 'string'),
+    ('store', 'string'),
+    ('section', 'string'),
+    ('item', 'string'),
+    ('item_description', 'string'),
+    ('item_image_url', 'string'),
+    ('item_price_cents', 'cents'),
+    ('option_group', 'string'),
+    ('option_group_min', 'int'),
+    ('option_group_max', 'int'),
+    ('option', 'string'),
+    ('option_price_cents', 'cents'),
+    ('option_left_half_price_cents', 'cents'),
+    ('option_right_half_price_cents', 'cents'),
+]
+
+NO_OPTION = (None,) * 7
+
+
+class ItemEncoder:
+    # The JSON text json.dumps() would write for restaurant.to_dict(), with
+    # the default separators, built from the fields directly. The text of an
+    # option is kept and reused for the same option further on.
+
+    def __init__(self, ensure_ascii=False, max_options=100000):
+        self.string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self.other = json.JSONEncoder(ensure_ascii=ensure_ascii).encode
+        self.max_options = max_options
+        self.options = {}
+        self.prices = {None: 'null'}
+
+    def value(self, value):
+        if value is None:
+            return 'null'
+        if value.__class__ is str:
+            return self.string(value)
+        return self.other(value)
+
+    def price(self, raw_price, cents):
+        if raw_price is not None:
+            return self.value(raw_price)
+        text = self.prices.get(cents)
+        if text is None:
+            text = self.prices[cents] = f'"{format_price(cents)}"'
+        return text
+
+    def option(self, option):
+        key = (option.name, option.possible_to_add, option.price_cents, option.left_half_price_cents,
+               option.right_half_price_cents)
+        text = self.options.get(key)
+        if text is None:
+            if len(self.options) >= self.max_options:
+                self.options.clear()
+            value = self.value
+            text = self.options[key] = (
+                f'{{"name": {value(option.name)}, "possibleToAdd": {value(option.possible_to_add)}, '
+                f'"price": {value(dollars(option.price_cents))}, '
+                f'"leftHalfPrice": {value(dollars(option.left_half_price_cents))}, '
+                f'"rightHalfPrice": {value(dollars(option.right_half_price_cents))}}}')
+        return text
+
+    def group(self, group):
+        value = self.value
+        return (f'{{"type": {value(group.type)}, "name": {value(group.name)}, '
+                f'"requiresSelectionMin": {value(group.min_selection)}, '
+                f'"requiresSelectionMax": {value(group.max_selection or "")}, '
+                f'"ingredients": [{", ".join(map(self.option, group.options))}]}}')
+
+    def menu_item(self, menu_item):
+        if menu_item.group_ids is not None:
+            # Catalog IDs are a letter and hex digits, nothing to escape
+            ids = menu_item.group_ids
+            groups = '["' + '", "'.join(ids) + '"]' if ids else '[]'
+        elif menu_item.groups is not None:
+            groups = '[' + ', '.join(map(self.group, menu_item.groups)) + ']'
+        else:
+            groups = '""'
+        value = self.value
+        return (f'{{"type": {value(menu_item.type)}, "name": {value(menu_item.name)}, '
+                f'"description": {value(menu_item.description)}, "image_url": {value(menu_item.image_url)}, '
+                f'"price": {self.price(menu_item.raw_price, menu_item.price_cents)}, '
+                f'"ingredientsGroups": {groups}}}')
+
+    def section(self, section):
+        return f'{{"title": {self.value(section.title)}, "menu": [{", ".join(map(self.menu_item, section.items))}]}}'
+
+    def encode(self, restaurant):
+        # The header's dict without its closing brace, then the categories
+        header = self.other(restaurant.header())[:-1]
+        return f'{{"data": {header}, "categories": [{", ".join(map(self.section, restaurant.categories))}]}}}}'
+
+
+class JsonItemExporter(exporters.JsonItemExporter):
+    item_class = Restaurant
+    item_encoder_class = ItemEncoder
+
+
+class JsonLinesItemExporter(exporters.JsonLinesItemExporter):
+    item_class = Restaurant
+    item_encoder_class = ItemEncoder
+
+
+class ParquetItemExporter(BaseItemExporter):
+
+    def __init__(self, file, row_group_size=10000, compression='zstd', catalog_path=None,
+                 catalog_compression=None, crawled_at=None, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet feeds need the 'pyarrow' package")
+        self.parquet = pyarrow.parquet
+        try:
+            appending = file.tell() > 0
+        except (OSError, ValueError):
+            appending = False  # A pipe
+        if appending:
+            raise ValueError('Parquet feeds cannot be appended to, overwrite them (-O or overwrite: true)')
+        self.file = file
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.catalog_path = catalog_path
+        self.catalog_compression = catalog_compression
+        self.records = {}  # Catalog records by ID, read as IDs show up
+        self.schema = arrow_schema(COLUMNS)
+        self.writer = None
+        self.crawled_at = crawled_at
+        self.rows = []
+        self.rows_written = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        settings = crawler.settings
+        kwargs.setdefault('row_group_size', settings.getint('UBEREATS_PARQUET_ROW_GROUP_SIZE', 10000))
+        kwargs.setdefault('compression', settings.get('UBEREATS_PARQUET_COMPRESSION', 'zstd'))
+        catalog_path = settings.get('UBEREATS_CATALOG_PATH')
+        if catalog_path and 'ubereats.pipelines.OptionCatalogPipeline' in settings.getdict('ITEM_PIPELINES'):
+            compression = settings.get('UBEREATS_EXPORT_COMPRESSION') or None
+            kwargs.setdefault('catalog_path', records_path(catalog_path, compression))
+            kwargs.setdefault('catalog_compression', compression)
+        return cls(file, **kwargs)
+
+    def start_exporting(self):
+        if self.crawled_at is None:
+            self.crawled_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.writer = self.parquet.ParquetWriter(self.file, self.schema, compression=self.compression)
+
+    def export_item(self, item):
+        if not isinstance(item, Restaurant):
+            item = Restaurant.from_dict(dict(self._get_serialized_fields(item)))
+        self.rows.extend(self.rows_for(item))
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    def rows_for(self, restaurant):
+        head = (self.crawled_at, restaurant.url, restaurant.title)
+        for section in restaurant.categories:
+            section_head = head + (section.title,)
+            for menu_item in section.items:
+                item_columns = section_head + (
+                    menu_item.name,
+                    menu_item.description,
+                    menu_item.image_url,
+                    menu_item.price_cents,
+                )
+                groups = self.item_groups(menu_item)
+                if not any(group.options for group in groups):
+                    yield item_columns + NO_OPTION
+                for group in groups:
+                    group_columns = item_columns + (group.name, group.min_selection, group.max_selection)
+                    for option in group.options:
+                        yield group_columns + (
+                            option.name,
+                            option.price_cents,
+                            option.left_half_price_cents,
+                            option.right_half_price_cents,
+                        )
+
+    def item_groups(self, menu_item):
+        if menu_item.group_ids is None:
+            return menu_item.groups or []  # None when the item has no details
+        if any(key not in self.records for key in menu_item.group_ids):
+            # Written by the pipeline before the item got here
+            self.records.update(read_catalog(self.catalog_path, self.catalog_compression))
+        return [OptionGroup.from_dict(group) for group in expand_groups(menu_item.group_ids, self.records)]
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        import pyarrow as pa
+
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*self.rows), self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def finish_exporting(self):
+        self.write_row_group()
+        self.writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert an UberEats record file to Parquet')
+    parser.add_argument('records')
+    parser.add_argument('out')
+    parser.add_argument('--catalog', help='catalog of the groups, for items with group IDs')
+    parser.add_argument('--compression', choices=[c for c in COMPRESSION_SUFFIXES if c],
+                        help='compression of the record file and catalog')
+    parser.add_argument('--row-group-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    # The last record was written when the crawl ended
+    crawled_at = datetime.datetime.fromtimestamp(int(os.path.getmtime(args.records)), datetime.timezone.utc)
+    with open(args.out, 'wb') as out:
+        exporter = ParquetItemExporter(out, row_group_size=args.row_group_size, catalog_path=args.catalog,
+                                       catalog_compression=args.compression, crawled_at=crawled_at)
+        exporter.start_exporting()
+        for restaurant in iter_restaurants(args.records, args.compression):
+            exporter.export_item(Restaurant.from_dict(restaurant))
+        exporter.finish_exporting()
+    print(f'{exporter.rows_written} rows written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
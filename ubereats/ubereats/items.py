@@ -1,12 +1,165 @@
-# Define here the models for your scraped items
+# Items of the UberEats spider.
 #
-# See documentation in:
-# https://docs.scrapy.org/en/latest/topics/items.html
+# A restaurant holds its menu sections, a section its menu items, an item its
+# customization groups and a group its options. Prices are parsed into
+# integer cents once, when the spider builds the item, for the pipelines and
+# the Parquet feed; an item's price as the JSON-LD had it is kept next to them
+# in raw_price. to_dict() renders the {'data': {...}} shape the exports have
+# always had (item prices as in the JSON-LD, option prices as floats,
+# ingredientsGroups '' while the item's details are unknown), from_dict()
+# reads it back.
 
-import scrapy
+from dataclasses import dataclass, field
 
+from menucommon.prices import feed_price, to_cents
 
-class UbereatsItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+
+def dollars(cents):
+    # 720 -> 7.2
+    return cents / 100 if cents is not None else None
+
+
+@dataclass(slots=True)
+class Option:
+    name: str
+    price_cents: int | None = None
+    left_half_price_cents: int | None = None
+    right_half_price_cents: int | None = None
+    possible_to_add: int = 1
+
+    @classmethod
+    def from_dict(cls, option):
+        return cls(option.get('name'), to_cents(option.get('price')), to_cents(option.get('leftHalfPrice')),
+                   to_cents(option.get('rightHalfPrice')), option.get('possibleToAdd', 1))
+
+    def to_dict(self):
+        return {'name': self.name, 'possibleToAdd': self.possible_to_add, 'price': dollars(self.price_cents),
+                'leftHalfPrice': dollars(self.left_half_price_cents),
+                'rightHalfPrice': dollars(self.right_half_price_cents)}
+
+
+@dataclass(slots=True)
+class OptionGroup:
+    name: str
+    options: list  # Option
+    type: str = 'general'
+    min_selection: int = 0
+    max_selection: int | None = None  # None: no maximum was shown
+
+    @classmethod
+    def from_dict(cls, group):
+        return cls(group.get('name'), [Option.from_dict(option) for option in group.get('ingredients') or ()],
+                   group.get('type', 'general'), group.get('requiresSelectionMin', 0),
+                   group.get('requiresSelectionMax') or None)
+
+    def to_dict(self):
+        return {'type': self.type, 'name': self.name, 'requiresSelectionMin': self.min_selection,
+                'requiresSelectionMax': self.max_selection or '',
+                'ingredients': [option.to_dict() for option in self.options]}
+
+
+@dataclass(slots=True)
+class MenuItem:
+    name: str
+    price_cents: int | None = None
+    description: str | None = None
+    image_url: str = ''
+    type: str | None = 'MenuItem'
+    groups: list | None = None  # OptionGroup, None until the item's details are read
+    group_ids: list | None = None  # Catalog IDs replacing groups (OptionCatalogPipeline)
+    raw_price: str | float | None = None
+
+    @classmethod
+    def from_dict(cls, menu_item):
+        groups = menu_item.get('ingredientsGroups')
+        group_ids = None
+        if isinstance(groups, list) and groups and isinstance(groups[0], str):
+            groups, group_ids = None, groups
+        elif isinstance(groups, list):
+            groups = [OptionGroup.from_dict(group) for group in groups]
+        else:
+            groups = None
+        return cls(menu_item.get('name'), to_cents(menu_item.get('price')), menu_item.get('description'),
+                   menu_item.get('image_url', ''), menu_item.get('type'), groups, group_ids, menu_item.get('price'))
+
+    def to_dict(self):
+        if self.group_ids is not None:
+            groups = self.group_ids
+        elif self.groups is not None:
+            groups = [group.to_dict() for group in self.groups]
+        else:
+            groups = ''
+        return {'type': self.type, 'name': self.name, 'description': self.description,
+                'image_url': self.image_url, 'price': feed_price(self.raw_price, self.price_cents),
+                'ingredientsGroups': groups}
+
+
+@dataclass(slots=True)
+class Category:
+    title: str | None
+    items: list  # MenuItem
+
+    @classmethod
+    def from_dict(cls, section):
+        return cls(section.get('title'), [MenuItem.from_dict(menu_item) for menu_item in section.get('menu') or ()])
+
+    def to_dict(self):
+        return {'title': self.title, 'menu': [menu_item.to_dict() for menu_item in self.items]}
+
+
+@dataclass(slots=True)
+class Restaurant:
+    url: str | None
+    title: str | None
+    categories: list  # Category
+    context: str | None = None
+    images: list = field(default_factory=list)
+    address: dict = field(default_factory=dict)
+    opening_hours: list = field(default_factory=list)  # 'Monday 11:00-22:00'
+    price_range: str | None = None
+    telephone: str | None = None
+    rating_value: float | None = None
+    rating_count: str | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+    cuisine: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, restaurant):
+        data = restaurant.get('data', restaurant)
+        return cls(
+            data.get('titleURL'), data.get('title'),
+            [Category.from_dict(section) for section in data.get('categories') or ()],
+            context=data.get('Context'), images=data.get('images') or [],
+            address=data.get('restaurantAddress') or {}, opening_hours=data.get('storeOpeningHours') or [],
+            price_range=data.get('priceRange'), telephone=data.get('telephone'),
+            rating_value=data.get('ratingValue'), rating_count=data.get('ratingCount'),
+            latitude=data.get('latitude'), longitude=data.get('longitude'), cuisine=data.get('cuisine') or [],
+        )
+
+    def header(self):
+        # 'data' of to_dict() up to the categories
+        return {
+            'menu_id': 18344,
+            'titleURL': self.url,
+            'title_id': '',
+            'Context': self.context,
+            'title': self.title,
+            'images': self.images,
+            'LogoURL': '',
+            'restaurantAddress': self.address,
+            'storeOpeningHours': self.opening_hours,
+            'priceRange': self.price_range,
+            'telephone': self.telephone,
+            'ratingValue': self.rating_value,
+            'ratingCount': self.rating_count,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'cuisine': self.cuisine,
+            'menu_groups': list(dict.fromkeys(section.title for section in self.categories)),
+        }
+
+    def to_dict(self):
+        data = self.header()
+        data['categories'] = [section.to_dict() for section in self.categories]
+        return {'data': data}
@@ -0,0 +1,331 @@
+# Define your item pipelines here
+#
+# Don't forget to add your pipeline to the ITEM_PIPELINES setting
+# See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+
+import functools
+import time
+from dataclasses import replace
+
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+
+from menucommon.catalog import Catalog
+from menucommon.snapshots import SnapshotIndex
+
+from ubereats.catalog import expand_restaurant, read_catalog
+from ubereats.export import RecordWriter, records_path, write_json_view
+from ubereats.exporters import ItemEncoder
+from ubereats.items import Restaurant
+
+
+class UbereatsPipeline:
+    # Validates the restaurant items before the other pipelines see them:
+    # menu items and options without a name are dropped, negative prices are
+    # cleared, and a restaurant without a URL is dropped. Sections left
+    # without menu items are dropped with them. Changed sections, menu items,
+    # groups and options are copies, so the restaurant the spider yielded is
+    # left as it was.
+
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_item(self, item, spider):
+        if not isinstance(item, Restaurant):
+            raise DropItem(f'Not a Restaurant item: {type(item).__name__}')
+        if not item.url:
+            raise DropItem(f'Restaurant {item.title!r} without a URL')
+        categories = []
+        for section in item.categories:
+            menu_items = [self.valid_menu_item(menu_item, spider) for menu_item in section.items]
+            menu_items = [menu_item for menu_item in menu_items if menu_item is not None]
+            if menu_items:
+                categories.append(replace(section, items=menu_items))
+        return replace(item, categories=categories)
+
+    def valid_menu_item(self, menu_item, spider):
+        # The menu item, a cleaned copy of it, or None when it is dropped
+        if not menu_item.name:
+            self.inc_stat('validation/items_dropped')
+            return None
+        if menu_item.price_cents is not None and menu_item.price_cents < 0:
+            spider.logger.warning(f'Negative price {menu_item.price_cents} of {menu_item.name!r} cleared')
+            menu_item = replace(menu_item, price_cents=None, raw_price=None)
+            self.inc_stat('validation/prices_cleared')
+        if menu_item.groups:
+            groups = [self.valid_group(group) for group in menu_item.groups]
+            if any(valid is not group for valid, group in zip(groups, menu_item.groups)):
+                menu_item = replace(menu_item, groups=groups)
+        return menu_item
+
+    def valid_group(self, group):
+        options = [option for option in group.options if option.name]
+        changed = len(options) < len(group.options)
+        if changed:
+            self.inc_stat('validation/options_dropped', len(group.options) - len(options))
+        for i, option in enumerate(options):
+            if option.price_cents is not None and option.price_cents < 0:
+                options[i] = replace(option, price_cents=None, left_half_price_cents=None,
+                                     right_half_price_cents=None)
+                self.inc_stat('validation/prices_cleared')
+                changed = True
+        return replace(group, options=options) if changed else group
+
+    def inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+
+class MenuDiffPipeline:
+    # Compares every menu item with the one of the previous crawl in the index
+    # at UBEREATS_SNAPSHOT_PATH (see snapshots.py) and writes what changed to
+    # UBEREATS_CHANGES_PATH, a record file with the export's compression, as
+    # each restaurant comes in: added, price, changed (other fields),
+    # option_added, option_price and option_removed. Items gone from a store
+    # are written as removed when the crawl finishes; an interrupted crawl
+    # reports no removals.
+
+    def __init__(self, index_path, changes_path, compression=None, stats=None):
+        self.index_path = index_path
+        self.changes_path = records_path(changes_path, compression)
+        self.compression = compression
+        self.stats = stats
+        self.index = None
+        self.writer = None
+        self.stores = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        index_path = settings.get('UBEREATS_SNAPSHOT_PATH')
+        changes_path = settings.get('UBEREATS_CHANGES_PATH')
+        if not index_path or not changes_path:
+            raise NotConfigured('UBEREATS_SNAPSHOT_PATH or UBEREATS_CHANGES_PATH is not set')
+        pipeline = cls(index_path, changes_path, settings.get('UBEREATS_EXPORT_COMPRESSION') or None,
+                       stats=crawler.stats)
+        # After close_spider, but with the close reason
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.index = SnapshotIndex(self.index_path)
+        self.writer = RecordWriter(self.changes_path, self.compression)
+        if self.index.baseline:
+            spider.logger.info(f'No finished crawl in {self.index_path} yet, this one is the baseline')
+
+    def process_item(self, item, spider):
+        store = item.url
+        self.stores.add(store)
+        for section in item.categories:
+            for menu_item in section.items:
+                fields = [menu_item.name, menu_item.description, menu_item.image_url, menu_item.price_cents]
+                changes = self.index.diff(store, section.title, menu_item.name, menu_item.price_cents, fields,
+                                          self.item_groups(menu_item))
+                self.write(changes)
+        self.writer.checkpoint()
+        return item
+
+    def item_groups(self, menu_item):
+        # {group: ([(option, cents), ...], group)}, None when the item's
+        # details weren't read ('' in ingredientsGroups)
+        if menu_item.groups is None:
+            return None
+        return {group.name or '': ([(option.name, option.price_cents) for option in group.options], group.to_dict())
+                for group in menu_item.groups}
+
+    def write(self, changes):
+        for change in changes:
+            change['crawl'] = self.index.crawl
+            self.writer.write(change)
+            if self.stats is not None:
+                self.stats.inc_value(f"changes/{change['change']}")
+
+    def spider_closed(self, spider, reason):
+        if reason == 'finished':
+            for store in self.stores:
+                self.write(self.index.removed(store))
+            self.index.finish()
+        else:
+            spider.logger.warning(f'Crawl ended with {reason!r}, removed items are not reported')
+        self.writer.close()
+        self.index.close()
+        spider.logger.info(f'Changes since the previous crawl written to {self.changes_path}')
+
+
+class OptionCatalogPipeline:
+    # Moves the ingredients and option groups of every menu item into the
+    # catalog at UBEREATS_CATALOG_PATH (see catalog.py), written with the
+    # export's compression and append mode. Runs before
+    # StreamingExportPipeline, which then writes items holding group IDs.
+    # The IDs are remembered by the fields of the option or group, so only
+    # content not seen before is serialized and hashed. Slimmed menu items are
+    # copies, as in UbereatsPipeline.
+
+    def __init__(self, path, compression=None, append=False, stats=None, max_ids=100000):
+        self.path = records_path(path, compression)
+        self.compression = compression
+        self.append = append
+        self.stats = stats
+        self.max_ids = max_ids
+        self.ids = {}  # Catalog IDs by fields
+        self.writer = None
+        self.catalog = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('UBEREATS_CATALOG_PATH')
+        if not path:
+            raise NotConfigured('UBEREATS_CATALOG_PATH is not set')
+        return cls(
+            path,
+            compression=settings.get('UBEREATS_EXPORT_COMPRESSION') or None,
+            append=settings.getbool('UBEREATS_EXPORT_APPEND'),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        ids = read_catalog(self.path, self.compression) if self.append else ()
+        self.writer = RecordWriter(self.path, self.compression, append=self.append)
+        self.catalog = Catalog(self.writer, ids)
+
+    def process_item(self, item, spider):
+        written = len(self.catalog.ids)
+        categories = []
+        for section in item.categories:
+            menu_items = [
+                menu_item if menu_item.groups is None else
+                replace(menu_item, groups=None, group_ids=[self.group_id(group) for group in menu_item.groups])
+                for menu_item in section.items
+            ]
+            categories.append(replace(section, items=menu_items))
+        item = replace(item, categories=categories)
+        if len(self.catalog.ids) > written:
+            # On disk before the restaurant referencing them
+            self.writer.checkpoint()
+        if self.stats is not None:
+            self.stats.set_value('catalog/records', len(self.catalog.ids))
+            self.stats.set_value('catalog/references', self.catalog.references)
+        return item
+
+    def option_id(self, option):
+        fields = (option.name, option.possible_to_add, option.price_cents, option.left_half_price_cents,
+                  option.right_half_price_cents)
+        key = self.ids.get(fields)
+        if key is not None:
+            return self.catalog.reference(key)
+        return self.remember(fields, self.catalog.intern('ingredient', option.to_dict()))
+
+    def group_id(self, group):
+        # The group as the exports show it, with the IDs of its ingredients
+        options = [self.option_id(option) for option in group.options]
+        fields = (group.type, group.name, group.min_selection, group.max_selection, tuple(options))
+        key = self.ids.get(fields)
+        if key is not None:
+            return self.catalog.reference(key)
+        record = group.to_dict()
+        record['ingredients'] = options
+        return self.remember(fields, self.catalog.intern('group', record))
+
+    def remember(self, fields, key):
+        if len(self.ids) >= self.max_ids:
+            self.ids.clear()
+        self.ids[fields] = key
+        return key
+
+    def close_spider(self, spider):
+        self.writer.close()
+        spider.logger.info(
+            f"Catalog {self.path}: {len(self.catalog.ids)} distinct ingredients and groups for "
+            f"{self.catalog.references} references")
+
+
+class StreamingExportPipeline:
+    # Streams every restaurant to a JSON Lines file as soon as it is scraped,
+    # either as one record per restaurant or as a restaurant header followed by
+    # one record per menu item (UBEREATS_EXPORT_RECORDS = 'item'). The file is
+    # checkpointed (compressor flushed, file fsync'd) every
+    # UBEREATS_EXPORT_CHECKPOINT_ITEMS restaurants or
+    # UBEREATS_EXPORT_CHECKPOINT_SECS seconds. UBEREATS_EXPORT_JSON_VIEW renders
+    # the records as a JSON array when the spider closes.
+
+    def __init__(self, path, records='restaurant', compression=None, append=False,
+                 checkpoint_items=1, checkpoint_secs=30, json_view=None, stats=None, catalog_path=None):
+        if records not in ('restaurant', 'item'):
+            raise ValueError(f"UBEREATS_EXPORT_RECORDS must be 'restaurant' or 'item', not {records!r}")
+        self.path = records_path(path, compression)
+        self.records = records
+        self.compression = compression
+        self.append = append
+        self.checkpoint_items = checkpoint_items
+        self.checkpoint_secs = checkpoint_secs
+        self.json_view = json_view
+        self.stats = stats
+        # With OptionCatalogPipeline the JSON view is expanded from its catalog
+        self.catalog_path = records_path(catalog_path, compression) if catalog_path else None
+        self.encoder = ItemEncoder()
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            path=settings.get('UBEREATS_EXPORT_PATH', 'ubereats_data.jsonl'),
+            records=settings.get('UBEREATS_EXPORT_RECORDS', 'restaurant'),
+            compression=settings.get('UBEREATS_EXPORT_COMPRESSION') or None,
+            append=settings.getbool('UBEREATS_EXPORT_APPEND'),
+            checkpoint_items=settings.getint('UBEREATS_EXPORT_CHECKPOINT_ITEMS', 1),
+            checkpoint_secs=settings.getfloat('UBEREATS_EXPORT_CHECKPOINT_SECS', 30),
+            json_view=settings.get('UBEREATS_EXPORT_JSON_VIEW'),
+            stats=crawler.stats,
+            catalog_path=settings.get('UBEREATS_CATALOG_PATH')
+            if 'ubereats.pipelines.OptionCatalogPipeline' in settings.getdict('ITEM_PIPELINES') else None,
+        )
+
+    def open_spider(self, spider):
+        self.writer = RecordWriter(self.path, self.compression, append=self.append)
+        self.unsaved = 0
+        self.last_checkpoint = time.monotonic()
+
+    def process_item(self, item, spider):
+        if self.records == 'restaurant':
+            self.writer.write_json(self.encoder.encode(item))
+        else:
+            for record in self.records_for(item.to_dict()):
+                self.writer.write(record)
+        self.unsaved += 1
+        if self.unsaved >= self.checkpoint_items or \
+                time.monotonic() - self.last_checkpoint >= self.checkpoint_secs:
+            self.checkpoint()
+        return item
+
+    def records_for(self, restaurant):
+        # A restaurant header and its menu items ('item' records)
+        data = dict(restaurant['data'])
+        categories = data.pop('categories', [])
+        store = data.get('titleURL')
+        yield {'record': 'restaurant', 'data': data}
+        for section in categories:
+            for menu_item in section['menu']:
+                yield dict(menu_item, record='item', store=store, section=section['title'])
+
+    def checkpoint(self):
+        self.writer.checkpoint()
+        self.unsaved = 0
+        self.last_checkpoint = time.monotonic()
+        if self.stats is not None:
+            self.stats.inc_value('export/checkpoints')
+            self.stats.set_value('export/records', self.writer.records)
+
+    def close_spider(self, spider):
+        self.writer.close()
+        if self.json_view:
+            transform = None
+            if self.catalog_path:
+                transform = functools.partial(expand_restaurant, records=read_catalog(self.catalog_path, self.compression))
+            write_json_view(self.path, self.json_view, self.compression, transform)
+            spider.logger.info(f"Wrote {self.json_view} from {self.path}")
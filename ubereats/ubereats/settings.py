@@ -24,6 +24,51 @@ AUTOTHROTTLE_ENABLED = True
 AUTOTHROTTLE_START_DELAY = 5
 AUTOTHROTTLE_MAX_DELAY = 120  # Increase maximum delay for throttling
 
+# Resource-blocking render profile for the spider's browser. Only img/@src is
+# read, so images, fonts and media are never downloaded, and neither is
+# anything from the domains below. Set SELENIUM_BLOCK_RESOURCES = [] for a
+# full render.
+SELENIUM_BLOCK_RESOURCES = ['image', 'font', 'media']
+SELENIUM_BLOCKED_DOMAINS = [
+    'googletagmanager.com',
+    'google-analytics.com',
+    'doubleclick.net',
+    'facebook.net',
+    'branch.io',
+]
+# chromedriver to use. When unset the one found on an earlier run (cached
+# under ~/.cache/ubereats) or on PATH is used, and only failing both is it
+# downloaded with webdriver_manager.
+SELENIUM_DRIVER_PATH = None
+# Browser lifecycle: each browser is relaunched after this many stores, or
+# once chromedriver and its Chrome processes use more than this much resident
+# memory (needs psutil; 0 disables either check). Stores whose browser
+# crashed under them are collected again up to SELENIUM_BROWSER_RETRIES
+# times. Recycles and crashes are counted in the browser/* stats.
+SELENIUM_BROWSER_MAX_PAGES = 25
+SELENIUM_BROWSER_MAX_RSS_MB = 1500
+SELENIUM_BROWSER_RETRIES = 2
+
+# Read item options from the store's getStoreV1/getMenuItemV1 API payloads
+# (captured from the browser's network log, missing items fetched in parallel
+# from inside the page) instead of clicking every item. Falls back to
+# clicking when the store payload can't be captured.
+UBEREATS_CAPTURE_API = True
+UBEREATS_CAPTURE_CONCURRENCY = 8
+
+# Multi-store crawling. UBEREATS_STORES_FILE lists one store URL per line
+# (stores can also be passed with -a stores=url1,url2). With
+# UBEREATS_WORKERS > 0 the stores are spread over that many worker processes,
+# each with its own browser, and one restaurant item per store goes to FEEDS.
+# A store whose browser work fails is retried UBEREATS_STORE_RETRIES times.
+UBEREATS_STORES_FILE = None
+UBEREATS_WORKERS = 4
+UBEREATS_STORE_RETRIES = 2
+# Crawl another copy of the site: every store URL is moved to this origin.
+# Used with the local stand-in (python benchmarks/standin.py) for throughput
+# runs, together with its --stores-file.
+UBEREATS_BASE_URL = None
+
 
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
@@ -98,9 +143,69 @@ AUTOTHROTTLE_MAX_DELAY = 120  # Increase maximum delay for throttling
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
-FEEDS = {
-    'final.json': {
-        'format': 'json',
-        'overwrite': True,  # Overwrite the file if it already exists
-    },
+
+# UbereatsPipeline validates the items before the others see them
+ITEM_PIPELINES = {
+    "ubereats.pipelines.UbereatsPipeline": 300,
+    "ubereats.pipelines.MenuDiffPipeline": 600,
+    "ubereats.pipelines.StreamingExportPipeline": 800,
+}
+
+# With "ubereats.pipelines.OptionCatalogPipeline": 700 added to
+# ITEM_PIPELINES, ingredients and option groups are written once each to
+# UBEREATS_CATALOG_PATH (record file keyed by a hash of their content, same
+# compression and append mode as the export) and menu items carry the IDs of
+# their groups in ingredientsGroups. UBEREATS_EXPORT_JSON_VIEW is expanded
+# back to full groups. Without it the records are self-contained.
+UBEREATS_CATALOG_PATH = 'ubereats_catalog.jsonl'
+
+# Menu items are compared with the previous crawl, kept in the SQLite index
+# at UBEREATS_SNAPSHOT_PATH, and only the changes are written to
+# UBEREATS_CHANGES_PATH (record file with the export's compression,
+# rewritten by every crawl). The first crawl only builds the index.
+UBEREATS_SNAPSHOT_PATH = 'ubereats_snapshot.sqlite'
+UBEREATS_CHANGES_PATH = 'ubereats_changes.jsonl'
+
+# Restaurants are streamed to UBEREATS_EXPORT_PATH as JSON Lines while the
+# crawl runs: one record per restaurant, or with 'item' a restaurant header
+# followed by one record per menu item. Compression: None, 'gzip' or 'zstd'
+# (needs the zstandard package). A checkpoint flushes and fsyncs the file,
+# so a crash only loses what came after the last one.
+UBEREATS_EXPORT_PATH = 'ubereats_data.jsonl'
+UBEREATS_EXPORT_RECORDS = 'restaurant'
+UBEREATS_EXPORT_COMPRESSION = None
+UBEREATS_EXPORT_APPEND = False
+UBEREATS_EXPORT_CHECKPOINT_ITEMS = 1
+UBEREATS_EXPORT_CHECKPOINT_SECS = 30
+# final.json is rendered from the records when the spider closes instead of
+# being exported as a second copy by FEEDS
+UBEREATS_EXPORT_JSON_VIEW = 'final.json'
+
+# JSON and JSON Lines feeds write the Restaurant items through their own
+# serializer. "-O menus.parquet" writes a flat Parquet table, one row per
+# option with prices in integer cents (see exporters.py), a row group every
+# UBEREATS_PARQUET_ROW_GROUP_SIZE rows. Needs the pyarrow package.
+FEED_EXPORTERS = {
+    "json": "ubereats.exporters.JsonItemExporter",
+    "jsonlines": "ubereats.exporters.JsonLinesItemExporter",
+    "jsonl": "ubereats.exporters.JsonLinesItemExporter",
+    "jl": "ubereats.exporters.JsonLinesItemExporter",
+    "parquet": "ubereats.exporters.ParquetItemExporter",
+}
+UBEREATS_PARQUET_ROW_GROUP_SIZE = 10000
+UBEREATS_PARQUET_COMPRESSION = 'zstd'
+
+# Per-phase timing (driver.get, waiting for the items, API capture,
+# extract_item_details, merging the details) is kept in the stats as
+# timing/<phase>/* histograms and written to TIMING_PROMETHEUS_FILE every
+# TIMING_PROMETHEUS_INTERVAL seconds, for node_exporter's textfile collector.
+# Stores slower in total than the threshold of their URL pattern (seconds,
+# first match wins) are logged.
+EXTENSIONS = {
+    "menucommon.timing.PhaseTimingExporter": 500,
+}
+TIMING_PROMETHEUS_FILE = "metrics/ubereats.prom"
+TIMING_PROMETHEUS_INTERVAL = 15
+TIMING_SLOW_PAGES = {
+    r'ubereats\.com/store/': 120,
 }
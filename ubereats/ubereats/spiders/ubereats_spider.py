@@ -1,13 +1,64 @@
 import scrapy
+import asyncio
+import functools
 import json
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
 import re  # Import regular expressions module
+import html
+import unicodedata
+from urllib.parse import urlparse
+
+from menucommon.timing import check_slow_page, record_timings, span
+
+from ubereats.browser import BrowserCrashed, ManagedDriver, create_driver
+from ubereats.items import Category, MenuItem, OptionGroup, Restaurant, to_cents
+from ubereats.capture import (STORE_ENDPOINT, ITEM_ENDPOINT, captured_payloads, catalog_items,
+                              fetch_item_payloads, item_details_from_payload)
+
+MODAL_SELECTORS = {
+    'item_name': 'h1.ft.fv.fu.fs.al.cg',
+    'image': 'div.cj.ae.bl.kx img',
+    'pick_many': 'div[data-testid="customization-pick-many"]',
+    'pick_one': 'div[data-testid="customization-pick-one"]',
+    'category_name': 'div.fs.hy.fu.hz.g4',
+    'text': 'div.be.bf.g1.dj.g4',
+    'option': 'label',
+    'option_name': 'div.be.bf.bg.bh.g3.os',
+    'option_price': 'div.be.bf.g1.dj.g3.bn',
+}
+
+# Walks the open item modal and returns everything extract_item_details needs
+# as one JSON structure. Missing elements come back as null so the Python side
+# can keep the error handling of the element-by-element version. innerText is
+# what WebElement.text reads for visible elements.
+EXTRACT_MODAL_JS = """
+var S = arguments[0];
+function text(root, selector) {
+    var el = root.querySelector(selector);
+    return el ? el.innerText : null;
+}
+function blocks(selector) {
+    return Array.prototype.map.call(document.querySelectorAll(selector), function (block) {
+        return {
+            category_name: text(block, S.category_name),
+            text: text(block, S.text),
+            options: Array.prototype.map.call(block.querySelectorAll(S.option), function (option) {
+                return {name: text(option, S.option_name), price: text(option, S.option_price)};
+            })
+        };
+    });
+}
+var image = document.querySelector(S.image);
+return {
+    item_name: text(document, S.item_name),
+    image_url: image ? image.src : null,
+    pick_many: blocks(S.pick_many),
+    pick_one: blocks(S.pick_one)
+};
+"""
 
 
 class UberEatsSpider(scrapy.Spider):
@@ -16,93 +67,255 @@ class UberEatsSpider(scrapy.Spider):
         'https://www.ubereats.com/store/flintridge-pizza-kitchen/RxyR9w3aU-KVTHK2s9XGlg?ps=1'
     ]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, block_resources=(), blocked_domains=(), capture_api=False,
+                 capture_concurrency=8, stores=None, stores_file=None, workers=0, store_retries=2,
+                 base_url=None, driver_path=None, browser_max_pages=0, browser_max_rss_mb=0,
+                 browser_retries=2, **kwargs):
         super(UberEatsSpider, self).__init__(*args, **kwargs)
-        chrome_options = Options()
-        # chrome_options.add_argument("--headless")  # Uncomment to run in headless mode
-        chrome_options.add_argument("--disable-gpu")
-        self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=chrome_options)
-        self.data = {}  # Initialize a list to store the data
-        self.section_names = set()  # Initialize a set to store unique section names
-
-    def parse(self, response):
-        self.driver.get(response.url)
-
+        # Spider arguments (-a block_resources=image,font) arrive as strings
+        if isinstance(block_resources, str):
+            block_resources = [r for r in block_resources.split(',') if r]
+        if isinstance(blocked_domains, str):
+            blocked_domains = [d for d in blocked_domains.split(',') if d]
+        if isinstance(capture_api, str):
+            capture_api = capture_api.lower() in ('1', 'true', 'yes')
+        # Build item details from the store's API payloads instead of clicking every item
+        self.capture_api = capture_api
+        self.capture_concurrency = int(capture_concurrency)
+
+        # Stores to crawl: -a stores=url1,url2 and/or -a stores_file=stores.txt
+        # (one URL per line), start_urls when neither is given
+        self.store_urls = self.load_store_urls(stores, stores_file) or list(self.start_urls)
+        if base_url:
+            # Crawl another copy of the site, e.g. the local stand-in in benchmarks/standin.py
+            self.store_urls = [self.rebase_url(url, base_url) for url in self.store_urls]
+            self.allowed_domains = [urlparse(base_url).hostname]
+        self.store_retries = int(store_retries)
+
+        # With workers > 0 the stores are spread over that many worker
+        # processes, each owning its own browser; otherwise the spider drives
+        # a single browser itself
+        self.workers = int(workers)
+        self.worker_kwargs = {
+            'block_resources': list(block_resources),
+            'blocked_domains': list(blocked_domains),
+            'capture_api': capture_api,
+            'capture_concurrency': self.capture_concurrency,
+            'driver_path': driver_path,
+            'browser_max_pages': int(browser_max_pages),
+            'browser_max_rss_mb': int(browser_max_rss_mb),
+        }
+        # A store whose browser died under it is collected again this many times
+        self.browser_retries = int(browser_retries)
+        self.executor = self.new_executor() if self.workers > 0 else None
+        self.timings = []  # (phase, seconds) samples of the last collect_item_details call
+        # The browser is launched by the first store that needs it and
+        # recycled by page count, memory and crashes
+        self.browser = ManagedDriver(
+            functools.partial(create_driver, list(block_resources), list(blocked_domains),
+                              capture_network=capture_api, driver_path=driver_path),
+            max_pages=int(browser_max_pages), max_rss_mb=int(browser_max_rss_mb))
+
+    @property
+    def driver(self):
+        return self.browser.driver
+
+    def quit_driver(self):
+        self.browser.quit()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        # Resource-blocking render profile from the project settings
+        kwargs.setdefault('block_resources', crawler.settings.getlist('SELENIUM_BLOCK_RESOURCES'))
+        kwargs.setdefault('blocked_domains', crawler.settings.getlist('SELENIUM_BLOCKED_DOMAINS'))
+        kwargs.setdefault('capture_api', crawler.settings.getbool('UBEREATS_CAPTURE_API'))
+        kwargs.setdefault('capture_concurrency', crawler.settings.getint('UBEREATS_CAPTURE_CONCURRENCY', 8))
+        kwargs.setdefault('stores_file', crawler.settings.get('UBEREATS_STORES_FILE'))
+        kwargs.setdefault('workers', crawler.settings.getint('UBEREATS_WORKERS', 0))
+        kwargs.setdefault('store_retries', crawler.settings.getint('UBEREATS_STORE_RETRIES', 2))
+        kwargs.setdefault('base_url', crawler.settings.get('UBEREATS_BASE_URL'))
+        kwargs.setdefault('driver_path', crawler.settings.get('SELENIUM_DRIVER_PATH'))
+        kwargs.setdefault('browser_max_pages', crawler.settings.getint('SELENIUM_BROWSER_MAX_PAGES', 0))
+        kwargs.setdefault('browser_max_rss_mb', crawler.settings.getint('SELENIUM_BROWSER_MAX_RSS_MB', 0))
+        kwargs.setdefault('browser_retries', crawler.settings.getint('SELENIUM_BROWSER_RETRIES', 2))
+        return super(UberEatsSpider, cls).from_crawler(crawler, *args, **kwargs)
+
+    def load_store_urls(self, stores=None, stores_file=None):
+        urls = []
+        if isinstance(stores, str):
+            stores = stores.split(',')
+        urls.extend(url.strip() for url in stores or [] if url.strip())
+        if stores_file:
+            with open(stores_file, encoding='utf-8') as f:
+                urls.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        return list(dict.fromkeys(urls))  # Drop duplicates, keep order
+
+    def rebase_url(self, url, base_url):
+        base = urlparse(base_url)
+        return urlparse(url)._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+    def new_executor(self):
+        # Spawned rather than forked, so the workers don't inherit the reactor
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(self.worker_kwargs,))
+
+    def start_requests(self):
+        for url in self.store_urls:
+            yield scrapy.Request(url, callback=self.parse, errback=self.store_failed)
+
+    async def parse(self, response):
         # Extract the JSON data from the <script type="application/ld+json"> tag
         json_data = response.xpath('//script[@type="application/ld+json"]/text()').get()
         if json_data:
             try:
                 data = json.loads(json_data)
-                menu_data = self.parse_menu(data.get('hasMenu', {}))  # Parse initial menu structure
-
-                # Track unique section names
-                self.section_names.update(section['title'] for section in menu_data)
+                menu_index = self.new_menu_index()
+                menu_data = self.parse_menu(data.get('hasMenu', {}), menu_index)  # Parse initial menu structure
 
                 # Now handle dynamic content for menu items
                 try:
-                    WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'li[data-test^="store-item-"]'))
-                    )
-
-                    items = self.driver.find_elements(By.CSS_SELECTOR, 'li[data-test^="store-item-"]')
+                    if self.executor is not None:
+                        executor = self.executor
+                        try:
+                            item_details, timings, browser_events = await asyncio.wrap_future(
+                                executor.submit(_collect_item_details, response.url))
+                        except BrokenProcessPool:
+                            # A worker died (e.g. its browser crashed); replace the
+                            # pool once and let the affected stores be retried
+                            if self.executor is executor:
+                                executor.shutdown(wait=False, cancel_futures=True)
+                                self.executor = self.new_executor()
+                            raise
+                        except Exception as e:
+                            # A crash or recycle of the worker's browser still counts
+                            self.record_browser_events(*getattr(e, 'browser_events', ((), 0)))
+                            raise
+                        self.record_browser_events(*browser_events)
+                    else:
+                        try:
+                            item_details = self.collect_item_details(response.url)
+                        finally:
+                            self.record_browser_events(*self.browser.drain_events())
+                        timings = self.timings
 
                     # Extract and append item details to the menu
-                    for item in items:
-                        try:
-                            item.click()
-                            self.handle_popup()
-                            details = self.extract_item_details()
+                    with span(timings, 'merge_details'):
+                        for details in item_details:
                             if details:
-                                menu_data = self.append_item_details_to_menu(menu_data, details)  # Append details
-                            self.driver.back()
-                            WebDriverWait(self.driver, 10).until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, 'li[data-test^="store-item-"]'))
-                            )
-                        except Exception as e:
-                            self.logger.error(f"Error occurred while processing item: {e}")
-                            continue
+                                menu_data = self.append_item_details_to_menu(menu_data, details, menu_index)  # Append details
+                    self.record_timings(response.url, timings)
 
                     # Yield the final restaurant data with complete menu details
-                    restaurant = {
-                        'data': {
-                            "menu_id": 18344,
-                            'titleURL': data.get('@id'),
-                            'title_id': '',
-                            'Context': data.get('@context'),
-                            'title': data.get('name'),
-                            'images': data.get('image', []),
-                            'LogoURL': '',
-
-                            'restaurantAddress': {
-                                '@type': data.get('address', {}).get('@type'),
-                                'streetAddress': data.get('address', {}).get('streetAddress'),
-                                'addressLocality': data.get('address', {}).get('addressLocality'),
-                                'addressRegion': data.get('address', {}).get('addressRegion'),
-                                'postalCode': data.get('address', {}).get('postalCode'),
-                                'addressCountry': data.get('address', {}).get('addressCountry'),
-                            },
-                            'storeOpeningHours': self.parse_opening_hours(data.get('openingHoursSpecification', [])),
-                            'priceRange': data.get('priceRange'),
-                            'telephone': data.get('telephone'),
-                            'ratingValue': data.get('aggregateRating', {}).get('ratingValue'),
-                            'ratingCount': data.get('aggregateRating', {}).get('reviewCount'),
-                            'latitude': data.get('geo', {}).get('latitude'),
-                            'longitude': data.get('geo', {}).get('longitude'),
-                            'cuisine': data.get('servesCuisine', []),
-                            'menu_groups': list(self.section_names),  # Add unique section names to menu_groups
-
-                            'categories': menu_data  # Final menu with appended details
-                        }
-                    }
-                    yield restaurant
-                    self.data = restaurant  # Store the data in the list
+                    restaurant = Restaurant(
+                        data.get('@id'),
+                        data.get('name'),
+                        menu_data,  # Final menu with appended details
+                        context=data.get('@context'),
+                        images=data.get('image', []),
+                        address={
+                            '@type': data.get('address', {}).get('@type'),
+                            'streetAddress': data.get('address', {}).get('streetAddress'),
+                            'addressLocality': data.get('address', {}).get('addressLocality'),
+                            'addressRegion': data.get('address', {}).get('addressRegion'),
+                            'postalCode': data.get('address', {}).get('postalCode'),
+                            'addressCountry': data.get('address', {}).get('addressCountry'),
+                        },
+                        opening_hours=self.parse_opening_hours(data.get('openingHoursSpecification', [])),
+                        price_range=data.get('priceRange'),
+                        telephone=data.get('telephone'),
+                        rating_value=data.get('aggregateRating', {}).get('ratingValue'),
+                        rating_count=data.get('aggregateRating', {}).get('reviewCount'),
+                        latitude=data.get('geo', {}).get('latitude'),
+                        longitude=data.get('geo', {}).get('longitude'),
+                        cuisine=data.get('servesCuisine', []),
+                    )
+                    self.inc_stat('stores/scraped')
+                    yield restaurant  # Streamed to disk by StreamingExportPipeline
+
+                except BrowserCrashed as e:
+                    # Not the store's fault: the browser has been replaced already
+                    self.inc_stat('browser/crashed')
+                    retries = response.meta.get('browser_retries', 0)
+                    if retries < self.browser_retries:
+                        self.logger.warning(f"{e}, collecting {response.url} again")
+                        self.inc_stat('stores/requeued')
+                        yield response.request.replace(
+                            dont_filter=True, meta=dict(response.meta, browser_retries=retries + 1))
+                    else:
+                        self.logger.error(f"Browser kept crashing on {response.url}: {e}")
+                        self.inc_stat('stores/failed')
 
                 except Exception as e:
-                    self.logger.error(f"Error occurred while extracting dynamic content: {e}")
+                    self.logger.error(f"Error occurred while extracting dynamic content from {response.url}: {e}")
+                    retries = response.meta.get('store_retries', 0)
+                    if retries < self.store_retries:
+                        self.inc_stat('stores/retried')
+                        yield response.request.replace(
+                            dont_filter=True, meta=dict(response.meta, store_retries=retries + 1))
+                    else:
+                        self.inc_stat('stores/failed')
 
             except json.JSONDecodeError as e:
                 self.logger.error(f'Error decoding JSON: {e}')
 
+    def store_failed(self, failure):
+        self.logger.error(f"Failed to download store {failure.request.url}: {failure.value!r}")
+        self.inc_stat('stores/failed')
+
+    def collect_item_details(self, url):
+        # Opens the store in this spider's browser and returns the details of
+        # every item. Raises BrowserCrashed if the browser died meanwhile.
+        try:
+            item_details = self.read_store_items(url)
+        except Exception as e:
+            self.browser.check_error(e)
+            raise
+        self.browser.page_done()
+        return item_details
+
+    def read_store_items(self, url):
+        # The details of every item, from the captured API payloads or by
+        # clicking each item. Phase timings are left in self.timings.
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        self.timings = timings = []
+        with span(timings, 'driver_get'):
+            self.driver.get(url)
+        with span(timings, 'wait_items'):
+            WebDriverWait(self.driver, 10).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'li[data-test^="store-item-"]'))
+            )
+
+        captured = None
+        if self.capture_api:
+            with span(timings, 'capture_api'):
+                captured = self.capture_item_details()
+        if captured is not None:
+            return captured
+
+        item_details = []
+        items = self.driver.find_elements(By.CSS_SELECTOR, 'li[data-test^="store-item-"]')
+        for item in items:
+            try:
+                # store-item-<uuid>, the uuid being the item's JSON-LD @id
+                item_id = (item.get_attribute('data-test') or '')[len('store-item-'):] or None
+                item.click()
+                self.handle_popup()
+                with span(timings, 'extract_item_details'):
+                    item_details.append(self.extract_item_details(item_id))
+                self.driver.back()
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, 'li[data-test^="store-item-"]'))
+                )
+            except Exception as e:
+                self.browser.check_error(e)  # A dead browser fails the whole store
+                self.logger.error(f"Error occurred while processing item: {e}")
+                continue
+        return item_details
+
     def parse_opening_hours(self, hours_data):
         # Define the days of the week in the correct order
         days_of_week = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
@@ -137,7 +350,9 @@ class UberEatsSpider(scrapy.Spider):
 
         return store_opening_hours
 
-    def parse_menu(self, menu_data):
+    def parse_menu(self, menu_data, index=None):
+        # Pass an index (see new_menu_index) to have every item registered in
+        # it as the menu is built
         menu = []
         for section in menu_data.get('hasMenuSection', []):
             section_name = section.get('name')
@@ -148,25 +363,55 @@ class UberEatsSpider(scrapy.Spider):
                 offer_data = item.get('offers', {})
                 price = offer_data.get('price')  # Extracting the price directly
 
-                menu_item = {
-                    'type': item.get('@type'),
-                    'name': item.get('name'),
-                    'description': item.get('description'),
-                    'image_url': '',  # Placeholder for the image URL to be added later
-                    'price': price,  # Directly adding the price
-                    'ingredientsGroups': ''  # Placeholder for details to be added later
-                }
+                # The image URL and the option groups are added with the details
+                menu_item = MenuItem(item.get('name'), to_cents(price), item.get('description'),
+                                     type=item.get('@type'), raw_price=price)
                 menu_items.append(menu_item)
+                if index is not None:
+                    self.index_menu_item(index, menu_item, item.get('@id'))
 
-            section_data = {
-                'title': section_name,
-                'menu': menu_items
-            }
-            menu.append(section_data)
+            menu.append(Category(section_name, menu_items))
 
         return menu
 
+    def capture_item_details(self):
+        # Item details for the whole store from its API payloads, or None when
+        # the store payload wasn't captured and the items have to be clicked
+        try:
+            captured = captured_payloads(self.driver, (STORE_ENDPOINT, ITEM_ENDPOINT))
+            stores = captured[STORE_ENDPOINT]
+            if not stores:
+                self.logger.info("Store payload not captured, falling back to clicking items")
+                return None
+            store = stores[-1]
+            items = catalog_items(store)
+
+            # Item modals the page already fetched on its own
+            payloads = {item.get('uuid'): item for item in captured[ITEM_ENDPOINT]}
+            missing = [item for item in items if item['hasCustomizations'] and item['uuid'] not in payloads]
+            if missing:
+                payloads.update(fetch_item_payloads(
+                    self.driver, store.get('uuid'), missing, concurrency=self.capture_concurrency))
+        except Exception as e:
+            self.logger.error(f"Error capturing store API payloads: {e}")
+            return None
+
+        details = []
+        for item in items:
+            payload = payloads.get(item['uuid'])
+            if payload is None and item['hasCustomizations']:
+                self.logger.error(f"Item payload not captured: {item['title']}")
+                continue
+            details.append(
+                item_details_from_payload(payload or item, image_url=item['imageUrl'], item_id=item['uuid']))
+        self.logger.info(f"Captured details for {len(details)} of {len(items)} items")
+        return details
+
     def handle_popup(self):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
         try:
             WebDriverWait(self.driver, 5).until(
                 EC.visibility_of_element_located((By.CSS_SELECTOR, 'div[role="dialog"]'))
@@ -179,145 +424,97 @@ class UberEatsSpider(scrapy.Spider):
         except Exception as e:
             self.logger.info(f"Popup not found or already closed: {e}")
 
-    def extract_item_details(self):
-        details = []
-        item_name = ''
-        image_url = ''
-
+    def extract_item_details(self, item_id=None):
+        # One round trip for the whole modal instead of one per element
         try:
-            item_name_element = self.driver.find_element(By.CSS_SELECTOR, 'h1.ft.fv.fu.fs.al.cg')
-            item_name = item_name_element.text.strip() if item_name_element else ''
+            modal = self.driver.execute_script(EXTRACT_MODAL_JS, MODAL_SELECTORS)
         except Exception as e:
-            self.logger.error(f"Error extracting item name: {e}")
+            self.logger.error(f"Error extracting item details: {e}")
+            return ''
 
-        try:
-            image_element = self.driver.find_element(By.CSS_SELECTOR, 'div.cj.ae.bl.kx img')
-            image_url = image_element.get_attribute('src') if image_element else ''
-        except Exception as e:
-            self.logger.error(f"Error extracting image URL: {e}")
+        item_name = modal['item_name']
+        if item_name is None:
+            self.logger.error("Error extracting item name: element not found")
+        item_name = item_name.strip() if item_name else ''
 
-        # Extract "pick many" options
-        try:
-            detail_elements = self.driver.find_elements(By.CSS_SELECTOR, 'div[data-testid="customization-pick-many"]')
-
-            for element in detail_elements:
-                category_name = element.find_element(By.CSS_SELECTOR, 'div.fs.hy.fu.hz.g4').text
-                text = element.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g4').text
-
-                # Use regular expression to find the number in the text
-                match = re.search(r'(\d+)', text)
-
-                # Extract the number if found, otherwise default to 0
-                requires_selection_max = int(match.group(1)) if match else 0
-
-                options = element.find_elements(By.CSS_SELECTOR, 'label')
-                option_details = []
-
-                for option in options:
-                    try:
-                        name = option.find_element(By.CSS_SELECTOR, 'div.be.bf.bg.bh.g3.os').text
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option name: {e}")
-                        name = ''
-
-                    try:
-                        price_text = option.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g3.bn').text
-                        price_cleaned = re.sub(r'[^\d.]+', '', price_text).strip()
-                        left_half_price = float(
-                            price_cleaned) if price_cleaned else 0.0  # Default to 0.0 if price is not found or is empty
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option price: {e}")
-                        left_half_price = 0.0  # Default to 0.0 if price is not found
-
-                    try:
-                        price_text = option.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g3.bn').text
-                        price_cleaned = re.sub(r'[^\d.]+', '', price_text).strip()
-                        right_half_price = float(
-                            price_cleaned) if price_cleaned else 0.0  # Default to 0.0 if price is not found or is empty
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option price: {e}")
-                        right_half_price = 0.0  # Default to 0.0 if price is not found
-
-                    try:
-                        # Calculate price by summing left_half_price and right_half_price
-                        price = left_half_price + right_half_price
-                    except Exception as e:
-                        self.logger.error(f"Error calculating total price: {e}")
-                        price = 0.0  # Default to 0.0 if price calculation fails
-
-                    option_details.append(
-                        {'name': name.strip() if name else '', 'possibleToAdd': 1, 'price': price,
-                         'leftHalfPrice': left_half_price, 'rightHalfPrice': right_half_price})
-
-                details.append(
-                    {'type': "general", 'name': category_name.strip() if category_name else '', 'requiresSelectionMin': 0, 'requiresSelectionMax': requires_selection_max if requires_selection_max else '', 'ingredients': option_details})
+        image_url = modal['image_url']
+        if image_url is None:
+            self.logger.error("Error extracting image URL: element not found")
+        image_url = image_url or ''
 
-        except Exception as e:
-            self.logger.error(f"Error extracting details (pick many): {e}")
+        # Extract "pick many" options, then "pick one" options
+        details = self.build_ingredient_groups(modal['pick_many'], 'pick many')
+        details += self.build_ingredient_groups(modal['pick_one'], 'pick one')
 
-        # Extract "pick one" options
-        try:
-            pick_one_elements = self.driver.find_elements(By.CSS_SELECTOR, 'div[data-testid="customization-pick-one"]')
-
-            for element in pick_one_elements:
-                category_name = element.find_element(By.CSS_SELECTOR, 'div.fs.hy.fu.hz.g4').text
-                text = element.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g4').text
-
-                # Use regular expression to find the number in the text
-                match = re.search(r'(\d+)', text)
-
-                # Extract the number if found, otherwise default to 0
-                requires_selection_max = int(match.group(1)) if match else 0
-
-                options = element.find_elements(By.CSS_SELECTOR, 'label')
-                option_details = []
-
-                for option in options:
-                    try:
-                        name = option.find_element(By.CSS_SELECTOR, 'div.be.bf.bg.bh.g3.os').text
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option name: {e}")
-                        name = ''
-
-                    try:
-                        price_text = option.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g3.bn').text
-                        price_cleaned = re.sub(r'[^\d.]+', '', price_text).strip()
-                        left_half_price = float(
-                            price_cleaned) if price_cleaned else 0.0  # Default to 0.0 if price is not found or is empty
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option price: {e}")
-                        left_half_price = 0.0  # Default to 0.0 if price is not found
-
-                    try:
-                        price_text = option.find_element(By.CSS_SELECTOR, 'div.be.bf.g1.dj.g3.bn').text
-                        price_cleaned = re.sub(r'[^\d.]+', '', price_text).strip()
-                        right_half_price = float(
-                            price_cleaned) if price_cleaned else 0.0  # Default to 0.0 if price is not found or is empty
-                    except Exception as e:
-                        self.logger.error(f"Error extracting option price: {e}")
-                        right_half_price = 0.0  # Default to 0.0 if price is not found
-
-                    try:
-                        # Calculate price by summing left_half_price and right_half_price
-                        price = left_half_price + right_half_price
-                    except Exception as e:
-                        self.logger.error(f"Error calculating total price: {e}")
-                        price = 0.0  # Default to 0.0 if price calculation fails
-
-                    option_details.append(
-                        {'name': name.strip() if name else '', 'possibleToAdd': 1, 'price': price,
-                         'leftHalfPrice': left_half_price, 'rightHalfPrice': right_half_price})
-
-                details.append(
-                    {'type': "general", 'name': category_name.strip() if category_name else '', 'requiresSelectionMin': 0, 'requiresSelectionMax': requires_selection_max  if requires_selection_max else '', 'ingredients': option_details})
-
-        except Exception as e:
-            self.logger.error(f"Error extracting details (pick one): {e}")
-
-        return {'item_name': item_name, 'image_url': image_url,
+        return {'item_id': item_id, 'item_name': item_name, 'image_url': image_url,
                 'item_details': details} if details or item_name else ''
 
-    def append_item_details_to_menu(self, menu, item_details):
+    def build_ingredient_groups(self, blocks, block_type):
+        details = []
+        for block in blocks:
+            # A block without its header ends the extraction for its type
+            if block['category_name'] is None or block['text'] is None:
+                self.logger.error(f"Error extracting details ({block_type}): header not found")
+                break
+            category_name = block['category_name']
+
+            # Use regular expression to find the number in the text
+            match = re.search(r'(\d+)', block['text'])
+
+            # Extract the number if found, otherwise default to 0
+            requires_selection_max = int(match.group(1)) if match else 0
+
+            option_details = []
+            for option in block['options']:
+                name = option['name']
+                if name is None:
+                    self.logger.error("Error extracting option name: element not found")
+                    name = ''
+
+                # The same price is used for the left and the right half
+                left_half_price = right_half_price = self.parse_option_price(option['price'])
+                price = left_half_price + right_half_price
+
+                option_details.append(
+                    {'name': name.strip() if name else '', 'possibleToAdd': 1, 'price': price,
+                     'leftHalfPrice': left_half_price, 'rightHalfPrice': right_half_price})
+
+            details.append(
+                {'type': "general", 'name': category_name.strip() if category_name else '', 'requiresSelectionMin': 0, 'requiresSelectionMax': requires_selection_max if requires_selection_max else '', 'ingredients': option_details})
+        return details
+
+    def parse_option_price(self, price_text):
+        if price_text is None:
+            self.logger.error("Error extracting option price: element not found")
+            return 0.0  # Default to 0.0 if price is not found
+        try:
+            price_cleaned = re.sub(r'[^\d.]+', '', price_text).strip()
+            return float(price_cleaned) if price_cleaned else 0.0  # Default to 0.0 if price is empty
+        except ValueError as e:
+            self.logger.error(f"Error extracting option price: {e}")
+            return 0.0
+
+    def new_menu_index(self):
+        # Menu items by JSON-LD @id (the item uuid, item_id of the details) and by normalized name
+        return {'ids': {}, 'names': {}}
+
+    def normalize_item_name(self, name):
+        # JSON-LD names are HTML-escaped ("Mac &amp; Cheese"), modal titles are not
+        return ' '.join(unicodedata.normalize('NFKC', html.unescape(name or '')).casefold().split())
+
+    def index_menu_item(self, index, menu_item, item_id=None):
+        if item_id:
+            index['ids'].setdefault(item_id, []).append(menu_item)
+        index['names'].setdefault(self.normalize_item_name(menu_item.name), []).append(menu_item)
+
+    def build_menu_index(self, menu):
+        index = self.new_menu_index()
+        for section in menu:
+            for menu_item in section.items:
+                self.index_menu_item(index, menu_item)
+        return index
+
+    def append_item_details_to_menu(self, menu, item_details, index=None):
         if not item_details:
             return menu
 
@@ -326,18 +523,72 @@ class UberEatsSpider(scrapy.Spider):
         if not item_name:
             return menu
 
-        for section in menu:
-            for menu_item in section['menu']:
-                if menu_item['name'] == item_name:
-                    menu_item['ingredientsGroups'] = item_details['item_details']
-                    if image_url:
-                        menu_item['image_url'] = image_url  # Add the image URL before offers
-                    return menu  # Exit after matching item is found
+        if index is None:
+            index = self.build_menu_index(menu)
+        candidates = index['ids'].get(item_details.get('item_id')) or \
+            index['names'].get(self.normalize_item_name(item_name))
+        if not candidates:
+            self.logger.warning(f"No menu item matches extracted item {item_name!r}")
+            self.inc_stat('menu_merge/unmatched')
+            return menu
 
+        menu_item = candidates[0]
+        if len(candidates) > 1:
+            # The same name in several sections: fill them in the order the
+            # items are extracted, one menu item per extracted item
+            self.logger.warning(f"{len(candidates)} menu items are named {item_name!r}")
+            self.inc_stat('menu_merge/ambiguous')
+            menu_item = next((c for c in candidates if c.groups is None), menu_item)
+
+        menu_item.groups = [OptionGroup.from_dict(group) for group in item_details['item_details']]
+        if image_url:
+            menu_item.image_url = image_url  # Add the image URL before offers
+        self.inc_stat('menu_merge/matched')
         return menu
 
+    def inc_stat(self, key, count=1):
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            crawler.stats.inc_value(key, count, spider=self)
+
+    def record_browser_events(self, events, rss_max):
+        for key in events:
+            self.inc_stat(key)
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None and rss_max:
+            crawler.stats.max_value('browser/rss_max_mb', rss_max // (1024 * 1024), spider=self)
+
+    def record_timings(self, url, timings):
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            record_timings(crawler.stats, timings, self)
+            check_slow_page(self, url, timings)
+
     def closed(self, reason):
-        self.driver.quit()
-        # Save the data to a JSON file
-        with open('ubereats_data.json', 'w') as f:
-            json.dump(self.data, f, indent=4)
\ No newline at end of file
+        self.quit_driver()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Worker processes of the multi-store pool. Each one builds its own spider
+# (and with it its own browser) once and reuses it for every store it gets.
+_worker_spider = None
+
+
+def _init_worker(spider_kwargs):
+    global _worker_spider
+    _worker_spider = UberEatsSpider(**spider_kwargs)
+    # Quit the browser when the pool shuts the worker down
+    Finalize(_worker_spider, _worker_spider.quit_driver, exitpriority=10)
+
+
+def _collect_item_details(url):
+    # The phase timings and browser events travel back with the details,
+    # stats live in the main process; on an error the events travel with the
+    # exception
+    try:
+        item_details = _worker_spider.collect_item_details(url)
+    except Exception as e:
+        e.browser_events = _worker_spider.browser.drain_events()
+        raise
+    return item_details, _worker_spider.timings, _worker_spider.browser.drain_events()
\ No newline at end of file